@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+""" Benchmark parts of the webapp. """
+
+import sys
+import os
+import re
+import glob
+import json
+import shutil
+import subprocess
+import tempfile
+import threading
+import random
+import urllib.request
+import time
+
+import click
+
+# ---------------------------------------------------------------------
+
+@click.group()
+def main():
+    """Benchmark parts of the webapp."""
+
+# ---------------------------------------------------------------------
+
+@main.command()
+@click.option( "--data","-d","data_dir", required=True, type=click.Path(exists=True,file_okay=False),
+    help="Data directory containing the content sets to load."
+)
+@click.option( "--copies","-n","ncopies", default=20, help="Number of copies of each content set to load." )
+@click.option( "--iterations","-i","niterations", default=3, help="Number of times to run each test." )
+@click.option( "--targets","targets_mode", default="none", type=click.Choice(["full","captions","none"]),
+    help="How targets should be returned in the list of content docs (CONTENT_DOC_TARGETS)."
+)
+def startup( data_dir, ncopies, niterations, targets_mode ):
+    """Benchmark loading the content sets at startup.
+
+    To simulate a data directory with a lot of modules, the content sets are copied multiple times
+    into a temp directory, then we time how long it takes for the webapp to initialize, and to
+    serve the list of content docs (which the front-end needs before it can show anything),
+    with and without lazy loading.
+    """
+
+    from asl_rulebook2.webapp import app
+
+    with tempfile.TemporaryDirectory() as temp_dir, tempfile.TemporaryDirectory() as cache_dir:
+
+        # prepare the data directory
+        nfiles = _copy_content_sets( data_dir, temp_dir, ncopies )
+        print( "Prepared the data directory: #copies={} ; #files={}".format( ncopies, nfiles ) )
+        app.config.update( {
+            "DATA_DIR": temp_dir,
+            "DISABLE_STARTUP_TASKS": True,
+            "IGNORE_MISSING_DATA_FILES": True,
+            "CONTENT_DOC_TARGETS": targets_mode,
+        } )
+
+        # run the benchmarks
+        # NOTE: The first iteration of each lazy test builds the content manifest cache, which later ones will use.
+        client = app.test_client()
+        tests = [
+            ( "eager", False, None ),
+            ( "lazy", True, None ),
+            ( "lazy+manifest", True, os.path.join( cache_dir, "manifest.json" ) ),
+        ]
+        for caption, lazy_load, manifest_cache in tests:
+            app.config[ "LAZY_LOAD_CONTENT" ] = lazy_load
+            app.config[ "CONTENT_MANIFEST_CACHE" ] = manifest_cache
+            init_times, cdocs_times, total_times = [], [], []
+            for _ in range( niterations ):
+                start_time = time.perf_counter()
+                resp = client.get( "/?reload=1" )
+                init_times.append( time.perf_counter() - start_time )
+                assert resp.status_code == 200
+                start_time2 = time.perf_counter()
+                resp = client.get( "/content-docs" )
+                cdocs_times.append( time.perf_counter() - start_time2 )
+                assert resp.status_code == 200
+                total_times.append( time.perf_counter() - start_time )
+            print( "{:<13}: startup = {:.3f}s ; /content-docs = {:.3f}s ; time-to-first-page = {:.3f}s".format(
+                caption, min( init_times ), min( cdocs_times ), min( total_times )
+            ) )
+
+def _copy_content_sets( src_dir, dest_dir, ncopies ):
+    """Make multiple copies of the content sets in a data directory."""
+    nfiles = 0
+    for root, _, fnames in os.walk( src_dir ):
+        for fname in fnames:
+            if os.path.splitext( fname )[1] != ".index":
+                continue
+            # copy the content set's files (the index file, and any content docs)
+            fname_stem = os.path.splitext( fname )[0]
+            for fname2 in os.listdir( root ):
+                if not fname2.startswith( fname_stem ):
+                    continue
+                for copy_no in range( ncopies ):
+                    dname = os.path.join( dest_dir, "copy-{:03d}".format( 1+copy_no ) )
+                    os.makedirs( dname, exist_ok=True )
+                    shutil.copyfile( os.path.join( root, fname2 ), os.path.join( dname, fname2 ) )
+                    nfiles += 1
+    return nfiles
+
+# ---------------------------------------------------------------------
+
+# these are the modules that should not be loaded when the webapp starts
+_DEFERRED_MODULES = [ "pdfminer", "pikepdf", "grpc", "markdown", "asl_rulebook2.extract.all" ]
+
+@main.command()
+@click.option( "--module","-m","module_name", default="asl_rulebook2.webapp", help="Module to import." )
+@click.option( "--top","-t","ntop", default=20, help="Number of slowest imports to show." )
+def imports( module_name, ntop ):
+    """Benchmark how long it takes to import the webapp.
+
+    The module is imported in a new process with "python -X importtime", and we report the total import time,
+    the slowest imports, the peak RSS, and whether any modules that should have been deferred were loaded.
+    """
+
+    # import the module in a new process
+    code = "\n".join( [
+        "import sys, resource",
+        "import {}".format( module_name ),
+        "print( resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss )",
+        "print( ' '.join( sys.modules.keys() ) )",
+    ] )
+    proc = subprocess.run( [ sys.executable, "-X", "importtime", "-c", code ],
+        capture_output=True, text=True, check=False
+    )
+    if proc.returncode != 0:
+        raise RuntimeError( "Couldn't import the module:\n{}".format( proc.stderr ) )
+    stdout = proc.stdout.splitlines()
+    max_rss = int( stdout[-2] )
+    loaded_modules = set( stdout[-1].split() )
+
+    # parse the import times
+    # NOTE: Each line looks like this: "import time:  self [us] | cumulative | imported package"
+    import_times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith( "import time:" ):
+            continue
+        fields = line[12:].split( "|" )
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = ( len(name) - len(name.lstrip()) ) // 2
+        import_times.append( ( name.strip(), int(fields[0]), int(fields[1]), depth ) )
+    total_time = sum( t[2] for t in import_times if t[3] == 0 )
+
+    # report the results
+    print( "Import time: {:.3f}s".format( total_time / 1e6 ) )
+    print( "Peak RSS:    {:.1f} MB".format( max_rss / 1024 ) )
+    print()
+    print( "Slowest imports (self time):" )
+    import_times.sort( key=lambda t: t[1], reverse=True )
+    for name, self_time, cum_time, _ in import_times[:ntop]:
+        print( "- {:<50} {:>8.1f}ms {:>8.1f}ms".format( name, self_time/1000, cum_time/1000 ) )
+    print()
+    deferred = [ m for m in _DEFERRED_MODULES if m in loaded_modules ]
+    if deferred:
+        print( "WARNING: These modules should not have been loaded: {}".format( ", ".join( deferred ) ) )
+    else:
+        print( "None of the deferred modules were loaded." )
+
+# ---------------------------------------------------------------------
+
+@main.command( "tag-ruleids" )
+@click.option( "--data","-d","data_dir", type=click.Path(exists=True,file_okay=False),
+    help="Data directory (default: the \"full\" test fixtures)."
+)
+@click.option( "--extra-ruleids","-x","nextra", default=5000, help="Number of extra (synthetic) ruleid's to add." )
+@click.option( "--iterations","-i","niterations", default=3, help="Number of times to run each test." )
+def tag_ruleids( data_dir, nextra, niterations ):
+    """Benchmark finding ruleid's in content.
+
+    The ruleid's are taken from the targets files in the data directory (with extra synthetic ones added,
+    to simulate the full eASLRB), and the content from the Q+A, errata and ASOP files. We compare
+    the single-pass matcher with the per-ruleid regex's that were used previously, and check that
+    they give the same results.
+    """
+
+    from asl_rulebook2.webapp.ruleid_matcher import RuleidMatcher
+
+    # load the ruleid's and content
+    if not data_dir:
+        data_dir = os.path.join( os.path.dirname(__file__), "../webapp/tests/fixtures/full/" )
+    ruleids, content = [], []
+    for fname in glob.glob( os.path.join( data_dir, "**/*" ), recursive=True ):
+        extn = os.path.splitext( fname )[1]
+        if extn == ".targets":
+            with open( fname, "r", encoding="utf-8" ) as fp:
+                ruleids.extend( json.load( fp ).keys() )
+        elif extn in (".json",".html") and not fname.endswith( "index.json" ):
+            with open( fname, "r", encoding="utf-8" ) as fp:
+                content.extend( line for line in fp if any( ch.isdigit() for ch in line ) )
+    for i in range( nextra ):
+        ruleids.append( "{}{}.{}".format( chr( ord("A") + i % 26 ), 100 + i // 260, i % 10 ) )
+    print( "Loaded {} ruleid's, {} lines of content.".format( len(ruleids), len(content) ) )
+
+    # prepare the regex's
+    # NOTE: This is how tag_ruleids() used to find ruleid's.
+    regexes = {
+        ruleid: re.compile( r"\b{}(-\.\d+)?\b".format( ruleid.replace( ".", "\\." ).replace( "_", " " ) ) )
+        for ruleid in ruleids
+    }
+    def find_with_regexes( val ):
+        matches = [
+            ( mo.start(), mo.end(), ruleid )
+            for ruleid, regex in regexes.items()
+            for mo in regex.finditer( val )
+        ]
+        matches.sort( key = lambda m: ( m[0], m[0]-m[1] ) )
+        return matches
+    matcher = RuleidMatcher( ruleids )
+
+    # run the benchmarks
+    def run_test( func ):
+        timings = []
+        for _ in range( niterations ):
+            start_time = time.perf_counter()
+            results = [ func( val ) for val in content ]
+            timings.append( time.perf_counter() - start_time )
+        return min( timings ), results
+    regex_time, regex_results = run_test( find_with_regexes )
+    matcher_time, matcher_results = run_test( matcher.find_matches )
+    print( "Regex's: {:.3f}s".format( regex_time ) )
+    print( "Matcher: {:.3f}s (x{:.1f} faster)".format( matcher_time, regex_time / max( matcher_time, 1e-9 ) ) )
+    if matcher_results != regex_results:
+        raise RuntimeError( "The results are different!" )
+    print( "The results are identical ({} matches).".format( sum( len(r) for r in matcher_results ) ) )
+
+# ---------------------------------------------------------------------
+
+@main.command()
+@click.option( "--data","-d","data_dir", type=click.Path(exists=True,file_okay=False),
+    help="Data directory (default: the \"full\" test fixtures)."
+)
+@click.option( "--fixups","-n","nfixups", default=500, help="Number of (synthetic) fixups to apply." )
+@click.option( "--iterations","-i","niterations", default=3, help="Number of times to run each test." )
+def fixups( data_dir, nfixups, niterations ):
+    """Benchmark applying Q+A/errata fixups.
+
+    The content is taken from the Q+A and errata files in the data directory, and we apply a set of synthetic
+    search-and-replace fixups to it. We compare the compiled fixups with the per-fixup replacements that
+    were used previously, and check that they give the same results.
+    """
+
+    from asl_rulebook2.webapp.fixups import Fixups
+
+    # load the content
+    if not data_dir:
+        data_dir = os.path.join( os.path.dirname(__file__), "../webapp/tests/fixtures/full/" )
+    content = []
+    def add_content( val ):
+        if isinstance( val, str ):
+            content.append( val )
+        elif isinstance( val, list ):
+            for v in val:
+                add_content( v )
+        elif isinstance( val, dict ):
+            for v in val.values():
+                add_content( v )
+    for subdir in ( "q+a", "errata" ):
+        for fname in glob.glob( os.path.join( data_dir, subdir, "*.json" ) ):
+            if os.path.basename( fname ) in ( "sources.json", "fixups.json" ):
+                continue
+            with open( fname, "r", encoding="utf-8" ) as fp:
+                add_content( json.load( fp ) )
+    content = [ val for val in content if len(val) > 20 ]
+    content = ( content * ( 1 + 5000 // max( len(content), 1 ) ) )[:5000]
+
+    # generate the fixups
+    # NOTE: Some of the fixups are for words that appear in the content, so that there is something to replace.
+    words = sorted( set( w for val in content for w in re.findall( r"[A-Za-z]{6,}", val ) ) )
+    random.seed( 42 )
+    replace = {}
+    for i in range( nfixups ):
+        if words and i % 2 == 0:
+            replace[ random.choice( words ) ] = "<span class='fixup'>{}</span>".format( i )
+        else:
+            replace[ "[FIXUP-{}]".format( i ) ] = "(fixup {})".format( i )
+    fixups_data = { "replace": replace }
+    print( "Loaded {} pieces of content, generated {} fixups.".format( len(content), len(replace) ) )
+
+    # NOTE: This is how fixups used to be applied.
+    def apply_fixups( val ):
+        for search_for, replace_with in fixups_data["replace"].items():
+            val = val.replace( search_for, replace_with )
+        return re.sub( r"\[EXC: .*?\]", r"<span class='exc'>\g<0></span>", val )
+
+    # run the benchmarks
+    start_time = time.perf_counter()
+    compiled = Fixups( fixups_data )
+    compile_time = time.perf_counter() - start_time
+    def run_test( func ):
+        timings = []
+        for _ in range( niterations ):
+            start_time = time.perf_counter()
+            results = [ func( val ) for val in content ]
+            timings.append( time.perf_counter() - start_time )
+        return min( timings ), results
+    old_time, old_results = run_test( apply_fixups )
+    new_time, new_results = run_test( compiled )
+    print( "Per-fixup: {:.3f}s".format( old_time ) )
+    print( "Compiled:  {:.3f}s (x{:.1f} faster, +{:.3f}s to compile, {} passes)".format(
+        new_time, old_time / max( new_time, 1e-9 ), compile_time, compiled.nstages
+    ) )
+    if new_results != old_results:
+        raise RuntimeError( "The results are different!" )
+    print( "The results are identical." )
+
+# ---------------------------------------------------------------------
+
+@main.command( "pdf-ranges" )
+@click.option( "--size","-s","file_size", default=50, help="Size of the test PDF (MB)." )
+@click.option( "--threads","-t","nthreads", default=8, help="Number of concurrent clients." )
+@click.option( "--requests","-n","nrequests", default=200, help="Number of requests per client." )
+@click.option( "--range-size","-r","range_size", default=64, help="Size of each range request (KB)." )
+@click.option( "--buffer-size","-b","buffer_sizes", multiple=True, type=int, default=[8,256],
+    help="Buffer size(s) to test (KB)."
+)
+def pdf_ranges( file_size, nthreads, nrequests, range_size, buffer_sizes ):
+    """Benchmark serving range requests for a PDF.
+
+    PDF.js fetches content docs using range requests, so we send many of these concurrently
+    (for random parts of the file), and report the throughput and latency.
+    """
+
+    from werkzeug.serving import make_server
+    from asl_rulebook2.webapp import app
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        # prepare the data directory
+        with open( os.path.join( temp_dir, "benchmark.index" ), "w", encoding="utf-8" ) as fp:
+            fp.write( "[]" )
+        with open( os.path.join( temp_dir, "benchmark.pdf" ), "wb" ) as fp:
+            for _ in range( file_size ):
+                fp.write( os.urandom( 1024*1024 ) )
+        app.config.update( {
+            "DATA_DIR": temp_dir,
+            "DISABLE_STARTUP_TASKS": True,
+            "IGNORE_MISSING_DATA_FILES": True,
+        } )
+
+        # start the server
+        server = make_server( "localhost", 0, app, threaded=True )
+        threading.Thread( target=server.serve_forever, daemon=True ).start()
+        base_url = "http://localhost:{}".format( server.server_port )
+        urllib.request.urlopen( base_url + "/" ).read()
+
+        def run_client( url, timings ):
+            for _ in range( nrequests ):
+                start = random.randint( 0, file_size*1024*1024 - range_size*1024 )
+                req = urllib.request.Request( url, headers = {
+                    "Range": "bytes={}-{}".format( start, start + range_size*1024 - 1 )
+                } )
+                start_time = time.perf_counter()
+                with urllib.request.urlopen( req ) as resp:
+                    assert resp.status == 206
+                    assert len( resp.read() ) == range_size*1024
+                timings.append( time.perf_counter() - start_time )
+
+        # run the benchmarks
+        url = base_url + "/content/benchmark!"
+        try:
+            for buffer_size in buffer_sizes:
+                app.config[ "PDF_BUFFER_SIZE" ] = buffer_size * 1024
+                timings = []
+                threads = [
+                    threading.Thread( target=run_client, args=(url,timings) )
+                    for _ in range( nthreads )
+                ]
+                start_time = time.perf_counter()
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - start_time
+                timings.sort()
+                print( "buffer={}KB: {:.0f} req/s ; {:.1f} MB/s ; latency p50={:.1f}ms p95={:.1f}ms".format(
+                    buffer_size,
+                    len(timings) / elapsed,
+                    len(timings) * range_size / 1024 / elapsed,
+                    timings[ len(timings)//2 ] * 1000,
+                    timings[ int( len(timings) * 0.95 ) ] * 1000
+                ) )
+        finally:
+            server.shutdown()
+
+# ---------------------------------------------------------------------
+
+@main.command( "content-store" )
+@click.option( "--targets","-n","ntargets", default=50000, help="Number of (synthetic) targets to load." )
+@click.option( "--lookups","-l","nlookups", default=10000, help="Number of targets to look up." )
+def content_store( ntargets, nlookups ):
+    """Benchmark loading targets from JSON, and from the packed data cache.
+
+    A large targets file is generated, then loaded in a new process (so that the memory usage can be
+    measured cleanly), and we report how long it took, how much memory it used, and how long it takes
+    to look up targets.
+    """
+
+    from asl_rulebook2.webapp.packed_data import load_packed_data_file
+    import logging
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        # generate the targets file
+        targets = {}
+        for i in range( ntargets ):
+            ruleid = "{}{}.{}".format( chr( ord("A") + i % 26 ), i // 26, i % 100 )
+            targets[ ruleid ] = {
+                "caption": "Caption for rule {}".format( ruleid ),
+                "page_no": 1 + i // 20,
+                "pos": [ 50 + i % 500, 700 - i % 600 ]
+            }
+        fname = os.path.join( temp_dir, "benchmark.targets" )
+        with open( fname, "w", encoding="utf-8" ) as fp:
+            json.dump( targets, fp )
+        print( "Generated {} targets ({:.1f} MB).".format( ntargets, os.path.getsize(fname) / 1024 / 1024 ) )
+
+        # prepare the packed data cache
+        cache_dir = os.path.join( temp_dir, "cache" )
+        start_time = time.perf_counter()
+        load_packed_data_file( fname, cache_dir, logging.getLogger() )
+        print( "Created the packed data file in {:.3f}s ({:.1f} MB).".format(
+            time.perf_counter() - start_time,
+            sum( os.path.getsize( f ) for f in glob.glob( os.path.join( cache_dir, "*" ) ) ) / 1024 / 1024
+        ) )
+
+        # run the benchmarks
+        code = "\n".join( [
+            "import sys, os, json, time, random, logging",
+            "from asl_rulebook2.webapp.packed_data import load_packed_data_file",
+            "def get_rss():",
+            "    with open( '/proc/self/statm', 'r', encoding='utf-8' ) as fp:",
+            "        return int( fp.read().split()[1] ) * os.sysconf( 'SC_PAGE_SIZE' )",
+            "fname, cache_dir, nlookups = sys.argv[1], sys.argv[2], int( sys.argv[3] )",
+            "rss, start_time = get_rss(), time.perf_counter()",
+            "if cache_dir == '-':",
+            "    with open( fname, 'r', encoding='utf-8' ) as fp:",
+            "        targets = json.load( fp )",
+            "else:",
+            "    targets = load_packed_data_file( fname, cache_dir, logging.getLogger() )",
+            "load_time = time.perf_counter() - start_time",
+            "ruleids = random.sample( list( targets ), min( nlookups, len(targets) ) )",
+            "start_time = time.perf_counter()",
+            "for ruleid in ruleids:",
+            "    assert targets[ ruleid ][ 'caption' ]",
+            "lookup_time = time.perf_counter() - start_time",
+            "print( load_time, lookup_time, get_rss() - rss )",
+        ] )
+        for caption, cache_dir2 in [ ( "JSON", "-" ), ( "packed", cache_dir ) ]:
+            proc = subprocess.run( [ sys.executable, "-c", code, fname, cache_dir2, str(nlookups) ],
+                capture_output=True, text=True, check=False
+            )
+            if proc.returncode != 0:
+                raise RuntimeError( "Couldn't run the benchmark:\n{}".format( proc.stderr ) )
+            load_time, lookup_time, rss = proc.stdout.split()
+            print( "{:<6}: load = {:.3f}s ; RSS = +{:.1f} MB ; {} lookups = {:.3f}s".format(
+                caption, float(load_time), int(rss) / 1024 / 1024, nlookups, float(lookup_time)
+            ) )
+
+# ---------------------------------------------------------------------
+
+@main.command()
+@click.option( "--data","-d","data_dir", type=click.Path(exists=True,file_okay=False),
+    help="Data directory (default: the \"full\" test fixtures)."
+)
+@click.option( "--copies","-n","ncopies", default=10, help="Number of copies of the data to load." )
+def records( data_dir, ncopies ):
+    """Benchmark the memory used by the rule data.
+
+    The index entries, Q+A, errata, annotations, targets and footnotes are loaded multiple times
+    (to simulate a larger data set), first as plain dicts, then as records (see records.py),
+    and we report how much memory each approach uses.
+    """
+
+    import tracemalloc
+    from asl_rulebook2.webapp.records import IndexEntry, QAEntry, Annotation, Target, Footnote, \
+        make_records, make_record_index
+
+    # locate the data files
+    if not data_dir:
+        data_dir = os.path.join( os.path.dirname(__file__), "../webapp/tests/fixtures/full/" )
+    def find_files( fspec ):
+        fnames = glob.glob( os.path.join( data_dir, fspec ), recursive=True )
+        return [ f for f in fnames if os.path.basename(f) not in ("sources.json","fixups.json") ]
+    data_files = [
+        ( find_files( "**/*.index" ), lambda data: make_records( IndexEntry, data ) ),
+        ( find_files( "q+a/*.json" ), lambda data: {
+            key: make_records( QAEntry, entries ) for key, entries in data.items()
+        } ),
+        ( find_files( "errata/*.json" ) + find_files( "annotations.json" ),
+            lambda data: make_records( Annotation, data )
+        ),
+        ( find_files( "**/*.targets" ), lambda data: make_record_index( Target, data ) ),
+        ( find_files( "**/*.footnotes" ), lambda data: {
+            chapter_id: make_record_index( Footnote, footnotes ) for chapter_id, footnotes in data.items()
+        } ),
+    ]
+
+    def load_data( make_records_func ):
+        data = []
+        for _ in range( ncopies ):
+            for fnames, func in data_files:
+                for fname in fnames:
+                    with open( fname, "r", encoding="utf-8" ) as fp:
+                        vals = json.load( fp )
+                    data.append( func( vals ) if make_records_func else vals )
+        return data
+
+    # run the benchmarks
+    results = {}
+    for caption, make_records_func in [ ( "dicts", False ), ( "records", True ) ]:
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        data = load_data( make_records_func )
+        elapsed = time.perf_counter() - start_time
+        results[ caption ] = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del data
+        print( "{:<7}: {:.2f} MB ({:.3f}s)".format( caption, results[caption] / 1024 / 1024, elapsed ) )
+    print( "Saving: {:.1f}%".format( 100 * ( 1 - results["records"] / results["dicts"] ) ) )
+
+# ---------------------------------------------------------------------
+
+@main.command()
+@click.option( "--data","-d","data_dir", type=click.Path(exists=True,file_okay=False),
+    help="Data directory (default: the \"full\" test fixtures)."
+)
+@click.option( "--trace/--no-trace", default=True, help="Trace memory allocations during startup." )
+@click.option( "--top","-t","ntop", default=5, help="Number of top allocators to show for each startup phase." )
+def memory( data_dir, trace, ntop ):
+    """Report how much memory each part of the webapp is using.
+
+    The webapp is started up (including running the startup tasks), then we report the size
+    of each subsystem's data, and the lines of code that allocated the most memory during
+    each phase of the startup process.
+    """
+
+    from asl_rulebook2.webapp import app
+
+    # start the webapp
+    if not data_dir:
+        data_dir = os.path.join( os.path.dirname(__file__), "../webapp/tests/fixtures/full/" )
+    app.config.update( {
+        "DATA_DIR": os.path.abspath( data_dir ),
+        "BLOCKING_STARTUP_TASKS": True,
+        "ENABLE_MEMORY_REPORT": True,
+        "TRACE_MEMORY": trace,
+        "TRACE_MEMORY_TOP": ntop,
+    } )
+    client = app.test_client()
+    resp = client.get( "/" )
+    assert resp.status_code == 200
+    report = client.get( "/debug/memory" ).json
+
+    # report the results
+    def fmt_size( nbytes ):
+        return "{:.2f} MB".format( nbytes / 1024 / 1024 )
+    if report.get( "rss" ):
+        print( "RSS: {}".format( fmt_size( report["rss"] ) ) )
+        print()
+    print( "Subsystems:" )
+    for name, info in sorted( report["subsystems"].items(), key=lambda s: s[1]["size"], reverse=True ):
+        print( "- {:<22} {:>10} {:>10} objects{}".format(
+            name, fmt_size( info["size"] ), info["objects"],
+            " (+{} mapped)".format( fmt_size( info["mapped"] ) ) if info.get( "mapped" ) else ""
+        ) )
+    for phase in report.get( "phases", [] ):
+        print()
+        print( "After {} ({} traced):".format( phase["phase"], fmt_size( phase["traced"] ) ) )
+        for alloc in phase["top"]:
+            print( "- {:>+10.1f} KB {:>+8}  {}".format( alloc["size"]/1024, alloc["count"], alloc["location"] ) )
+
+# ---------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main() #pylint: disable=no-value-for-parameter
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+""" Split a prepared PDF into per-chapter PDF's. """
+
+import os
+import json
+
+from pikepdf import Pdf
+import click
+
+from asl_rulebook2.utils import log_msg_stderr
+
+# ---------------------------------------------------------------------
+
+def split_pdf_chapters( pdf_fname, chapters, targets, output_dir, fname_stem, log_msg, relinq=None ):
+    """Split a prepared PDF into per-chapter PDF's.
+
+    The chapter PDF's are saved as "<fname_stem>.chapter-<chapter_id>.pdf" in the output directory,
+    and a manifest is returned, that describes each chapter PDF, and the targets within it
+    (with their page numbers remapped to the chapter PDF).
+    """
+
+    # NOTE: The main eASLRB PDF is quite large, and while PDF.js can render pages before it has received
+    # the entire document, it still needs to fetch quite a lot of it before it can show anything. Serving
+    # a single chapter (linearized, so that the first page can be shown as soon as it arrives) gives
+    # the front-end something much smaller to start with.
+    # NOTE: Links within a chapter PDF that point to other chapters will no longer work, but the front-end
+    # navigates using the targets, not the links within the PDF.
+
+    # figure out the page range for each chapter
+    chapters = sorted(
+        ( c for c in chapters if c.get( "chapter_id" ) and c.get( "page_no" ) ),
+        key = lambda c: c["page_no"]
+    )
+    manifest = {}
+    with Pdf.open( pdf_fname ) as pdf:
+        npages = len( pdf.pages )
+        log_msg( "progress", "Splitting the PDF into chapters ({} pages)...".format( npages ) )
+        for chapter_no, chapter in enumerate( chapters ):
+            first_page = chapter["page_no"]
+            if chapter_no+1 < len(chapters):
+                last_page = max( chapters[chapter_no+1]["page_no"] - 1, first_page )
+            else:
+                last_page = npages
+            if first_page > npages:
+                log_msg( "warning", "Chapter {} starts after the end of the PDF.".format( chapter["chapter_id"] ) )
+                continue
+
+            # save the chapter PDF
+            chapter_id = chapter["chapter_id"]
+            fname = "{}.chapter-{}.pdf".format( fname_stem, chapter_id )
+            log_msg( "progress", "- Chapter {}: pages {}-{}".format( chapter_id, first_page, last_page ) )
+            with Pdf.new() as chapter_pdf:
+                chapter_pdf.pages.extend( pdf.pages[ first_page-1 : last_page ] )
+                chapter_pdf.save( os.path.join( output_dir, fname ), linearize=True )
+            if relinq:
+                relinq( "Saved chapter PDF: {}".format( chapter_id ) )
+
+            # remap the targets in the chapter
+            chapter_targets = {}
+            for ruleid, target in targets.items():
+                page_no = target.get( "page_no" )
+                if page_no is None or not first_page <= page_no <= last_page:
+                    continue
+                chapter_targets[ ruleid ] = dict( target )
+                chapter_targets[ ruleid ][ "page_no" ] = page_no - first_page + 1
+
+            manifest[ chapter_id ] = {
+                "fname": fname,
+                "first_page": first_page,
+                "last_page": last_page,
+                "targets": chapter_targets,
+            }
+
+    return manifest
+
+# ---------------------------------------------------------------------
+
+@click.command()
+@click.argument( "pdf_file", nargs=1, type=click.Path(exists=True,dir_okay=False) )
+@click.option( "--chapters","-c","chapters_fname", required=True, type=click.Path(exists=True,dir_okay=False),
+    help="Chapters file."
+)
+@click.option( "--targets","-t","targets_fname", required=True, type=click.Path(exists=True,dir_okay=False),
+    help="Targets file."
+)
+@click.option( "--output","-o","output_dir", required=True, type=click.Path(file_okay=False),
+    help="Output directory."
+)
+@click.option( "--name","fname_stem", default="ASL Rulebook", help="Base name for the output files." )
+@click.option( "--progress","-p", is_flag=True, default=False, help="Log progress." )
+def main( pdf_file, chapters_fname, targets_fname, output_dir, fname_stem, progress ):
+    """Split a prepared PDF into per-chapter PDF's."""
+
+    # initialize
+    def log_msg( msg_type, msg ):
+        if msg_type in ("progress", "start", "timestamp", None) and not progress:
+            return
+        log_msg_stderr( msg_type, msg )
+
+    # load the chapters and targets
+    with open( chapters_fname, "r", encoding="utf-8" ) as fp:
+        chapters = json.load( fp )
+    with open( targets_fname, "r", encoding="utf-8" ) as fp:
+        targets = json.load( fp )
+
+    # split the PDF
+    if not os.path.isdir( output_dir ):
+        os.makedirs( output_dir )
+    manifest = split_pdf_chapters( pdf_file, chapters, targets, output_dir, fname_stem, log_msg )
+    fname = os.path.join( output_dir, fname_stem+".chapter-pdfs" )
+    with open( fname, "w", encoding="utf-8" ) as fp:
+        json.dump( manifest, fp, indent=2 )
+
+if __name__ == "__main__":
+    main() #pylint: disable=no-value-for-parameter
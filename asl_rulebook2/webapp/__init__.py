@@ -11,6 +11,8 @@ from flask import Flask
 import flask.cli
 import yaml
 
+from asl_rulebook2.webapp.records import RecordJSONEncoder
+
 from asl_rulebook2.webapp.config.constants import BASE_DIR, CONFIG_DIR
 
 shutdown_event = threading.Event()
@@ -52,6 +54,7 @@ def _on_sigint( signum, stack ): #pylint: disable=unused-argument
 
 # initialize Flask
 app = Flask( __name__ )
+app.json_encoder = RecordJSONEncoder
 
 # load the application configuration
 _load_config( "app.cfg", "System" )
@@ -64,6 +67,11 @@ for _key, _val in app.config.items():
 # load any config from environment variables (e.g. set in the Docker container)
 _set_config_from_env( "DATA_DIR" )
 _set_config_from_env( "CACHED_SEARCHDB" )
+_set_config_from_env( "TAG_RULEIDS_CACHE" )
+_set_config_from_env( "PACKED_DATA_CACHE" )
+_set_config_from_env( "CONTENT_MANIFEST_CACHE" )
+_set_config_from_env( "THUMBNAILS_CACHE" )
+_set_config_from_env( "DATA_BUNDLE" )
 
 # initialize logging
 _fname = os.path.join( CONFIG_DIR, "logging.yaml" )
@@ -85,8 +93,11 @@ import asl_rulebook2.webapp.search #pylint: disable=wrong-import-position,cyclic
 import asl_rulebook2.webapp.rule_info #pylint: disable=wrong-import-position,cyclic-import
 import asl_rulebook2.webapp.prepare #pylint: disable=wrong-import-position,cyclic-import
 import asl_rulebook2.webapp.doc #pylint: disable=wrong-import-position,cyclic-import
+import asl_rulebook2.webapp.memory #pylint: disable=wrong-import-position,cyclic-import
 from asl_rulebook2.webapp import globvars #pylint: disable=wrong-import-position,cyclic-import
 app.before_request( globvars.on_request )
+from asl_rulebook2.webapp import bundle #pylint: disable=wrong-import-position,cyclic-import
+app.before_request( bundle.on_request )
 
 # install our signal handler
 signal.signal( signal.SIGINT, _on_sigint )
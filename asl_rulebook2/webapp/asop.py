@@ -1,8 +1,12 @@
 """ Manage the ASOP. """
 
 import os
+import json
+import gzip
+import hashlib
+import threading
 
-from flask import jsonify, render_template_string, send_from_directory, safe_join, url_for, abort
+from flask import request, Response, jsonify, render_template, send_from_directory, safe_join, url_for, abort
 
 from asl_rulebook2.webapp import app
 from asl_rulebook2.webapp.content import tag_ruleids
@@ -12,67 +16,95 @@ _asop = None
 _asop_dir = None
 _asop_preambles = None
 _asop_section_content = None
-_footer = None
+_asop_file_stats = None
 user_css_url = None
 
+_template_cache = {}
+_rendered_cache = {}
+_chapter_cache = {}
+_cache_lock = threading.Lock()
+
 # ---------------------------------------------------------------------
 
 def init_asop( startup_msgs, logger ):
     """Initialize the ASOP."""
 
-    # initiailize
-    global _asop, _asop_dir, _asop_preambles, _asop_section_content, _footer, user_css_url
-    _asop, _asop_preambles, _asop_section_content, _footer = {}, {}, {}, ""
+    # NOTE: We build everything in local variables, then install them at the end, so that if we are
+    # being reloaded, requests being handled in the meantime will see either the old or new ASOP.
+    # NOTE: The rendered output also depends on the template args in the ASOP index, which are part of
+    # the cache key, so we won't use anything that was rendered using the previous ASOP, but we clean it up.
+    with _cache_lock:
+        _rendered_cache.clear()
+        _chapter_cache.clear()
 
     # get the data directory
     data_dir = app.config.get( "DATA_DIR" )
     if not data_dir:
+        _install_asop()
         return None, None, None, None
     dname = os.path.join( data_dir, "asop/" )
     if not os.path.isdir( dname ):
+        _install_asop()
         return None, None, None, None
     # NOTE: We need to resolve symlinks, since we use send_from_directory() to serve files, and it doesn't allow
     # symlinks that point outside of the base directory (e.g. asop/ in the "full" fixtures data set).
-    _asop_dir = os.path.realpath( dname )
-    fname = os.path.join( _asop_dir, "asop.css" )
+    asop_dir = os.path.realpath( dname )
+    css_url = None
+    fname = os.path.join( asop_dir, "asop.css" )
     if os.path.isfile( fname ):
-        user_css_url = url_for( "get_asop_file", path="asop.css" )
+        css_url = url_for( "get_asop_file", path="asop.css" )
 
     # initialize
     asop_fnames = []
+    asop_preambles, asop_section_content = {}, {}
+    asop_file_stats = {}
 
     # load the ASOP index
-    fname = os.path.join( _asop_dir, "index.json" )
-    _asop = load_data_file( fname, "ASOP index", "json", logger, startup_msgs.error )
-    if not _asop:
+    fname = os.path.join( asop_dir, "index.json" )
+    asop = load_data_file( fname, "ASOP index", "json", logger, startup_msgs.error )
+    if not asop:
+        _install_asop( asop_dir=asop_dir, css_url=css_url )
         return None, None, None, None
     asop_fnames.append( fname )
+    template_args = asop.get( "template_args", {} )
 
     # load the ASOP content
-    for chapter in _asop.get( "chapters", [] ):
+    for chapter in asop.get( "chapters", [] ):
         chapter_id = chapter[ "chapter_id" ]
         # load the chapter preamble
-        fname, preamble = _render_template( chapter_id + "-0.html" )
+        fname, preamble = _render_template( chapter_id + "-0.html", asop_dir, template_args, asop_file_stats )
         if preamble:
-            _asop_preambles[chapter_id] = preamble
+            asop_preambles[chapter_id] = preamble
             asop_fnames.append( fname )
         # load the content for each section
         for section_no, section in enumerate( chapter.get( "sections", [] ) ):
             section_id = "{}-{}".format( chapter_id, 1+section_no )
             section[ "section_id" ] = section_id
-            fname, content = _render_template( section_id + ".html" )
+            fname, content = _render_template( section_id + ".html", asop_dir, template_args, asop_file_stats )
             if content:
-                _asop_section_content[ section_id ] = content
+                asop_section_content[ section_id ] = content
                 asop_fnames.append( fname )
 
     # load the ASOP footer
-    fname, footer = _render_template( "footer.html" )
-    _footer = tag_ruleids( footer, None )
-    if _footer:
+    fname, footer = _get_rendered_file( "footer.html", asop_dir, template_args )
+    if footer:
         asop_fnames.append( fname )
 
+    # install the new ASOP
+    _install_asop( asop, asop_dir, asop_preambles, asop_section_content, asop_file_stats, css_url )
+
     return _asop, _asop_preambles, _asop_section_content, asop_fnames
 
+def _install_asop( asop=None, asop_dir=None, preambles=None, section_content=None, file_stats=None, css_url=None ):
+    """Install a newly-loaded ASOP."""
+    global _asop, _asop_dir, _asop_preambles, _asop_section_content, _asop_file_stats, user_css_url
+    _asop = asop if asop is not None else {}
+    _asop_dir = asop_dir
+    _asop_preambles = preambles if preambles is not None else {}
+    _asop_section_content = section_content if section_content is not None else {}
+    _asop_file_stats = file_stats if file_stats is not None else {}
+    user_css_url = css_url
+
 # ---------------------------------------------------------------------
 
 @app.route( "/asop" )
@@ -83,34 +115,112 @@ def get_asop():
 @app.route( "/asop/intro" )
 def get_asop_intro():
     """Return the ASOP intro."""
-    _, resp = _render_template( "intro.html" )
-    if not resp:
+    # NOTE: The intro doesn't have its ruleid's tagged.
+    _, content = _get_rendered_file( "intro.html", _asop_dir, _asop.get( "template_args", {} ), tag=False )
+    if not content:
         return "No ASOP intro."
-    return resp
+    return _make_asop_response( content )
 
 @app.route( "/asop/footer" )
 def get_asop_footer():
     """Return the ASOP footer."""
-    if not _footer:
+    _, content = _get_rendered_file( "footer.html", _asop_dir, _asop.get( "template_args", {} ) )
+    if not content:
         abort( 404 )
-    return _footer
+    return _make_asop_response( content )
 
 @app.route( "/asop/preamble/<chapter_id>" )
 def get_asop_preamble( chapter_id ):
     """Return the specified ASOP chapter preamble."""
-    content = _asop_preambles.get( chapter_id )
+    content = _get_asop_content( _asop_preambles, chapter_id, chapter_id + "-0.html" )
     if not content:
         abort( 404 )
-    return content
+    return _make_asop_response( content )
 
 @app.route( "/asop/section/<section_id>" )
 def get_asop_section( section_id ):
     """Return the specified ASOP section."""
-    content = _asop_section_content.get( section_id )
+    content = _get_asop_content( _asop_section_content, section_id, section_id + ".html" )
     if not content:
         abort( 404 )
+    return _make_asop_response( content )
+
+@app.route( "/asop/chapter/<chapter_id>" )
+def get_asop_chapter( chapter_id ):
+    """Return the specified ASOP chapter (preamble and all sections)."""
+
+    # find the chapter
+    chapter = next( ( c for c in _asop.get( "chapters", [] ) if c["chapter_id"] == chapter_id ), None )
+    if not chapter:
+        abort( 404 )
+
+    # get the chapter content
+    preamble = _get_asop_content( _asop_preambles, chapter_id, chapter_id + "-0.html" )
+    sections = {}
+    for section in chapter.get( "sections", [] ):
+        section_id = section[ "section_id" ]
+        content = _get_asop_content( _asop_section_content, section_id, section_id + ".html" )
+        if content:
+            sections[ section_id ] = content
+
+    # check if we've already generated the response
+    # NOTE: The content gets replaced when the startup tasks tag the ruleid's in it (or a file is changed),
+    # so we check that the cached response was generated from the same content objects. The cache entry
+    # holds references to them, so their id's can't be re-used while it's still in the cache.
+    contents = ( preamble, ) + tuple( sections.values() )
+    cached = _chapter_cache.get( chapter_id )
+    if not cached or len( cached[0] ) != len( contents ) \
+       or any( c1 is not c2 for c1, c2 in zip( cached[0], contents ) ):
+        # nope - generate it now
+        payload = json.dumps( {
+            "chapter_id": chapter_id,
+            "preamble": preamble,
+            "sections": sections,
+        } ).encode( "utf-8" )
+        # NOTE: We also compress the response once here, rather than on each request.
+        cached = ( contents, payload, gzip.compress( payload ), hashlib.md5( payload ).hexdigest() )
+        with _cache_lock:
+            _chapter_cache[ chapter_id ] = cached
+
+    # return the response
+    resp = Response( mimetype="application/json" )
+    resp.vary.add( "Accept-Encoding" )
+    if request.accept_encodings[ "gzip" ]:
+        resp.set_data( cached[2] )
+        resp.content_encoding = "gzip"
+        resp.set_etag( cached[3] + "-gz" )
+    else:
+        resp.set_data( cached[1] )
+        resp.set_etag( cached[3] )
+    resp.cache_control.no_cache = True
+    return resp.make_conditional( request )
+
+def _get_asop_content( index, key, fname ):
+    """Get an ASOP chapter preamble or section."""
+    # NOTE: These are rendered at startup, and have their ruleid's tagged by the startup tasks
+    # (since they are also part of the search index), but if the file has been changed since then,
+    # we render it again, so that the user sees the change (the search index will be updated
+    # the next time the ASOP is reloaded). The new version is kept in the rendered cache, rather than
+    # the index, since the startup tasks may still be updating that.
+    content = index.get( key )
+    if not content or not _asop_dir:
+        return content
+    fname2 = safe_join( _asop_dir, fname )
+    if fname2 and _get_file_stat( fname2 ) != _asop_file_stats.get( fname2 ):
+        _, content2 = _get_rendered_file( fname, _asop_dir, _asop.get( "template_args", {} ) )
+        if content2:
+            content = content2
     return content
 
+def _make_asop_response( content ):
+    """Return a piece of ASOP content."""
+    # NOTE: The content can change (e.g. when the startup tasks tag the ruleid's in it), so the browser
+    # needs to check with us each time, but if its copy is still valid, we just send back a 304.
+    resp = Response( content, mimetype="text/html" )
+    resp.set_etag( hashlib.md5( content.encode( "utf-8" ) ).hexdigest() )
+    resp.cache_control.no_cache = True
+    return resp.make_conditional( request )
+
 @app.route( "/asop/<path:path>" )
 def get_asop_file( path ):
     """Return a user-defined ASOP file."""
@@ -118,16 +228,57 @@ def get_asop_file( path ):
 
 # ---------------------------------------------------------------------
 
-def _render_template( fname ):
-    """Render an ASOP template."""
-    if not _asop_dir:
+def _get_rendered_file( fname, asop_dir, template_args, tag=True ):
+    """Render an ASOP template (that isn't part of the search index), and tag the ruleid's in it (if requested)."""
+    # NOTE: We cache the output, and only render the template again if the file changes.
+    if not asop_dir:
         return None, None
-    fname = safe_join( _asop_dir, fname )
-    if not os.path.isfile( fname ):
+    fname2 = safe_join( asop_dir, fname )
+    if not fname2:
+        return None, None
+    key = ( fname2, json.dumps( template_args, sort_keys=True ), tag )
+    stat = _get_file_stat( fname2 )
+    cached = _rendered_cache.get( key )
+    if cached and cached[0] == stat:
+        return fname2, cached[1]
+    fname2, content = _render_template( fname, asop_dir, template_args )
+    if content and tag:
+        content = tag_ruleids( content, None )
+    with _cache_lock:
+        _rendered_cache[ key ] = ( stat, content )
+    return fname2, content
+
+def _render_template( fname, asop_dir, template_args, file_stats=None ):
+    """Render an ASOP template (and record the file's stat info, if requested)."""
+    if not asop_dir:
+        return None, None
+    fname = safe_join( asop_dir, fname )
+    if not fname:
+        return None, None
+    stat = _get_file_stat( fname )
+    if not stat:
         return None, None
     args = {
         "ASOP_BASE_URL": url_for( "get_asop_file", path="" ),
     }
-    args.update( _asop.get( "template_args", {} ) )
-    with open( fname, "r" ) as fp:
-        return fname, render_template_string( fp.read(), **args )
+    args.update( template_args )
+    # NOTE: We cache the compiled templates, and only re-compile them if the file changes.
+    cached = _template_cache.get( fname )
+    if cached and cached[0] == stat:
+        template = cached[1]
+    else:
+        with open( fname, "r" ) as fp:
+            template = app.jinja_env.from_string( fp.read() )
+        with _cache_lock:
+            _template_cache[ fname ] = ( stat, template )
+    if file_stats is not None:
+        file_stats[ fname ] = stat
+    return fname, render_template( template, **args )
+
+def _get_file_stat( fname ):
+    """Get a file's stat info (so that we can tell if it has changed)."""
+    try:
+        st = os.stat( fname )
+    except OSError:
+        return None
+    return ( st.st_mtime_ns, st.st_size )
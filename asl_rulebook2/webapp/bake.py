@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+""" Build a ready-to-serve data bundle. """
+
+import os
+import shutil
+import tempfile
+import json
+import datetime
+
+import click
+
+from asl_rulebook2.webapp import app
+from asl_rulebook2.webapp.bundle import BUNDLE_VERSION, BUNDLE_MANIFEST_FNAME, BUNDLE_SEARCHDB_FNAME, \
+    make_data_file_hashes
+from asl_rulebook2.webapp.config.constants import APP_VERSION
+
+# these are the API calls whose responses will be stored in the bundle
+_PAYLOAD_URLS = [ "/content-docs", "/footnotes", "/vo-note-targets", "/content/css",
+    "/asop", "/asop/intro", "/asop/footer"
+]
+
+# ---------------------------------------------------------------------
+
+@click.command()
+@click.option( "--data","-d","data_dir", required=True, type=click.Path(exists=True,file_okay=False),
+    help="Data directory."
+)
+@click.option( "--output","-o","output_dir", required=True, type=click.Path(file_okay=False),
+    help="Directory to create the bundle in."
+)
+@click.option( "--force","-f", is_flag=True, default=False, help="Overwrite an existing bundle." )
+def main( data_dir, output_dir, force ):
+    """Build a ready-to-serve data bundle.
+
+    This runs the full startup process (loading the data files, building the search database, and running
+    all the startup tasks) offline, and saves the results, so that a server configured with DATA_BUNDLE
+    can start up without having to do any of this work.
+    """
+
+    # initialize
+    data_dir = os.path.abspath( data_dir )
+    output_dir = os.path.abspath( output_dir )
+    if os.path.exists( output_dir ):
+        if not force:
+            raise click.UsageError( "The output directory already exists: {}".format( output_dir ) )
+    if os.path.commonpath( [ data_dir, output_dir ] ) == data_dir:
+        raise click.UsageError( "The bundle can't be created inside the data directory." )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        # configure the webapp
+        # NOTE: We run the startup tasks synchronously, and have the search database saved (as if it were
+        # a cached search database) when they have finished.
+        bundle_dir = os.path.join( temp_dir, "bundle" )
+        os.makedirs( os.path.join( bundle_dir, "payloads" ) )
+        app.config.update( {
+            "DATA_DIR": data_dir,
+            "DATA_BUNDLE": None,
+            "CACHED_SEARCHDB": os.path.join( bundle_dir, BUNDLE_SEARCHDB_FNAME ),
+            "SEARCHDB": os.path.join( temp_dir, "searchdb.db" ),
+            "TAG_RULEIDS_CACHE": None,
+            "BLOCKING_STARTUP_TASKS": True,
+            "LAZY_LOAD_CONTENT": False,
+            "WATCH_DATA_DIR": 0,
+        } )
+
+        # run the startup process
+        print( "Loading the data files: {}".format( data_dir ) )
+        client = app.test_client()
+        resp = client.get( "/" )
+        if resp.status_code != 200:
+            raise RuntimeError( "Couldn't initialize the webapp: status={}".format( resp.status_code ) )
+        startup_msgs = client.get( "/startup-msgs" ).json
+        for msg_type in ( "warning", "error" ):
+            for msg in startup_msgs.get( msg_type, [] ):
+                if isinstance( msg, list ):
+                    msg = "{} ({})".format( msg[0], msg[1] )
+                print( "{}: {}".format( msg_type.upper(), msg ) )
+        if startup_msgs.get( "error" ):
+            raise RuntimeError( "Errors were reported during startup." )
+        if not os.path.isfile( app.config["CACHED_SEARCHDB"] ):
+            raise RuntimeError( "The search database was not created." )
+
+        # save the API responses
+        print( "Saving the API responses..." )
+        urls = list( _PAYLOAD_URLS )
+        asop = client.get( "/asop" ).json or {}
+        for chapter in asop.get( "chapters", [] ):
+            urls.append( "/asop/chapter/{}".format( chapter["chapter_id"] ) )
+            urls.append( "/asop/preamble/{}".format( chapter["chapter_id"] ) )
+            for section in chapter.get( "sections", [] ):
+                urls.append( "/asop/section/{}".format( section["section_id"] ) )
+        payloads = {}
+        for url in urls:
+            resp = client.get( url )
+            if resp.status_code != 200:
+                continue
+            fname = "payloads/{:03d}.dat".format( 1+len(payloads) )
+            with open( os.path.join( bundle_dir, fname ), "wb" ) as fp:
+                fp.write( resp.get_data() )
+            payloads[ url ] = { "fname": fname, "mimetype": resp.mimetype }
+            print( "- {} ({} bytes)".format( url, len(resp.get_data()) ) )
+
+        # save the bundle manifest
+        # NOTE: We do this last, so that the bundle won't be used if something went wrong.
+        manifest = {
+            "version": BUNDLE_VERSION,
+            "app_version": APP_VERSION,
+            "created": datetime.datetime.now().isoformat( timespec="seconds" ),
+            "file_hashes": make_data_file_hashes( data_dir ),
+            "payloads": payloads,
+        }
+        with open( os.path.join( bundle_dir, BUNDLE_MANIFEST_FNAME ), "w", encoding="utf-8" ) as fp:
+            json.dump( manifest, fp, indent=2 )
+
+        # install the bundle
+        if os.path.exists( output_dir ):
+            shutil.rmtree( output_dir )
+        shutil.move( bundle_dir, output_dir )
+        print( "Created the data bundle: {}".format( output_dir ) )
+
+# ---------------------------------------------------------------------
+
+if __name__ == "__main__":
+    main() #pylint: disable=no-value-for-parameter
@@ -0,0 +1,136 @@
+""" Serve pre-built data from a data bundle (see bake.py). """
+
+import os
+import json
+import logging
+
+from flask import request, send_file
+
+from asl_rulebook2.webapp import app
+from asl_rulebook2.webapp.config.constants import APP_VERSION
+from asl_rulebook2.webapp.utils import walk_data_dir, get_cache_paths, hash_file
+
+# NOTE: This should be changed if the format of the bundle changes, or the way the data files are processed
+# changes in a way that would make a previously-built bundle invalid.
+BUNDLE_VERSION = 2
+
+BUNDLE_MANIFEST_FNAME = "bundle.json"
+BUNDLE_SEARCHDB_FNAME = "searchdb.db"
+
+_bundle = None
+
+_logger = logging.getLogger( "bundle" )
+
+# ---------------------------------------------------------------------
+
+def init_data_bundle( startup_msgs, logger ):
+    """Check if we should use a pre-built data bundle."""
+
+    # NOTE: A data bundle is built offline (by running the full startup process), and contains a copy
+    # of the finished search database, and the responses for the API calls that return static content.
+    # If the bundle matches the data directory, we use the search database to restore the fixed-up content
+    # (exactly as if it were a cached search database), and serve the API responses directly from the bundle.
+
+    # initialize
+    global _bundle
+    _bundle = None
+
+    # check if a data bundle has been configured
+    bundle_dir = app.config.get( "DATA_BUNDLE" )
+    if not bundle_dir:
+        return None
+    data_dir = app.config.get( "DATA_DIR" )
+    if not data_dir:
+        return None
+
+    # load the bundle manifest
+    fname = os.path.join( bundle_dir, BUNDLE_MANIFEST_FNAME )
+    if not os.path.isfile( fname ):
+        startup_msgs.warning( "Can't find the data bundle.", bundle_dir )
+        return None
+    try:
+        with open( fname, "r", encoding="utf-8" ) as fp:
+            manifest = json.load( fp )
+    except Exception as ex: #pylint: disable=broad-except
+        startup_msgs.warning( "Can't load the data bundle.", str(ex) )
+        return None
+
+    # check that the bundle is valid
+    if manifest.get( "version" ) != BUNDLE_VERSION or manifest.get( "app_version" ) != APP_VERSION:
+        startup_msgs.warning( "The data bundle was built by a different version of the program, and will be ignored.",
+            "Bundle version: {} ; app version: {}".format( manifest.get("version"), manifest.get("app_version") )
+        )
+        return None
+    logger.info( "Checking the data bundle: %s", bundle_dir )
+    bundle_file_hashes = manifest.get( "file_hashes", {} )
+    file_hashes = make_data_file_hashes( data_dir, bundle_file_hashes )
+    if _get_hashes( file_hashes ) != _get_hashes( bundle_file_hashes ):
+        startup_msgs.warning( "The data bundle doesn't match the data files, and will be ignored." )
+        return None
+
+    # install the data bundle
+    logger.info( "Using the data bundle (built %s).", manifest.get( "created" ) )
+    _bundle = {
+        "dir": bundle_dir,
+        "payloads": manifest.get( "payloads", {} ),
+    }
+    return _bundle
+
+def invalidate_data_bundle():
+    """Stop using the data bundle (because the data files have changed)."""
+    global _bundle
+    if _bundle:
+        _logger.info( "Data files have changed, no longer using the data bundle." )
+        _bundle = None
+
+def get_bundled_searchdb():
+    """Return the search database from the data bundle."""
+    if not _bundle:
+        return None
+    return os.path.join( _bundle["dir"], BUNDLE_SEARCHDB_FNAME )
+
+def make_data_file_hashes( data_dir, prev_file_hashes=None ):
+    """Generate hashes for the files in a data directory."""
+
+    # NOTE: We don't hash the PDF's, since they can be quite large, and are always served as-is.
+    # We also skip any caches that have been configured inside the data directory, since they are
+    # not data files, and get updated while the program is running.
+    # NOTE: This is done every time the program starts, so if we've been given the hashes from a previous run,
+    # we compare the files' stat info (size, modified time and inode), and only re-hash those files that
+    # look like they've changed (see search._make_file_hashes()).
+    prev_file_hashes = prev_file_hashes or {}
+    file_hashes = {}
+    for fname in walk_data_dir( data_dir, get_cache_paths() ):
+        if os.path.splitext( fname )[1].lower() == ".pdf":
+            continue
+        st = os.stat( fname )
+        fh = {
+            "hash": None,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+        }
+        key = os.path.relpath( fname, data_dir ).replace( os.sep, "/" )
+        prev_fh = prev_file_hashes.get( key )
+        if prev_fh and all( prev_fh.get(k) == fh[k] for k in ("size","mtime_ns","inode") ):
+            fh["hash"] = prev_fh["hash"]
+        else:
+            fh["hash"] = hash_file( fname )
+        file_hashes[ key ] = fh
+    return file_hashes
+
+def _get_hashes( file_hashes ):
+    """Get the hash for each file (ignoring the stat info)."""
+    return { key: fh.get( "hash" ) for key, fh in file_hashes.items() }
+
+# ---------------------------------------------------------------------
+
+def on_request():
+    """Serve the response for a request from the data bundle (if available)."""
+    if not _bundle or request.method != "GET" or request.args:
+        return None
+    payload = _bundle["payloads"].get( request.path )
+    if not payload:
+        return None
+    fname = os.path.join( _bundle["dir"], payload["fname"] )
+    return send_file( fname, mimetype=payload["mimetype"] )
@@ -2,20 +2,55 @@
 
 import os
 import io
-import re
+import hashlib
+import json
+import tempfile
+import threading
+import urllib.parse
 from collections import defaultdict
 
-from flask import Response, jsonify, send_file, url_for, abort
+from flask import request, Response, jsonify, send_file, url_for, abort
+from werkzeug.wsgi import wrap_file
 
-from asl_rulebook2.webapp import app
-from asl_rulebook2.webapp.utils import load_data_file, slugify
+from asl_rulebook2.webapp import app, globvars
+from asl_rulebook2.webapp.ruleid_matcher import RuleidMatcher
+from asl_rulebook2.webapp.packed_data import load_packed_data_file, unpack_data
+from asl_rulebook2.webapp.records import IndexEntry, Target, Footnote, make_records, make_record_index
+from asl_rulebook2.webapp.tag_cache import TagCache
+from asl_rulebook2.webapp.utils import load_data_file, slugify, parse_int
 
 _content_sets = None
 _target_index = None
 _footnote_index = None
 _chapter_resources = None
+_chapter_pdf_index = None
+
+_cdoc_index = None
+_cdoc_manifests = None
+_manifest_cache = None
+_cached_responses = {}
+_load_msgs = None
+_load_lock = threading.RLock()
+
+_tag_ruleid_matchers = None
+_tag_ruleid_scopes = None
+_tag_cache = None
+
+# these are the data files that can be associated with a content doc
+_CDOC_DATA_FILES = {
+    "targets": ( ".targets", "json" ),
+    "chapters": ( ".chapters", "json" ),
+    "vo-notes": ( ".vo-notes", "json" ),
+    "css": ( ".css", "text" ),
+    "footnotes": ( ".footnotes", "json" ),
+    "chapter-pdfs": ( ".chapter-pdfs", "json" ),
+}
+
+# these are the data files that can be stored in the packed data cache (see packed_data.py)
+_PACKABLE_DATA_FILES = [ "targets", "vo-notes" ]
 
-_tag_ruleid_regexes = None
+# NOTE: This should be changed if the format of the content manifest cache changes.
+_MANIFEST_CACHE_VERSION = 1
 
 _WELL_KNOWN_CHAPTER_IDS = {
     "RB": "O", "KGP": "P", "PB": "Q", "ABtF": "R", "BRT": "T"
@@ -36,9 +71,18 @@ def load_content_sets( startup_msgs, logger ):
     #   in the MMP eASLRB index, and have their own index.
 
     # initialize
-    global _content_sets, _target_index, _footnote_index, _chapter_resources
+    global _content_sets, _target_index, _footnote_index, _chapter_resources, _chapter_pdf_index
+    global _cdoc_manifests, _manifest_cache, _load_msgs
+    global _cached_responses, _cdoc_index
+    global _tag_ruleid_matchers, _tag_ruleid_scopes
     _content_sets, _target_index, _footnote_index = {}, {}, {}
     _chapter_resources = { "background": {}, "icon": {} }
+    _chapter_pdf_index = {}
+    _cdoc_manifests = {}
+    _cached_responses = {}
+    _cdoc_index = {}
+    _load_msgs = ( startup_msgs, logger )
+    _tag_ruleid_matchers = _tag_ruleid_scopes = None
 
     # get the data directory
     data_dir = app.config.get( "DATA_DIR" )
@@ -49,45 +93,45 @@ def load_content_sets( startup_msgs, logger ):
         startup_msgs.error( "Invalid data directory.", data_dir )
         return None
 
-    def find_resource( fname, dnames ):
-        # find a chapter resource file
-        for dname in dnames:
-            fname2 = os.path.join( dname, fname )
-            if os.path.isfile( fname2 ):
-                return fname2
-        return None
+    # check if we should load the content doc data files now, or when they are first needed
+    # NOTE: Loading these files can take a while if there are a lot of modules, so we offer the option
+    # to only load the index files at startup. We record which data files are available for each content doc
+    # (the "manifest"), and then load them on demand (see _get_cdoc_data()).
+    lazy_load = app.config.get( "LAZY_LOAD_CONTENT" )
+    _manifest_cache = _load_manifest_cache( logger )
 
     def load_content_doc( fname_stem, title, cdoc_id ):
-        # load the content doc files
+        # create a manifest for the content doc
         content_doc = { "cdoc_id": cdoc_id, "title": title }
-        fname = fname_stem + ".targets"
-        if load_file( fname, content_doc, "targets", startup_msgs.warning ):
-            # update the target index
-            _target_index[ cdoc_id ] = {}
-            for ruleid, target in content_doc.get( "targets", {} ).items():
-                _target_index[ cdoc_id ][ ruleid ] = target
-        else:
+        manifest = {
+            "fname_stem": os.path.join( data_dir, fname_stem ),
+            "unloaded": set(),
+            "summaries": {},
+        }
+        for key, (extn, _) in _CDOC_DATA_FILES.items():
+            fname = manifest["fname_stem"] + extn
+            try:
+                st = os.stat( fname )
+            except FileNotFoundError:
+                continue
+            manifest["unloaded"].add( key )
+            # check if we have a summary of the data file from a previous run
+            if key in _CDOC_SUMMARIZERS:
+                summary = _get_cached_summary( fname, st )
+                if summary is not None:
+                    if key == "chapters":
+                        _add_chapter_resources( summary, manifest["fname_stem"] )
+                    manifest["summaries"][ key ] = summary
+        if "targets" not in manifest["unloaded"]:
             # NOTE: Things will work without this file, but from the user's point of view,
             # they've probably set something up incorrectly, so we give them a hint.
             if not app.config.get( "IGNORE_MISSING_DATA_FILES" ):
-                logger.warn( "Didn't find targets file: %s", fname )
-        load_file( fname_stem+".chapters", content_doc, "chapters", startup_msgs.warning )
-        load_file( fname_stem+".vo-notes", content_doc, "vo-notes", startup_msgs.warning )
-        load_file( fname_stem+".css", content_doc, "css", startup_msgs.warning, ftype="text" )
-        if load_file( fname_stem+".footnotes", content_doc, "footnotes", startup_msgs.warning ):
-            # update the footnote index
-            # NOTE: The front-end doesn't care about what chapter a footnote belongs to,
-            # and we rework things a bit to make it easier to map ruleid's to footnotes.
-            if cdoc_id not in _footnote_index:
-                _footnote_index[ cdoc_id ] = {}
-            for chapter_id, footnotes in content_doc.get( "footnotes", {} ).items():
-                for footnote_id, footnote in footnotes.items():
-                    for caption in footnote.get( "captions", [] ):
-                        footnote[ "display_name" ] = "{}{}".format( chapter_id, footnote_id )
-                        ruleid = caption[ "ruleid" ]
-                        if ruleid not in _footnote_index[ cdoc_id ]:
-                            _footnote_index[ cdoc_id ][ ruleid ] = []
-                        _footnote_index[ cdoc_id ][ ruleid ].append( footnote )
+                logger.warn( "Didn't find targets file: %s", fname_stem+".targets" )
+        _cdoc_manifests[ cdoc_id ] = manifest
+        # load the content doc files
+        if not lazy_load:
+            for key in _CDOC_DATA_FILES:
+                _get_cdoc_data( content_doc, key )
         fname = os.path.join( data_dir, fname_stem+".pdf" )
         if os.path.isfile( fname ):
             content_doc["filename"] = fname
@@ -96,20 +140,6 @@ def load_content_sets( startup_msgs, logger ):
             # they've probably set something up incorrectly, so we give them a hint.
             if not app.config.get( "IGNORE_MISSING_DATA_FILES" ):
                 logger.warn( "Didn't find content file: %s", fname )
-        # locate any chapter backgrounds and icons
-        resource_dirs = [
-            os.path.join( data_dir, os.path.dirname(fname_stem) ),
-            os.path.join( os.path.dirname(__file__), "data/chapters/" )
-        ]
-        for chapter in content_doc.get( "chapters", [] ):
-            chapter_id = chapter.get( "chapter_id" )
-            if not chapter_id:
-                continue
-            for rtype in [ "background", "icon" ]:
-                fname = find_resource( "{}-{}.png".format( chapter_id, rtype ), resource_dirs )
-                if fname:
-                    _chapter_resources[ rtype ][ chapter_id ] = os.path.join( "static/", fname )
-                    chapter[ rtype ] = url_for( "get_chapter_resource", chapter_id=chapter_id, rtype=rtype )
         return content_doc
 
     def load_file( rel_fname, save_loc, key, on_error, ftype="json" ):
@@ -172,6 +202,8 @@ def load_content_sets( startup_msgs, logger ):
         }
         if not load_file( rel_index_fname, content_set, "index", startup_msgs.error ):
             continue # nb: we can't do anything without an index file
+        if isinstance( content_set["index"], list ):
+            content_set["index"] = make_records( IndexEntry, content_set["index"] )
 
         # load the main content doc
         rel_fname_stem = os.path.splitext( rel_index_fname )[0]
@@ -192,22 +224,354 @@ def load_content_sets( startup_msgs, logger ):
 
         # save the new content set
         _content_sets[ content_set["cset_id"] ] = content_set
+        _cdoc_index.update( content_set["content_docs"] )
 
-    # generate a list of regex's that identify each ruleid
-    global _tag_ruleid_regexes
-    _tag_ruleid_regexes = {}
-    for cset_id, cset in _content_sets.items():
-        for cdoc_id, cdoc in cset["content_docs"].items():
-            for ruleid in cdoc.get( "targets", {} ):
-                # nb: we also want to detect things like A1.23-.45
-                _tag_ruleid_regexes[ ruleid ] = re.compile(
-                    r"\b{}(-\.\d+)?\b".format(
-                        ruleid.replace( ".", "\\." ).replace( "_", " " )
-                    )
-                )
+    # prepare to tag ruleid's, and generate the responses that will be cached
+    if not lazy_load:
+        _init_tag_ruleids()
+        for key in _CACHED_RESPONSE_BUILDERS:
+            _get_cached_payload( key )
+    _save_manifest_cache()
+
+    # open the tag cache
+    _open_tag_cache( startup_msgs, logger )
 
     return _content_sets
 
+def _get_cdoc_data( cdoc, key ):
+    """Get a content doc's data, loading it if necessary."""
+    manifest = _cdoc_manifests.get( cdoc["cdoc_id"] )
+    if manifest and key in manifest["unloaded"]:
+        with _load_lock:
+            # NOTE: We need to check again, in case another thread loaded the file while we were waiting.
+            if key in manifest["unloaded"]:
+                _load_cdoc_data( cdoc, key, manifest )
+                manifest["unloaded"].discard( key )
+    return cdoc.get( key )
+
+def _load_cdoc_data( cdoc, key, manifest ):
+    """Load a content doc's data file."""
+
+    # load the data file
+    startup_msgs, logger = _load_msgs
+    extn, ftype = _CDOC_DATA_FILES[ key ]
+    fname = manifest["fname_stem"] + extn
+    data = None
+    packed_data_cache = app.config.get( "PACKED_DATA_CACHE" )
+    if packed_data_cache and key in _PACKABLE_DATA_FILES:
+        try:
+            data = load_packed_data_file( fname, packed_data_cache, logger )
+        except Exception as ex: #pylint: disable=broad-except
+            # NOTE: We fall back to loading the data file normally, which will report any problems.
+            logger.warning( "Couldn't load the packed data file (%s): %s", ex, fname )
+    if data is None:
+        data = load_data_file( fname, key, ftype, logger, startup_msgs.warning )
+    if data is None:
+        return
+    cdoc_id = cdoc["cdoc_id"]
+
+    if key == "targets":
+        # update the target index
+        if isinstance( data, dict ):
+            data = make_record_index( Target, data ) # nb: the data wasn't loaded from the packed data cache
+        _target_index[ cdoc_id ] = data
+
+    elif key == "footnotes":
+        # update the footnote index
+        # NOTE: The front-end doesn't care about what chapter a footnote belongs to,
+        # and we rework things a bit to make it easier to map ruleid's to footnotes.
+        footnote_index = _footnote_index.get( cdoc_id, {} )
+        data = {
+            chapter_id: make_record_index( Footnote, footnotes )
+            for chapter_id, footnotes in data.items()
+        }
+        for chapter_id, footnotes in data.items():
+            for footnote_id, footnote in footnotes.items():
+                for caption in footnote.get( "captions", [] ):
+                    footnote[ "display_name" ] = "{}{}".format( chapter_id, footnote_id )
+                    ruleid = caption[ "ruleid" ]
+                    if ruleid not in footnote_index:
+                        footnote_index[ ruleid ] = []
+                    footnote_index[ ruleid ].append( footnote )
+        _footnote_index[ cdoc_id ] = footnote_index
+
+    elif key == "chapters":
+        # locate any chapter backgrounds and icons
+        _add_chapter_resources( data, manifest["fname_stem"] )
+
+    elif key == "chapter-pdfs":
+        # update the chapter PDF index
+        # NOTE: The chapter PDF's are generated by split_pdf_chapters.py, and live alongside the main PDF.
+        chapter_pdf_index = {}
+        for chapter_id, chapter in data.items():
+            chapter[ "chapter_id" ] = chapter_id
+            chapter[ "filename" ] = os.path.join( os.path.dirname( manifest["fname_stem"] ), chapter["fname"] )
+            for ruleid in chapter.get( "targets", {} ):
+                chapter_pdf_index[ ruleid ] = chapter
+        _chapter_pdf_index[ cdoc_id ] = chapter_pdf_index
+
+    # save the file data
+    # NOTE: We do this last, since other threads may access it as soon as it's there.
+    cdoc[ key ] = data
+
+def _add_chapter_resources( chapters, fname_stem ):
+    """Locate any chapter backgrounds and icons."""
+    def find_resource( fname, dnames ):
+        for dname in dnames:
+            fname2 = os.path.join( dname, fname )
+            if os.path.isfile( fname2 ):
+                return fname2
+        return None
+    resource_dirs = [
+        os.path.dirname( fname_stem ),
+        os.path.join( os.path.dirname(__file__), "data/chapters/" )
+    ]
+    for chapter in chapters:
+        chapter_id = chapter.get( "chapter_id" )
+        if not chapter_id:
+            continue
+        for rtype in [ "background", "icon" ]:
+            chapter.pop( rtype, None ) # nb: in case this came from the manifest cache, and the file has gone
+            fname = find_resource( "{}-{}.png".format( chapter_id, rtype ), resource_dirs )
+            if fname:
+                _chapter_resources[ rtype ][ chapter_id ] = os.path.join( "static/", fname )
+                chapter[ rtype ] = url_for( "get_chapter_resource", chapter_id=chapter_id, rtype=rtype )
+
+def _load_all_cdoc_data( key ):
+    """Make sure that the specified data has been loaded for every content doc."""
+    for cset in _content_sets.values():
+        for cdoc in cset["content_docs"].values():
+            _get_cdoc_data( cdoc, key )
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _get_cdoc_summary( cdoc, key ):
+    """Get the summary of a content doc's data, loading it if necessary."""
+
+    # NOTE: Some requests only need a small part of a content doc's data (e.g. $/content-docs might only need
+    # the number of targets, and tagging ruleid's only needs the ruleid's themselves), so we keep a summary
+    # of these data files in the content doc's manifest. If the manifest cache has been configured,
+    # these summaries are saved, and at startup, we can get them from there, instead of loading the data files.
+
+    # check if we already have the summary
+    manifest = _cdoc_manifests.get( cdoc["cdoc_id"] )
+    if not manifest:
+        return None
+    summaries = manifest["summaries"]
+    if key in summaries:
+        return summaries[ key ]
+
+    with _load_lock:
+        if key in summaries:
+            return summaries[ key ] # nb: another thread did this while we were waiting for the lock
+        # load the data, and summarize it
+        data = _get_cdoc_data( cdoc, key )
+        summary = _CDOC_SUMMARIZERS[ key ]( data ) if data is not None else None
+        if summary is not None:
+            fname = manifest["fname_stem"] + _CDOC_DATA_FILES[key][0]
+            _put_cached_summary( fname, summary )
+        summaries[ key ] = summary
+        return summary
+
+def _summarize_targets( targets ):
+    """Summarize a content doc's targets (the caption for each ruleid)."""
+    return {
+        ruleid: target.get( "caption" )
+        for ruleid, target in targets.items()
+    }
+
+def _summarize_vo_notes( vo_notes ):
+    """Summarize a content doc's vehicle/ordnance notes (their captions)."""
+    def get_captions( vo_entries ):
+        return {
+            vo_note_id: { "caption": vo_entry["caption"] }
+            for vo_note_id, vo_entry in vo_entries.items()
+        }
+    return {
+        nat: get_captions( vo_notes[nat] ) if nat == "landing-craft" else {
+            vo_type: get_captions( vo_entries )
+            for vo_type, vo_entries in vo_notes[nat].items()
+        }
+        for nat in vo_notes
+    }
+
+# NOTE: The chapters are small, and the front-end needs all of them, so their summary is just the chapters.
+# For the chapter PDF's, we only need to know how many there are.
+_CDOC_SUMMARIZERS = {
+    "targets": _summarize_targets,
+    "vo-notes": _summarize_vo_notes,
+    "chapters": lambda chapters: chapters,
+    "chapter-pdfs": len,
+}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _load_manifest_cache( logger ):
+    """Load the manifest cache."""
+
+    # check if the cache has been configured
+    fname = app.config.get( "CONTENT_MANIFEST_CACHE" )
+    if not fname:
+        return None
+    manifest_cache = { "fname": fname, "files": {}, "prev_files": {}, "dirty": False }
+
+    # load the cache
+    if os.path.isfile( fname ):
+        logger.info( "Loading the content manifest cache: %s", fname )
+        try:
+            with open( fname, "r", encoding="utf-8" ) as fp:
+                data = json.load( fp )
+            if data.get( "version" ) == _MANIFEST_CACHE_VERSION:
+                manifest_cache["prev_files"] = data["files"]
+        except Exception as ex: #pylint: disable=broad-except
+            # NOTE: We just rebuild the cache.
+            logger.warning( "Couldn't load the content manifest cache (%s): %s", ex, fname )
+
+    return manifest_cache
+
+def _get_cached_summary( fname, st ):
+    """Get the summary for a data file from the manifest cache."""
+    if not _manifest_cache:
+        return None
+    entry = _manifest_cache["prev_files"].pop( fname, None )
+    if not entry or entry["mtime_ns"] != st.st_mtime_ns or entry["size"] != st.st_size:
+        return None
+    _manifest_cache["files"][ fname ] = entry
+    return entry["summary"]
+
+def _put_cached_summary( fname, summary ):
+    """Add the summary for a data file to the manifest cache."""
+    if not _manifest_cache:
+        return
+    st = os.stat( fname )
+    _manifest_cache["files"][ fname ] = {
+        "mtime_ns": st.st_mtime_ns, "size": st.st_size, "summary": summary
+    }
+    _manifest_cache["dirty"] = True
+
+def _save_manifest_cache():
+    """Save the manifest cache, if it has changed."""
+    # NOTE: We only keep the entries for data files that are still being used, so if there are any entries
+    # from the previous run that weren't looked up when the content sets were loaded, the cache is re-written.
+    if not _manifest_cache or not ( _manifest_cache["dirty"] or _manifest_cache["prev_files"] ):
+        return
+    with _load_lock:
+        fname = _manifest_cache["fname"]
+        data = { "version": _MANIFEST_CACHE_VERSION, "files": _manifest_cache["files"] }
+        try:
+            dname = os.path.dirname( os.path.abspath( fname ) )
+            os.makedirs( dname, exist_ok=True )
+            with tempfile.NamedTemporaryFile( "w", encoding="utf-8", dir=dname, suffix=".tmp", delete=False ) as fp:
+                json.dump( data, fp )
+            os.replace( fp.name, fname )
+        except Exception as ex: #pylint: disable=broad-except
+            _load_msgs[1].warning( "Couldn't save the content manifest cache (%s): %s", ex, fname )
+        _manifest_cache["prev_files"] = {}
+        _manifest_cache["dirty"] = False
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _init_tag_ruleids():
+    """Prepare to tag ruleid's."""
+
+    # NOTE: We build a separate matcher for the ruleid's in each content set, so that when we tag content
+    # that belongs to a content set, we only look for ruleid's in that content set (and the core eASLRB,
+    # which everything references), rather than every ruleid from every module that has been installed.
+    # We also build a matcher for all the ruleid's, for content that doesn't belong to a content set.
+
+    # check if we've already done this
+    global _tag_ruleid_matchers, _tag_ruleid_scopes
+    if _tag_ruleid_matchers is not None:
+        return
+
+    with _load_lock:
+        if _tag_ruleid_matchers is not None:
+            return # nb: another thread did this while we were waiting for the lock
+
+        # build a matcher for each content set
+        matchers = {}
+        all_ruleids = []
+        for cset_id, cset in _content_sets.items():
+            ruleids = []
+            for cdoc in cset["content_docs"].values():
+                # nb: we only need the ruleid's, which we can get from the manifest
+                ruleids.extend( _get_cdoc_summary( cdoc, "targets" ) or {} )
+            matchers[ cset_id ] = RuleidMatcher( ruleids )
+            all_ruleids.extend( ruleids )
+
+        # build a matcher for all the ruleid's
+        matchers[ None ] = RuleidMatcher( all_ruleids )
+        _tag_ruleid_scopes = {}
+        _tag_ruleid_matchers = matchers
+        _save_manifest_cache()
+
+def _get_tag_ruleid_scope( cset_id ):
+    """Get the matchers (and their fingerprint) to use when tagging content for a content set."""
+
+    # check if we've already figured this out
+    scope = _tag_ruleid_scopes.get( cset_id )
+    if scope:
+        return scope
+
+    # figure out which matchers to use
+    # nb: if we don't know about this content set, we look for every ruleid
+    lookup_id = cset_id if cset_id in _tag_ruleid_matchers else None
+    matchers = [ _tag_ruleid_matchers[ lookup_id ] ]
+    core_cset_id = app.config.get( "CORE_CONTENT_SET", "asl-rulebook" )
+    if lookup_id not in ( None, core_cset_id ) and core_cset_id in _tag_ruleid_matchers:
+        matchers.insert( 0, _tag_ruleid_matchers[ core_cset_id ] )
+
+    # generate a fingerprint for the ruleid's we will be looking for
+    ruleids = set()
+    for matcher in matchers:
+        ruleids.update( matcher.ruleids )
+    fingerprint = hashlib.md5(
+        "\n".join( sorted( ruleids ) ).encode( "utf-8" )
+    ).hexdigest()
+
+    # save the results
+    # nb: other threads may do this at the same time, but they will get the same results
+    scope = ( matchers, fingerprint )
+    _tag_ruleid_scopes[ cset_id ] = scope
+    return scope
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _open_tag_cache( startup_msgs, logger ):
+    """Open the persistent cache of tagged ruleid's."""
+
+    # close any previously-opened cache
+    global _tag_cache
+    _close_tag_cache()
+
+    # check if the cache has been configured
+    fname = app.config.get( "TAG_RULEIDS_CACHE" )
+    if not fname:
+        return
+    max_entries = parse_int( app.config.get( "TAG_RULEIDS_CACHE_SIZE" ), 100*1000 )
+
+    # open the cache
+    logger.info( "Opening the tag cache: %s", fname )
+    try:
+        _tag_cache = TagCache( fname, max_entries, logger )
+    except Exception as ex: #pylint: disable=broad-except
+        startup_msgs.warning( "Can't open the tag cache.", str(ex) )
+        return
+    if _close_tag_cache not in globvars.cleanup_handlers:
+        globvars.cleanup_handlers.append( _close_tag_cache )
+
+def _close_tag_cache():
+    """Close the tag cache."""
+    global _tag_cache
+    if _tag_cache:
+        _tag_cache.close()
+        _tag_cache = None
+
+def flush_tag_cache():
+    """Write any pending changes in the tag cache to disk."""
+    if _tag_cache:
+        _tag_cache.flush()
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def _dump_content_sets():
@@ -217,6 +581,8 @@ def _dump_content_sets():
         for cdoc_id, cdoc in cset["content_docs"].items():
             print( "Content doc: {} ({})".format( cdoc["title"], cdoc_id ) )
             for key in [ "targets", "footnotes", "filename" ]:
+                if key in _CDOC_DATA_FILES:
+                    _get_cdoc_data( cdoc, key )
                 if key in cdoc:
                     print( "- {}: {}".format( key, len(cdoc[key]) ))
 
@@ -234,64 +600,104 @@ def tag_ruleids( content, cset_id ):
     we don't know about, and mark them accordingly in the UI, but then we're back in regex hell,
     so we can live without it.
     """
+    return tag_ruleids_batch( [ ( content, cset_id ) ] )[0]
+
+def tag_ruleids_batch( items ):
+    """Identify ruleid's in multiple pieces of content and tag them.
+
+    The items are a list of ( content, cset_id ) pairs, and a list of the tagged content is returned.
+    This is more efficient than calling tag_ruleids() for each item, since we only need to access
+    the tag cache once for the entire batch.
+    """
 
     # NOTE: This function is quite expensive, so it's worth doing a quick check to see if there's
-    # any point looping through all the regex's e.g. it's pointless doing this for all those
+    # any point looking for ruleid's e.g. it's pointless doing this for all those
     # numerous Q+A answers that just say "Yes." or "No." :-/
-    if not content:
-        return content
-    if all( not c.isdigit() for c in content ):
-        return content
+    results = [ item[0] for item in items ]
+    todo = [
+        item_no for item_no, item in enumerate( items )
+        if item[0] and any( c.isdigit() for c in item[0] )
+    ]
+    if not todo:
+        return results
+    _init_tag_ruleids()
+
+    # check if we've tagged any of this content before
+    if _tag_cache:
+        cache_keys = {
+            item_no: _tag_cache.make_key( items[item_no][0], items[item_no][1],
+                _get_tag_ruleid_scope( items[item_no][1] )[1]
+            )
+            for item_no in todo
+        }
+        cached = _tag_cache.get_many( cache_keys.values() )
+        new_entries = []
+        for item_no in todo:
+            tagged = cached.get( cache_keys[item_no] )
+            if tagged is None:
+                tagged = _do_tag_ruleids( *items[item_no] )
+                new_entries.append( ( cache_keys[item_no], tagged ) )
+            results[ item_no ] = tagged
+        if new_entries:
+            _tag_cache.put_many( new_entries )
+        return results
+
+    for item_no in todo:
+        results[ item_no ] = _do_tag_ruleids( *items[item_no] )
+    return results
+
+def _do_tag_ruleids( content, cset_id ):
+    """Identify ruleid's in a piece of content and tag them."""
 
     # translate well-known chapter ID's for CG ruleid's
     #   e.g. "OCG8" is often written as "RB CG8" or "RB SSR CG8"
     # NOTE: It would be nice to leave the original text as it is, but this gets quite messy :-/
-    for key, val in _WELL_KNOWN_CHAPTER_IDS.items():
-        content = content.replace( key+" CG", val+"CG" ).replace( key+" SSR CG", val+"CG" )
+    if " CG" in content:
+        for key, val in _WELL_KNOWN_CHAPTER_IDS.items():
+            content = content.replace( key+" CG", val+"CG" ).replace( key+" SSR CG", val+"CG" )
 
     # NOTE: To avoid excessive string operations, we identify all ruleid matches first,
     # then fixup the string content in one pass.
 
     # look for ruleid matches in the content
-    matches = []
-    for ruleid, regex in _tag_ruleid_regexes.items():
-        matches.extend(
-            ( mo, ruleid )
-            for mo in regex.finditer( content )
-        )
-
-    # sort the matches by start position, longer matches first
-    matches.sort( key = lambda m: (
-        m[0].start(), -len( m[0].group() )
-    ) )
+    matchers = _get_tag_ruleid_scope( cset_id )[0]
+    if len(matchers) == 1:
+        # nb: these are sorted by start position, longer matches first
+        matches = matchers[0].find_matches( content )
+    else:
+        matches = []
+        for matcher in matchers:
+            matches.extend( matcher.find_matches( content ) )
+        # sort the matches by start position, longer matches first
+        # NOTE: If a content set re-defines a core ruleid, we will get the same match twice,
+        # and one of them will be removed as a "duplicate" below.
+        matches.sort( key = lambda m: ( m[0], m[0]-m[1] ) )
 
     # remove "duplicate" matches (e.g "A1.2" when we've already matched "A1.23")
     prev_match = [] # nb: we use [] instead of None to stop unsubscriptable-object warnings :-/
     for match_no, match in enumerate( matches ):
         if prev_match:
-            if match[0].start() == prev_match[0].start():
-                if match[0].group() == prev_match[0].group()[ : len(match[0].group()) ]:
-                    # this is a "duplicate" match - delete it
-                    matches[ match_no ] = None
-                    continue
-            assert match[0].start() > prev_match[0].end()
+            if match[0] == prev_match[0]:
+                # this is a "duplicate" match (nb: the shorter match must be a prefix of the longer one) - delete it
+                matches[ match_no ] = None
+                continue
+            assert match[0] > prev_match[1]
         prev_match = match
     matches = [ m for m in matches if m ]
 
     # tag the matches
-    for match in reversed( matches ):
-        mo = match[0]
+    for start, end, ruleid in reversed( matches ):
         buf = [
-            content[ : mo.start() ],
-            "<span data-ruleid='{}' class='auto-ruleid'".format( match[1] )
+            content[ : start ],
+            "<span data-ruleid='{}' class='auto-ruleid'".format( ruleid )
         ]
         if cset_id:
             buf.append( " data-csetid='{}'".format( cset_id ) )
         buf.append( ">" )
         buf.extend( [
-            mo.group(),
+            content[ start : end ],
             "</span>",
-            content[ mo.end() : ]
+            content[ end : ]
         ] )
         content = "".join( buf )
 
@@ -302,6 +708,20 @@ def tag_ruleids( content, cset_id ):
 @app.route( "/content-docs" )
 def get_content_docs():
     """Return the available content docs."""
+    return _get_cached_response( "content-docs" )
+
+def _make_content_docs():
+    """Generate the response for $/content-docs."""
+
+    # check how we should return the targets
+    # NOTE: The targets (the page and position of every ruleid) can be a large part of this response,
+    # but the front-end only needs their captions, and can get the full targets on demand (via $/targets).
+    # The targets can also be left out altogether, in which case the front-end will load them
+    # in the background, once it has started up.
+    targets_mode = app.config.get( "CONTENT_DOC_TARGETS", "full" )
+    if targets_mode not in ( "full", "captions", "none" ):
+        raise RuntimeError( "Invalid CONTENT_DOC_TARGETS setting: {}".format( targets_mode ) )
+
     resp = {}
     for cset in _content_sets.values():
         for cdoc in cset["content_docs"].values():
@@ -312,10 +732,36 @@ def get_content_docs():
             }
             if "filename" in cdoc:
                 cdoc2["url"] = url_for( "get_content", cdoc_id=cdoc["cdoc_id"] )
-            for key in [ "targets", "vo-notes", "chapters", "background", "icon" ]:
+            # NOTE: Unless we're returning the full targets, everything we need is in the content doc's manifest,
+            # so we don't need to load its data files (the front-end only needs the vehicle/ordnance note captions).
+            if targets_mode == "full":
+                for key in [ "targets", "vo-notes" ]:
+                    if _get_cdoc_data( cdoc, key ) is not None:
+                        cdoc2[key] = unpack_data( cdoc[key] )
+            else:
+                captions = _get_cdoc_summary( cdoc, "targets" )
+                if captions is not None:
+                    if targets_mode == "captions":
+                        cdoc2["targets"] = {
+                            ruleid: { "caption": caption } if caption is not None else {}
+                            for ruleid, caption in captions.items()
+                        }
+                    else:
+                        cdoc2["ntargets"] = len( captions )
+                        cdoc2["targets_url"] = url_for( "get_targets", cdoc_id=cdoc["cdoc_id"] )
+                vo_notes = _get_cdoc_summary( cdoc, "vo-notes" )
+                if vo_notes is not None:
+                    cdoc2["vo-notes"] = vo_notes
+            chapters = _get_cdoc_summary( cdoc, "chapters" )
+            if chapters is not None:
+                cdoc2["chapters"] = chapters
+            for key in [ "background", "icon" ]:
                 if key in cdoc:
                     cdoc2[key] = cdoc[key]
+            if _get_cdoc_summary( cdoc, "chapter-pdfs" ):
+                cdoc2["chapter_pdfs"] = True
             resp[ cdoc["cdoc_id"] ] = cdoc2
+    _save_manifest_cache()
     return jsonify( resp )
 
 # ---------------------------------------------------------------------
@@ -323,24 +769,132 @@ def get_content_docs():
 @app.route( "/content/<cdoc_id>" )
 def get_content( cdoc_id ):
     """Return the content for the specified document."""
-    for cset in _content_sets.values():
-        for cdoc in cset["content_docs"].values():
-            if cdoc["cdoc_id"] == cdoc_id and "filename" in cdoc:
-                # NOTE: Important information is stored at the end of a PDF document, and PDF.js
-                # can get it early, *if* the server supports range requests, which will allow it
-                # to start rendering the document before it's received the entire file.
-                #   https://github.com/mozilla/pdf.js/wiki/Frequently-Asked-Questions#range
-                #   https://flask.palletsprojects.com/en/1.1.x/api/?highlight=send_file#flask.send_file
-                return send_file( cdoc["filename"], mimetype="application/pdf", conditional=True )
+    cdoc = _cdoc_index.get( cdoc_id ) if _cdoc_index else None
+    if not cdoc or "filename" not in cdoc:
+        abort( 404 )
+    return _send_pdf( cdoc["filename"] )
+
+@app.route( "/content/<cdoc_id>/chapter/<ruleid>" )
+def get_chapter_content( cdoc_id, ruleid ):
+    """Return the chapter PDF that contains the specified ruleid."""
+
+    # NOTE: The front-end can use this to show a rule quickly, while the full document downloads
+    # in the background. The page number of the target within the chapter PDF is returned in a header,
+    # since the response body is the PDF itself.
+    cdoc = _cdoc_index.get( cdoc_id ) if _cdoc_index else None
+    if not cdoc:
+        abort( 404 )
+    _get_cdoc_data( cdoc, "chapter-pdfs" )
+    chapter = _chapter_pdf_index.get( cdoc_id, {} ).get( ruleid )
+    if not chapter or not os.path.isfile( chapter["filename"] ):
+        abort( 404 )
+    resp = _send_pdf( chapter["filename"] )
+    resp.headers[ "X-Chapter-Id" ] = chapter["chapter_id"]
+    resp.headers[ "X-Chapter-Pages" ] = "{}-{}".format( chapter["first_page"], chapter["last_page"] )
+    resp.headers[ "X-Target-Page-No" ] = str( chapter["targets"][ruleid]["page_no"] )
+    return resp
+
+def _send_pdf( fname ):
+    """Send a PDF file."""
+
+    # check if we should get the front-end web server to send the file
+    # NOTE: If the webapp is running behind nginx or Apache, they can send the file much more efficiently
+    # than we can (and without tying up the webapp while they do it).
+    offload = app.config.get( "PDF_OFFLOAD" )
+    if offload == "x-accel-redirect":
+        # NOTE: nginx needs to be configured with an internal location that maps to the data directory.
+        data_dir = os.path.abspath( app.config["DATA_DIR"] )
+        url = "{}/{}".format(
+            app.config.get( "PDF_OFFLOAD_PREFIX", "/asl-rulebook2-data" ).rstrip( "/" ),
+            urllib.parse.quote( os.path.relpath( fname, data_dir ).replace( os.sep, "/" ) )
+        )
+        resp = Response( mimetype="application/pdf" )
+        resp.headers[ "X-Accel-Redirect" ] = url
+        return resp
+    if offload == "x-sendfile":
+        resp = Response( mimetype="application/pdf" )
+        resp.headers[ "X-Sendfile" ] = fname
+        return resp
+    if offload:
+        raise RuntimeError( "Invalid PDF_OFFLOAD setting: {}".format( offload ) )
+
+    # send the file ourself
+    # NOTE: Important information is stored at the end of a PDF document, and PDF.js
+    # can get it early, *if* the server supports range requests, which will allow it
+    # to start rendering the document before it's received the entire file.
+    #   https://github.com/mozilla/pdf.js/wiki/Frequently-Asked-Questions#range
+    # NOTE: This is what send_file() does, but it reads the file in small blocks, which means
+    # many more trips through the event loop, when PDF.js asks for large ranges.
+    st = os.stat( fname )
+    fp = open( fname, "rb" ) #pylint: disable=consider-using-with
+    buffer_size = parse_int( app.config.get( "PDF_BUFFER_SIZE" ), 256*1024 )
+    resp = Response( wrap_file( request.environ, fp, buffer_size=buffer_size ),
+        mimetype = "application/pdf",
+        direct_passthrough = True
+    )
+    resp.content_length = st.st_size
+    resp.last_modified = int( st.st_mtime )
+    resp.set_etag( "{}-{}-{}".format( st.st_mtime_ns, st.st_size, st.st_ino ) )
+    resp.cache_control.public = True
+    resp.cache_control.max_age = app.get_send_file_max_age( fname )
+    # NOTE: PDF.js checks for this in the response to its first request, but make_conditional() only sets it
+    # when it's responding to a range request.
+    resp.accept_ranges = "bytes"
+    return resp.make_conditional( request, accept_ranges=True, complete_length=st.st_size )
+
+# ---------------------------------------------------------------------
+
+@app.route( "/targets/<cdoc_id>" )
+def get_targets( cdoc_id ):
+    """Return the targets for a content doc."""
+    targets = _get_targets( cdoc_id )
+    # check if we should only return some of the targets
+    ruleids = request.args.get( "ruleids" )
+    if ruleids:
+        targets = {
+            ruleid: targets[ruleid]
+            for ruleid in ( r.strip() for r in ruleids.split( "," ) )
+            if ruleid in targets
+        }
+    # check if we should only return some of the fields
+    fields = request.args.get( "fields" )
+    if fields:
+        targets = _get_target_fields( targets, fields.split( "," ) )
+    return jsonify( unpack_data( targets ) )
+
+@app.route( "/targets/<cdoc_id>/<ruleid>" )
+def get_target( cdoc_id, ruleid ):
+    """Return a single target."""
+    target = _get_targets( cdoc_id ).get( ruleid )
+    if not target:
+        abort( 404 )
+    return jsonify( target )
+
+def _get_targets( cdoc_id ):
+    """Get the targets for a content doc."""
+    cdoc = _cdoc_index.get( cdoc_id ) if _cdoc_index else None
+    if not cdoc:
+        abort( 404 )
+    _get_cdoc_data( cdoc, "targets" )
+    return _target_index.get( cdoc_id, {} )
 
-    abort( 404 )
-    return None # stupid pylint :-/
+def _get_target_fields( targets, fields ):
+    """Return only the specified fields for each target."""
+    return {
+        ruleid: { f: target[f] for f in fields if f in target }
+        for ruleid, target in targets.items()
+    }
 
 # ---------------------------------------------------------------------
 
 @app.route( "/footnotes" )
 def get_footnotes():
     """Return the footnote index."""
+    return _get_cached_response( "footnotes" )
+
+def _make_footnotes():
+    """Generate the response for $/footnotes."""
+    _load_all_cdoc_data( "footnotes" )
     return jsonify( _footnote_index )
 
 # ---------------------------------------------------------------------
@@ -348,6 +902,10 @@ def get_footnotes():
 @app.route( "/content/css" )
 def get_content_css():
     """Return the custom CSS for each content doc."""
+    return _get_cached_response( "content-css" )
+
+def _make_content_css():
+    """Generate the response for $/content/css."""
     buf = io.StringIO()
     fname = os.path.join( os.path.dirname(__file__), "data/ASL Rulebook.css" )
     with open( fname, "r", encoding="utf-8" ) as fp:
@@ -355,7 +913,7 @@ def get_content_css():
         print( fp.read().strip(), file=buf )
     for cset in _content_sets.values():
         for cdoc in cset["content_docs"].values():
-            if "css" in cdoc:
+            if _get_cdoc_data( cdoc, "css" ) is not None:
                 print( file=buf )
                 print( "/* {} */".format( cdoc["title"] ), file=buf )
                 print( cdoc["css"].strip(), file=buf )
@@ -374,6 +932,10 @@ def get_chapter_resource( chapter_id, rtype ):
 @app.route( "/vo-note-targets" )
 def get_vo_note_targets():
     """Return the Chapter H vehicle/ordnance note targets."""
+    return _get_cached_response( "vo-note-targets" )
+
+def _make_vo_note_targets():
+    """Generate the response for $/vo-note-targets."""
     targets = defaultdict( lambda: defaultdict( dict ) )
     def add_targets( dest, key, vo_entries ):
         for vo_note_id, vo_entry in vo_entries.items():
@@ -383,7 +945,7 @@ def get_vo_note_targets():
             }
     for cset in _content_sets.values():
         for cdoc in cset["content_docs"].values():
-            vo_notes = cdoc.get( "vo-notes" )
+            vo_notes = _get_cdoc_data( cdoc, "vo-notes" )
             if not vo_notes:
                 continue
             for nat in vo_notes:
@@ -395,3 +957,41 @@ def get_vo_note_targets():
                         key = "{}/{}_{}".format( cdoc["cdoc_id"], nat, vo_type )
                         add_targets( targets[nat][vo_type], key, vo_notes[nat][vo_type] )
     return jsonify( targets )
+
+# ---------------------------------------------------------------------
+
+# NOTE: The responses for these requests never change after the content sets have been loaded, so we generate
+# them once, then serve the cached version, with an ETag so that the browser can check if its copy is still valid.
+_CACHED_RESPONSE_BUILDERS = {
+    "content-docs": _make_content_docs,
+    "footnotes": _make_footnotes,
+    "content-css": _make_content_css,
+    "vo-note-targets": _make_vo_note_targets,
+}
+
+def _get_cached_response( key ):
+    """Return a cached response."""
+    cached = _get_cached_payload( key )
+    resp = Response( cached["data"], mimetype=cached["mimetype"] )
+    resp.set_etag( cached["etag"] )
+    # NOTE: The content can change if the webapp is reloaded, so the browser needs to check with us
+    # each time, but if its copy is still valid, we just send back a 304.
+    resp.cache_control.no_cache = True
+    return resp.make_conditional( request )
+
+def _get_cached_payload( key ):
+    """Get the payload for a cached response, generating it if necessary."""
+    cached = _cached_responses.get( key )
+    if cached is None:
+        with _load_lock:
+            cached = _cached_responses.get( key )
+            if cached is None:
+                resp = _CACHED_RESPONSE_BUILDERS[ key ]()
+                data = resp.get_data()
+                cached = {
+                    "data": data,
+                    "mimetype": resp.mimetype,
+                    "etag": hashlib.md5( data ).hexdigest(),
+                }
+                _cached_responses[ key ] = cached
+    return cached
@@ -4,7 +4,6 @@ import os
 import io
 import re
 
-import markdown
 from flask import make_response, send_file, abort, safe_join
 
 from asl_rulebook2.webapp import app
@@ -33,6 +32,8 @@ def get_doc( path ):
     # check if the file is Markdown
     if os.path.splitext( path )[1] == ".md":
         # yup - convert it to HTML
+        # NOTE: We import this here, since it's rarely needed, and we want to keep startup fast.
+        import markdown
         buf = io.BytesIO()
         markdown.markdownFromFile( input=fname, output=buf, encoding="utf-8" )
         # FUDGE! Code fragments are wrapped with <code> tags, and while we would like to style them using CSS,
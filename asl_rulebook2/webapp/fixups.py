@@ -0,0 +1,145 @@
+""" Apply user-defined fixups to Q+A and errata content. """
+
+import re
+
+_EXC_REGEX = re.compile( r"\[EXC: .*?\]" )
+
+# NOTE: This is the minimum number of fixups in a stage before we use a regex to apply them.
+_MIN_REGEX_FIXUPS = 20
+
+# ---------------------------------------------------------------------
+
+class Fixups:
+    """Apply user-defined fixups to a piece of content.
+
+    The search-and-replace fixups used to be applied one after the other, which meant scanning the content
+    once for every fixup (and there can be hundreds of them). We now combine them into a single regex,
+    and do all the replacements in one pass. This gives exactly the same results, as long as the fixups
+    don't interact with each other (e.g. if one fixup generates text that a later one will replace),
+    so we put the fixups into groups that can be done in a single pass, starting a new group whenever
+    a fixup might interact with one that is already in the current group. The groups are then applied
+    one after the other. In practice, there are only a few groups.
+    """
+
+    def __init__( self, fixups ):
+        self._stages = []
+        stage = None
+        for search_for, replace_with in fixups.get( "replace", {} ).items():
+            if stage is None or not stage.add( search_for, replace_with ):
+                stage = _FixupStage( search_for, replace_with )
+                self._stages.append( stage )
+        self._funcs = [ s.compile() for s in self._stages ]
+
+    def __call__( self, val ):
+        for func in self._funcs:
+            val = func( val )
+        return _EXC_REGEX.sub( r"<span class='exc'>\g<0></span>", val )
+
+    @property
+    def nstages( self ):
+        """Return the number of passes that are made over the content."""
+        return len( self._stages )
+
+# ---------------------------------------------------------------------
+
+class _FixupStage:
+    """A group of search-and-replace fixups that can be applied in a single pass."""
+
+    def __init__( self, search_for, replace_with ):
+        self.replace = { search_for: replace_with }
+        self._search_for = _StringSet( [ search_for ] )
+        self._replace_with = _StringSet( [ replace_with ] )
+        # NOTE: If a fixup deletes text, the text on either side could join up to create a match
+        # for a later fixup, so nothing else can go in the same stage.
+        self._closed = not search_for or not replace_with
+
+    def add( self, search_for, replace_with ):
+        """Try to add a fixup to the stage.
+
+        Returns False if it might interact with one of the fixups already in the stage.
+        """
+        # NOTE: A fixup interacts with an earlier one if their matches could overlap, or if the earlier
+        # fixup's replacement could create (or be part of) a match for it.
+        if self._closed or not search_for:
+            return False
+        if self._search_for.overlaps( search_for ) or self._replace_with.overlaps( search_for ):
+            return False
+        self.replace[ search_for ] = replace_with
+        self._search_for.add( search_for )
+        self._replace_with.add( replace_with )
+        if not replace_with:
+            self._closed = True
+        return True
+
+    def compile( self ):
+        """Generate a function that applies the fixups in this stage."""
+        if len( self.replace ) < _MIN_REGEX_FIXUPS:
+            # NOTE: str.replace() is fast enough that it's not worth using a regex for only a few fixups.
+            replace = list( self.replace.items() )
+            def apply_fixups( val ):
+                for search_for, replace_with in replace:
+                    val = val.replace( search_for, replace_with )
+                return val
+            return apply_fixups
+        # NOTE: Python's regex engine tries each alternative in turn, so we build the regex from a trie
+        # of the search strings, so that it only needs to check the ones that could match.
+        trie = {}
+        for search_for in self.replace:
+            node = trie
+            for ch in search_for:
+                node = node.setdefault( ch, {} )
+        regex = re.compile( _make_trie_regex( trie ) )
+        replace = self.replace
+        return lambda val: regex.sub( lambda mo: replace[ mo.group() ], val )
+
+def _make_trie_regex( node ):
+    """Generate a regex that matches the strings in a trie."""
+    # NOTE: No search string can be a prefix of another (they would overlap), so the strings
+    # always end at a leaf node.
+    alts = [ re.escape( ch ) + _make_trie_regex( child ) for ch, child in node.items() ]
+    if len( alts ) <= 1:
+        return "".join( alts )
+    return "(?:{})".format( "|".join( alts ) )
+
+# ---------------------------------------------------------------------
+
+class _StringSet:
+    """A set of strings, that can be checked for any that overlap a given string.
+
+    Two strings overlap if one contains the other, or the end of one is the same as the start of the other
+    (i.e. they could both match the same part of a piece of content).
+    """
+
+    def __init__( self, vals ):
+        self._vals = set()
+        self._lengths = set()
+        self._prefixes, self._suffixes = set(), set()
+        self._joined = ""
+        for val in vals:
+            self.add( val )
+
+    def add( self, val ):
+        """Add a string to the set."""
+        self._vals.add( val )
+        self._lengths.add( len(val) )
+        for i in range( 1, len(val) ):
+            self._prefixes.add( val[:i] )
+            self._suffixes.add( val[-i:] )
+        # nb: a match across the separator would just mean that we (unnecessarily) start a new stage
+        self._joined += "\0" + val
+
+    def overlaps( self, val ):
+        """Check if any string in the set overlaps the specified string."""
+        # check if any string in the set contains the string
+        if val in self._joined:
+            return True
+        # check if the string contains any string in the set
+        for length in self._lengths:
+            for i in range( len(val) - length + 1 ):
+                if val[ i : i+length ] in self._vals:
+                    return True
+        # check if the start or end of the string could be part of a string in the set
+        for i in range( 1, len(val) ):
+            if val[i:] in self._prefixes or val[:i] in self._suffixes:
+                return True
+        return False
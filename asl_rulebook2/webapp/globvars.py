@@ -37,6 +37,10 @@ def on_request():
                 # NOTE: It's important to set this, even if initialization failed, so we don't
                 # try to initialize again.
                 _init_done = True
+        else:
+            # reload any data files that have changed
+            from asl_rulebook2.webapp.startup import apply_pending_reloads
+            apply_pending_reloads()
 
 # ---------------------------------------------------------------------
 
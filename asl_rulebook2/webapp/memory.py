@@ -0,0 +1,167 @@
+""" Report how much memory is being used. """
+
+import sys
+import mmap
+import types
+import threading
+import tracemalloc
+import logging
+
+from flask import jsonify, abort
+
+from asl_rulebook2.webapp import app
+from asl_rulebook2.webapp.utils import parse_int
+
+_phases = None
+_last_snapshot = None
+_phases_lock = threading.Lock()
+
+_logger = logging.getLogger( "memory" )
+
+# these are the objects we report on
+# NOTE: Some objects are shared between subsystems (e.g. the target index refers to the same targets
+# as the content sets), so the sizes can't just be added together.
+#pylint: disable=protected-access
+def _get_subsystems():
+    from asl_rulebook2.webapp import content, search, rule_info, asop, prepare
+    return {
+        "content-sets": lambda: content._content_sets,
+        "target-index": lambda: content._target_index,
+        "footnote-index": lambda: content._footnote_index,
+        "tag-ruleid-matchers": lambda: content._tag_ruleid_matchers,
+        "cached-responses": lambda: content._cached_responses,
+        "search-index": lambda: search._fts_index,
+        "qa": lambda: rule_info._qa_index,
+        "errata": lambda: rule_info._errata,
+        "user-anno": lambda: rule_info._user_anno,
+        "asop": lambda: ( asop._asop, asop._asop_preambles, asop._asop_section_content, asop._rendered_cache ),
+        "prepare-download": lambda: prepare._zip_data_download,
+    }
+#pylint: enable=protected-access
+
+# these are the types of object we don't descend into
+_SKIP_TYPES = ( type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType )
+
+# ---------------------------------------------------------------------
+
+def start_memory_tracing():
+    """Start tracing memory allocations (if enabled)."""
+
+    # NOTE: We take a snapshot after each phase of the startup process, and remember which lines of code
+    # allocated the most memory during that phase. Tracing slows things down quite a bit, and uses
+    # a lot of memory itself, so it's only done if it's been enabled.
+    global _phases, _last_snapshot
+    with _phases_lock:
+        _phases = []
+        _last_snapshot = None
+    if not app.config.get( "TRACE_MEMORY" ):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _last_snapshot = tracemalloc.take_snapshot()
+
+def record_memory_phase( phase ):
+    """Record how much memory was allocated during a phase of the startup process."""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        return
+    with _phases_lock:
+        snapshot = tracemalloc.take_snapshot()
+        ntop = parse_int( app.config.get( "TRACE_MEMORY_TOP" ), 10 )
+        stats = snapshot.compare_to( _last_snapshot, "lineno" ) if _last_snapshot else snapshot.statistics( "lineno" )
+        top = [
+            {
+                "location": "{}:{}".format( stat.traceback[0].filename, stat.traceback[0].lineno ),
+                "size": getattr( stat, "size_diff", stat.size ),
+                "count": getattr( stat, "count_diff", stat.count ),
+            }
+            for stat in stats[:ntop]
+        ]
+        _phases.append( {
+            "phase": phase,
+            "traced": tracemalloc.get_traced_memory()[0],
+            "top": top,
+        } )
+        _last_snapshot = snapshot
+    _logger.debug( "Memory after %s: %.1f MB", phase, _phases[-1]["traced"] / 1024 / 1024 )
+
+# ---------------------------------------------------------------------
+
+def get_deep_size( obj ):
+    """Get the size of an object, and everything it refers to.
+
+    Returns the number of bytes used, the number of objects, and the number of bytes in memory-mapped files
+    (which are paged in as needed, and so don't necessarily take up real memory).
+    """
+    size, nobjs, mapped = 0, 0, 0
+    seen = set()
+    stack = [ obj ]
+    while stack:
+        obj = stack.pop()
+        if id( obj ) in seen or isinstance( obj, _SKIP_TYPES ):
+            continue
+        seen.add( id( obj ) )
+        size += sys.getsizeof( obj )
+        nobjs += 1
+        if isinstance( obj, ( str, bytes, int, float, bool ) ) or obj is None:
+            continue
+        if isinstance( obj, mmap.mmap ):
+            mapped += len( obj )
+            continue
+        if isinstance( obj, dict ):
+            stack.extend( obj.keys() )
+            stack.extend( obj.values() )
+            continue
+        if isinstance( obj, ( list, tuple, set, frozenset ) ):
+            stack.extend( obj )
+            continue
+        # check the object's attributes
+        if hasattr( obj, "__dict__" ):
+            stack.append( obj.__dict__ )
+        for cls in type( obj ).__mro__:
+            slots = cls.__dict__.get( "__slots__", () )
+            if isinstance( slots, str ):
+                slots = [ slots ]
+            for slot in slots:
+                if hasattr( obj, slot ):
+                    stack.append( getattr( obj, slot ) )
+    return size, nobjs, mapped
+
+def get_memory_report():
+    """Report how much memory is being used."""
+    subsystems = {}
+    for name, get_obj in _get_subsystems().items():
+        size, nobjs, mapped = get_deep_size( get_obj() )
+        subsystems[ name ] = { "size": size, "objects": nobjs }
+        if mapped:
+            subsystems[ name ][ "mapped" ] = mapped
+    report = {
+        "rss": _get_rss(),
+        "subsystems": subsystems,
+    }
+    with _phases_lock:
+        if _phases:
+            report[ "phases" ] = list( _phases )
+    return report
+
+def _get_rss():
+    """Get the current RSS."""
+    try:
+        import resource
+        with open( "/proc/self/statm", "r", encoding="utf-8" ) as fp:
+            return int( fp.read().split()[1] ) * resource.getpagesize()
+    except (ImportError, IOError):
+        return None # nb: we're not running on Linux
+
+# ---------------------------------------------------------------------
+
+@app.route( "/debug/memory" )
+def get_memory_usage():
+    """Report how much memory is being used."""
+    # NOTE: This can take a while to generate, and exposes internal details of the webapp,
+    # so it has to be explicitly enabled.
+    if not app.config.get( "ENABLE_MEMORY_REPORT" ):
+        abort( 404 )
+    return jsonify( get_memory_report() )
@@ -0,0 +1,293 @@
+""" Store data files in a compact binary format. """
+
+import os
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+from collections.abc import Mapping
+
+# NOTE: This should be changed if the format of the packed data files changes.
+PACKED_DATA_VERSION = 1
+
+# NOTE: A packed data file looks like this:
+#   header | metadata (JSON) | tables | strings
+# Each table is an array of fixed-size records (in their original order), followed by an index (the record
+# numbers, sorted by key), that lets us look up keys using a binary search. Strings are stored once each,
+# and referenced by their offset and length.
+_MAGIC = b"ASLRB2PK"
+_HEADER = struct.Struct( "<8sIQQI" ) # magic, version, source mtime, source size, metadata length
+_RECORD = struct.Struct( "<IHIHiiiB" ) # key offset/length, caption offset/length, page_no, x, y, flags
+_INDEX_ENTRY = struct.Struct( "<I" )
+
+_HAS_CAPTION, _HAS_PAGE_NO, _HAS_POS = 0x01, 0x02, 0x04
+_RECORD_KEYS = set( [ "caption", "page_no", "pos" ] )
+
+# ---------------------------------------------------------------------
+
+def load_packed_data_file( fname, cache_dir, logger ):
+    """Load a data file, via the packed data cache.
+
+    Returns None if the data file can't be packed, in which case the caller should load it normally.
+    """
+
+    # NOTE: Data files such as the targets are mostly large numbers of small records (a caption, a page number
+    # and a position), which take up a lot of memory when loaded as JSON (each one becomes a dict, holding
+    # a list and several other objects). Instead, we convert each data file into a compact binary format
+    # (once, the first time it's needed), then memory-map that, and decode each record as it's needed.
+
+    # check if the packed data file is up-to-date
+    st = os.stat( fname )
+    packed_fname = os.path.join( cache_dir,
+        hashlib.md5( os.path.abspath( fname ).encode( "utf-8" ) ).hexdigest() + ".packed"
+    )
+    if not _is_packed_file_valid( packed_fname, st ):
+        # nope - create it
+        with open( fname, "r", encoding="utf-8" ) as fp:
+            data = json.load( fp )
+        try:
+            packed_data = pack_data( data, st )
+        except ValueError as ex:
+            logger.debug( "- Can't pack data file (%s): %s", ex, fname )
+            return None
+        logger.debug( "- Creating packed data file: %s => %s", fname, packed_fname )
+        os.makedirs( cache_dir, exist_ok=True )
+        with tempfile.NamedTemporaryFile( dir=cache_dir, suffix=".tmp", delete=False ) as fp:
+            fp.write( packed_data )
+        os.replace( fp.name, packed_fname )
+
+    # load the packed data file
+    logger.debug( "- Loading packed data file: %s => %s", fname, packed_fname )
+    return open_packed_data( packed_fname )
+
+def _is_packed_file_valid( fname, src_stat ):
+    """Check if a packed data file is valid for the specified source file."""
+    if not os.path.isfile( fname ):
+        return False
+    with open( fname, "rb" ) as fp:
+        buf = fp.read( _HEADER.size )
+    if len(buf) != _HEADER.size:
+        return False
+    magic, version, src_mtime, src_size, _ = _HEADER.unpack( buf )
+    return magic == _MAGIC and version == PACKED_DATA_VERSION \
+        and src_mtime == src_stat.st_mtime_ns and src_size == src_stat.st_size
+
+# ---------------------------------------------------------------------
+
+def pack_data( data, src_stat ):
+    """Convert data into the packed format.
+
+    The data must be a dict of records (each with a caption, page number and/or position), or dicts
+    that eventually contain these. Raises a ValueError if the data can't be packed.
+    """
+
+    # find the tables of records
+    tables = []
+    def find_tables( val, path ):
+        if not isinstance( val, dict ):
+            raise ValueError( "Unexpected data type: {}".format( type(val).__name__ ) )
+        if all( _is_record( v ) for v in val.values() ):
+            tables.append( ( path, val ) )
+        else:
+            for key, val2 in val.items():
+                find_tables( val2, path + [key] )
+    find_tables( data, [] )
+
+    # pack the strings
+    strings_buf, string_offsets = bytearray(), {}
+    def add_string( val ):
+        buf = val.encode( "utf-8" )
+        if len(buf) > 0xffff:
+            raise ValueError( "String is too long." )
+        if buf not in string_offsets:
+            string_offsets[ buf ] = len( strings_buf )
+            strings_buf.extend( buf )
+        return string_offsets[ buf ], len(buf)
+
+    # pack the tables
+    tables_buf = bytearray()
+    meta = { "tables": [] }
+    for path, records in tables:
+        offset = len( tables_buf )
+        keys = []
+        for key, record in records.items():
+            key_offset, key_len = add_string( key )
+            flags, caption_offset, caption_len = 0, 0, 0
+            if "caption" in record:
+                caption_offset, caption_len = add_string( record["caption"] )
+                flags |= _HAS_CAPTION
+            page_no = record.get( "page_no" )
+            if page_no is not None:
+                flags |= _HAS_PAGE_NO
+            pos = record.get( "pos" )
+            if pos is not None:
+                flags |= _HAS_POS
+            try:
+                tables_buf.extend( _RECORD.pack( key_offset, key_len, caption_offset, caption_len,
+                    page_no or 0, pos[0] if pos else 0, pos[1] if pos else 0, flags
+                ) )
+            except struct.error as ex:
+                raise ValueError( str(ex) ) from ex
+            keys.append( key.encode( "utf-8" ) )
+        index_offset = len( tables_buf )
+        for record_no in sorted( range( len(keys) ), key=keys.__getitem__ ):
+            tables_buf.extend( _INDEX_ENTRY.pack( record_no ) )
+        meta["tables"].append( {
+            "path": path, "offset": offset, "index_offset": index_offset, "count": len(keys)
+        } )
+    meta["tables_size"] = len( tables_buf )
+
+    # generate the packed data
+    meta = json.dumps( meta ).encode( "utf-8" )
+    header = _HEADER.pack( _MAGIC, PACKED_DATA_VERSION, src_stat.st_mtime_ns, src_stat.st_size, len(meta) )
+    return header + meta + bytes( tables_buf ) + bytes( strings_buf )
+
+def _is_record( val ):
+    """Check if a value is a record that can be packed."""
+    if not isinstance( val, dict ) or not val or not set( val.keys() ).issubset( _RECORD_KEYS ):
+        return False
+    if not isinstance( val.get( "caption", "" ), str ):
+        return False
+    if not isinstance( val.get( "page_no", 0 ), int ):
+        return False
+    pos = val.get( "pos" )
+    if pos is not None:
+        if not isinstance( pos, list ) or len(pos) != 2 or not all( isinstance( p, int ) for p in pos ):
+            return False
+    return True
+
+# ---------------------------------------------------------------------
+
+def open_packed_data( fname ):
+    """Open a packed data file.
+
+    Returns the same structure as the original data, except that each table of records
+    is a PackedRecords object.
+    """
+
+    # memory-map the file
+    with open( fname, "rb" ) as fp:
+        buf = mmap.mmap( fp.fileno(), 0, access=mmap.ACCESS_READ )
+    magic, version, _, _, meta_len = _HEADER.unpack_from( buf, 0 )
+    if magic != _MAGIC or version != PACKED_DATA_VERSION:
+        raise RuntimeError( "Invalid packed data file: {}".format( fname ) )
+    meta = json.loads( buf[ _HEADER.size : _HEADER.size+meta_len ] )
+    tables_base = _HEADER.size + meta_len
+    strings_base = tables_base + meta["tables_size"]
+
+    # unpack the tables
+    data = {}
+    for table in meta["tables"]:
+        records = PackedRecords( buf, tables_base+table["offset"], tables_base+table["index_offset"],
+            table["count"], strings_base
+        )
+        if not table["path"]:
+            return records
+        dest = data
+        for key in table["path"][:-1]:
+            dest = dest.setdefault( key, {} )
+        dest[ table["path"][-1] ] = records
+    return data
+
+def unpack_data( val ):
+    """Convert packed data back into normal Python objects (e.g. for returning as JSON)."""
+    if isinstance( val, Mapping ):
+        return { k: unpack_data( v ) for k, v in val.items() }
+    return val
+
+# ---------------------------------------------------------------------
+
+class PackedRecords( Mapping ):
+    """A read-only mapping of keys to records, stored in a packed data file.
+
+    Records are returned as dicts (with the same keys as the original data), but are decoded as needed,
+    rather than being kept in memory.
+    """
+
+    def __init__( self, buf, offset, index_offset, count, strings_base ):
+        self._buf = buf
+        self._offset = offset
+        self._index_offset = index_offset
+        self._count = count
+        self._strings_base = strings_base
+
+    def __len__( self ):
+        return self._count
+
+    def __iter__( self ):
+        for record_no in range( self._count ):
+            yield self._get_key( record_no )
+
+    def __contains__( self, key ):
+        return self._find( key ) is not None
+
+    def __getitem__( self, key ):
+        record_no = self._find( key )
+        if record_no is None:
+            raise KeyError( key )
+        return self._get_record( record_no )
+
+    def items( self ):
+        # nb: we don't need to look up each key
+        for record_no in range( self._count ):
+            yield self._get_key( record_no ), self._get_record( record_no )
+
+    def values( self ):
+        for record_no in range( self._count ):
+            yield self._get_record( record_no )
+
+    def get_caption( self, key ):
+        """Get the caption for a record."""
+        record_no = self._find( key )
+        if record_no is None:
+            return None
+        fields = _RECORD.unpack_from( self._buf, self._offset + record_no*_RECORD.size )
+        return self._get_string( fields[2], fields[3] ) if fields[7] & _HAS_CAPTION else None
+
+    def _find( self, key ):
+        """Find the record for a key."""
+        if not isinstance( key, str ):
+            return None
+        key = key.encode( "utf-8" )
+        low, high = 0, self._count
+        while low < high:
+            mid = ( low + high ) // 2
+            record_no = _INDEX_ENTRY.unpack_from( self._buf, self._index_offset + mid*_INDEX_ENTRY.size )[0]
+            fields = _RECORD.unpack_from( self._buf, self._offset + record_no*_RECORD.size )
+            key2 = self._get_bytes( fields[0], fields[1] )
+            if key2 == key:
+                return record_no
+            if key2 < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def _get_key( self, record_no ):
+        """Get the key for a record."""
+        fields = _RECORD.unpack_from( self._buf, self._offset + record_no*_RECORD.size )
+        return self._get_string( fields[0], fields[1] )
+
+    def _get_record( self, record_no ):
+        """Decode a record."""
+        _, _, caption_offset, caption_len, page_no, xpos, ypos, flags = _RECORD.unpack_from(
+            self._buf, self._offset + record_no*_RECORD.size
+        )
+        record = {}
+        if flags & _HAS_CAPTION:
+            record[ "caption" ] = self._get_string( caption_offset, caption_len )
+        if flags & _HAS_PAGE_NO:
+            record[ "page_no" ] = page_no
+        if flags & _HAS_POS:
+            record[ "pos" ] = [ xpos, ypos ]
+        return record
+
+    def _get_bytes( self, offset, length ):
+        """Get the raw bytes for a string."""
+        offset += self._strings_base
+        return self._buf[ offset : offset+length ]
+
+    def _get_string( self, offset, length ):
+        """Get a string."""
+        return self._get_bytes( offset, length ).decode( "utf-8" )
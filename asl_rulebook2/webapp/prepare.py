@@ -1,6 +1,9 @@
 """ Analyze the MMP eASLRB PDF and prepare the data files. """
 
+import os
 import zipfile
+import tempfile
+import json
 import io
 import base64
 import traceback
@@ -8,10 +11,6 @@ import logging
 
 from flask import request, send_file, abort, url_for
 
-from asl_rulebook2.extract.all import ExtractAll
-from asl_rulebook2.bin.prepare_pdf import prepare_pdf
-from asl_rulebook2.bin.fixup_mmp_pdf import fixup_mmp_pdf
-from asl_rulebook2.pdf import PdfDoc
 from asl_rulebook2.utils import TempFile
 from asl_rulebook2.webapp import app, globvars
 from asl_rulebook2.webapp.utils import get_gs_path
@@ -74,6 +73,14 @@ def _do_prepare_data_files( args, download_url ):
             on_done( fp.read() )
         return
 
+    # NOTE: The PDF toolchain (pdfminer, pikepdf, etc.) takes a while to import, and uses a fair bit of memory,
+    # but it's only needed here, and a configured server will never prepare the data files, so we don't
+    # import it until it's actually needed.
+    from asl_rulebook2.extract.all import ExtractAll
+    from asl_rulebook2.bin.prepare_pdf import prepare_pdf
+    from asl_rulebook2.bin.fixup_mmp_pdf import fixup_mmp_pdf
+    from asl_rulebook2.pdf import PdfDoc
+
     with TempFile() as input_file, TempFile() as prepared_file:
 
         # save the PDF file data
@@ -163,16 +170,14 @@ def _do_prepare_data_files( args, download_url ):
             with open( fixedup_file.name, "rb" ) as fp:
                 pdf_data = fp.read()
 
+            # split the PDF into chapters
+            chapter_pdfs = {}
+            if app.config.get( "PREPARE_CHAPTER_PDFS" ):
+                chapter_pdfs = _split_chapter_pdfs( fixedup_file.name, file_data, log_msg )
+
     # prepare the ZIP for the user to download
     log_msg( "status", "Preparing the download ZIP..." )
-    zip_data = io.BytesIO()
-    with zipfile.ZipFile( zip_data, "w", zipfile.ZIP_DEFLATED ) as zip_file:
-        fname_stem = "ASL Rulebook"
-        zip_file.writestr( fname_stem+".pdf", pdf_data )
-        for key in file_data:
-            fname = "{}.{}".format( fname_stem, key )
-            zip_file.writestr( fname, file_data[key] )
-    zip_data = zip_data.getvalue()
+    zip_data = _make_download_zip( pdf_data, file_data, chapter_pdfs )
 
     # notify the front-end that we're done
     on_done( zip_data )
@@ -183,6 +188,40 @@ def _do_prepare_data_files( args, download_url ):
     # NOTE: We don't bother shutting down the socketio server, since the user
     # has to restart the server, using the newly-prepared data files.
 
+def _make_download_zip( pdf_data, file_data, chapter_pdfs ):
+    """Generate the ZIP file containing the prepared data files."""
+    zip_data = io.BytesIO()
+    with zipfile.ZipFile( zip_data, "w", zipfile.ZIP_DEFLATED ) as zip_file:
+        fname_stem = "ASL Rulebook"
+        zip_file.writestr( fname_stem+".pdf", pdf_data )
+        for key in file_data:
+            fname = "{}.{}".format( fname_stem, key )
+            zip_file.writestr( fname, file_data[key] )
+        for fname, data in chapter_pdfs.items():
+            zip_file.writestr( fname, data )
+    return zip_data.getvalue()
+
+def _split_chapter_pdfs( pdf_fname, file_data, log_msg ):
+    """Split the prepared PDF into a separate file for each chapter.
+
+    The chapter manifest is added to the data files, and the chapter PDF's are returned (keyed by filename).
+    """
+    from asl_rulebook2.bin.split_pdf_chapters import split_pdf_chapters
+    log_msg( "status", "Splitting the PDF into chapters..." )
+    chapter_pdfs = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manifest = split_pdf_chapters( pdf_fname,
+            json.loads( file_data["chapters"] ), json.loads( file_data["targets"] ),
+            temp_dir, "ASL Rulebook",
+            log_msg,
+            relinq = _relinq
+        )
+        for chapter in manifest.values():
+            with open( os.path.join( temp_dir, chapter["fname"] ), "rb" ) as fp:
+                chapter_pdfs[ chapter["fname"] ] = fp.read()
+    file_data[ "chapter-pdfs" ] = json.dumps( manifest, indent=2 )
+    return chapter_pdfs
+
 def _relinq( msg=None, delay=0 ): #pylint: disable=unused-argument
     """Relinquish the CPU (to keep the webapp server responsive)."""
     globvars.socketio_server.sleep( delay )
@@ -0,0 +1,176 @@
+""" Compact record types for the rule data that is held in memory. """
+
+import sys
+from collections.abc import Mapping, MutableMapping
+
+from flask.json import JSONEncoder
+
+# ---------------------------------------------------------------------
+
+class Record( MutableMapping ):
+    """Base class for records that are held in memory for the life of the process.
+
+    We load a lot of small objects from the data files (index entries, Q+A entries, annotations, etc.),
+    and keep them around for as long as the webapp is running. As dicts, each one carries a hash table,
+    so we store them in objects with __slots__ instead, but they still behave like dicts, so that
+    the code that uses them doesn't need to care. Any keys that aren't known fields are stored
+    in a separate dict (which is only created if it's needed).
+    """
+
+    __slots__ = ( "_extras", )
+    _FIELDS = ()
+    _FIELD_SET = frozenset()
+    _RULEID_FIELDS = frozenset()
+
+    def __init_subclass__( cls, **kwargs ):
+        super().__init_subclass__( **kwargs )
+        cls._FIELDS = tuple( cls.__slots__ )
+        cls._FIELD_SET = frozenset( cls._FIELDS )
+
+    def __init__( self, vals=None ):
+        self._extras = None
+        if vals:
+            for key, val in vals.items():
+                self[ key ] = val
+
+    @classmethod
+    def from_json( cls, vals ):
+        """Create a record from data loaded from a JSON file."""
+        return cls( vals )
+
+    def __getitem__( self, key ):
+        if key in self._FIELD_SET:
+            try:
+                return getattr( self, key )
+            except AttributeError:
+                raise KeyError( key ) from None
+        if self._extras and key in self._extras:
+            return self._extras[ key ]
+        raise KeyError( key )
+
+    def __setitem__( self, key, val ):
+        if key in self._RULEID_FIELDS:
+            val = _intern_ruleids( val )
+        if key in self._FIELD_SET:
+            setattr( self, key, val )
+        else:
+            if self._extras is None:
+                self._extras = {}
+            self._extras[ key ] = val
+
+    def __delitem__( self, key ):
+        if key in self._FIELD_SET:
+            try:
+                delattr( self, key )
+            except AttributeError:
+                raise KeyError( key ) from None
+        elif self._extras and key in self._extras:
+            del self._extras[ key ]
+        else:
+            raise KeyError( key )
+
+    def __iter__( self ):
+        for key in self._FIELDS:
+            if hasattr( self, key ):
+                yield key
+        if self._extras:
+            yield from self._extras
+
+    def __len__( self ):
+        return sum( 1 for _ in self )
+
+    def __repr__( self ):
+        return "{}({})".format( self.__class__.__name__, dict( self.items() ) )
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class IndexEntry( Record ):
+    """An entry in a content set's index."""
+    __slots__ = ( "title", "subtitle", "content", "ruleids", "rulerefs", "see_also", "_fts_rowid" )
+    _RULEID_FIELDS = frozenset( [ "ruleids" ] )
+
+    @classmethod
+    def from_json( cls, vals ):
+        entry = cls( vals )
+        if "rulerefs" in entry:
+            entry[ "rulerefs" ] = [ RuleRef.from_json( r ) for r in entry["rulerefs"] ]
+        return entry
+
+class RuleRef( Record ):
+    """A rule reference in an index entry."""
+    __slots__ = ( "caption", "ruleids" )
+    _RULEID_FIELDS = frozenset( [ "ruleids" ] )
+
+class QAEntry( Record ):
+    """A Q+A entry."""
+    __slots__ = ( "caption", "ruleids", "content", "_fts_rowid" )
+    _RULEID_FIELDS = frozenset( [ "ruleids" ] )
+
+class Annotation( Record ):
+    """An annotation (either errata, or user-defined)."""
+    __slots__ = ( "ruleid", "content", "source", "_fts_rowid" )
+    _RULEID_FIELDS = frozenset( [ "ruleid" ] )
+
+class Target( Record ):
+    """A target in a content doc."""
+    __slots__ = ( "caption", "page_no", "pos" )
+
+class Footnote( Record ):
+    """A footnote in a content doc."""
+    __slots__ = ( "captions", "content", "display_name" )
+
+    @classmethod
+    def from_json( cls, vals ):
+        footnote = cls( vals )
+        if "captions" in footnote:
+            footnote[ "captions" ] = [ FootnoteCaption.from_json( c ) for c in footnote["captions"] ]
+        return footnote
+
+class FootnoteCaption( Record ):
+    """A caption in a footnote."""
+    __slots__ = ( "caption", "ruleid" )
+    _RULEID_FIELDS = frozenset( [ "ruleid" ] )
+
+# ---------------------------------------------------------------------
+
+def make_records( cls, vals ):
+    """Create records from a list of values loaded from a JSON file."""
+    return [
+        cls.from_json( v ) if isinstance( v, dict ) else v
+        for v in vals
+    ]
+
+def make_record_index( cls, vals ):
+    """Create records from a dict of values loaded from a JSON file (the keys are ruleid's)."""
+    return {
+        sys.intern( key ): cls.from_json( v ) if isinstance( v, dict ) else v
+        for key, v in vals.items()
+    }
+
+def to_json( val ):
+    """Convert a value (that may contain records) to plain objects that can be returned as JSON.
+
+    This always returns a new copy of the value, so the caller can change it without affecting the original.
+    """
+    if isinstance( val, Mapping ):
+        return { k: to_json( v ) for k, v in val.items() }
+    if isinstance( val, ( list, tuple ) ):
+        return [ to_json( v ) for v in val ]
+    return val
+
+def _intern_ruleids( val ):
+    """Intern ruleid's (there are only so many of them, but they are referenced from many places)."""
+    if isinstance( val, str ):
+        return sys.intern( val )
+    if isinstance( val, list ):
+        return [ sys.intern( v ) if isinstance( v, str ) else v for v in val ]
+    return val
+
+# ---------------------------------------------------------------------
+
+class RecordJSONEncoder( JSONEncoder ):
+    """Encode records as JSON."""
+    def default( self, o ): #pylint: disable=method-hidden
+        if isinstance( o, Mapping ):
+            return dict( o.items() )
+        return super().default( o )
@@ -0,0 +1,120 @@
+""" Reload data files when they change. """
+
+import os
+import threading
+import logging
+
+from asl_rulebook2.webapp import app, shutdown_event
+from asl_rulebook2.webapp.utils import walk_data_dir, get_cache_paths, parse_int
+
+_watcher_thread = None
+_pending_reloads = set()
+_pending_reloads_lock = threading.Lock()
+
+_logger = logging.getLogger( "reload" )
+
+# ---------------------------------------------------------------------
+
+def init_data_watcher():
+    """Start watching the data directory for changes."""
+
+    # NOTE: The watcher thread only notices which files have changed, and which subsystems need to be reloaded.
+    # The reload itself is done at the start of the next request (see apply_pending_reloads()), since we need
+    # a request context to be able to reload things, and it also gives us a convenient point at which
+    # to swap in the new data (see startup.apply_pending_reloads()).
+
+    # check if the data directory should be watched
+    global _watcher_thread
+    poll_interval = parse_int( app.config.get( "WATCH_DATA_DIR" ), 0 )
+    if poll_interval <= 0:
+        return
+    if _watcher_thread:
+        return # nb: the watcher thread is already running
+
+    # start the watcher thread
+    _logger.info( "Watching the data directory for changes (poll interval = %ds).", poll_interval )
+    _watcher_thread = threading.Thread( target=_watch_data_dir, args=(poll_interval,), daemon=True )
+    _watcher_thread.start()
+
+def _watch_data_dir( poll_interval ):
+    """Watch the data directory for changes."""
+
+    prev_data_dir, prev_snapshot, next_snapshot = None, None, None
+    while not shutdown_event.wait( poll_interval ):
+
+        # get the current state of the data directory
+        data_dir = app.config.get( "DATA_DIR" )
+        if not data_dir or not os.path.isdir( data_dir ):
+            prev_data_dir, prev_snapshot, next_snapshot = None, None, None
+            continue
+        try:
+            snapshot = _make_snapshot( data_dir, get_cache_paths() )
+        except OSError as ex:
+            # NOTE: This can happen if files are being changed while we scan the directory.
+            _logger.debug( "Couldn't scan the data directory: %s", ex )
+            continue
+        if data_dir != prev_data_dir or prev_snapshot is None:
+            # this is the first scan of this data directory - just remember what's there
+            prev_data_dir, prev_snapshot, next_snapshot = data_dir, snapshot, None
+            continue
+
+        # check if anything has changed
+        if snapshot == prev_snapshot:
+            next_snapshot = None
+            continue
+        # NOTE: We wait until the files stop changing (e.g. while a large file is being copied in),
+        # so that we don't reload things in the middle of an update.
+        if snapshot != next_snapshot:
+            next_snapshot = snapshot
+            continue
+
+        # figure out which subsystems need to be reloaded
+        subsystems = set()
+        for path in set( prev_snapshot.keys() ) | set( snapshot.keys() ):
+            if prev_snapshot.get( path ) != snapshot.get( path ):
+                _logger.debug( "- Data file changed: %s", path )
+                subsystems.add( _get_subsystem( path ) )
+        _logger.info( "Data files have changed, flagging reload: %s", " ; ".join( sorted( subsystems ) ) )
+        flag_pending_reloads( subsystems )
+        prev_snapshot, next_snapshot = snapshot, None
+
+def _make_snapshot( data_dir, skip_paths ):
+    """Get the stat info for every file in the data directory."""
+    # NOTE: We ignore any caches that have been configured inside the data directory, since they get updated
+    # when things are reloaded, which would then look like the data files have changed again.
+    snapshot = {}
+    for fname in walk_data_dir( data_dir, skip_paths ):
+        st = os.stat( fname )
+        snapshot[ os.path.relpath( fname, data_dir ) ] = ( st.st_size, st.st_mtime_ns, st.st_ino )
+    return snapshot
+
+def _get_subsystem( path ):
+    """Figure out which subsystem a data file belongs to."""
+    parts = path.split( os.sep )
+    if parts[0] == "q+a":
+        return "qa"
+    if parts[0] == "errata":
+        return "errata"
+    if parts[0] == "asop":
+        return "asop"
+    if len(parts) == 1:
+        if path == "annotations.json":
+            return "user-anno"
+        if path.startswith( "search-" ) and os.path.splitext( path )[1] == ".json":
+            return "search-config"
+    # NOTE: Anything else is assumed to be part of a content set.
+    return "content"
+
+# ---------------------------------------------------------------------
+
+def get_pending_reloads():
+    """Get the subsystems whose data files have changed (and clear the list)."""
+    with _pending_reloads_lock:
+        subsystems = set( _pending_reloads )
+        _pending_reloads.clear()
+    return subsystems
+
+def flag_pending_reloads( subsystems ):
+    """Flag subsystems as needing to be reloaded."""
+    with _pending_reloads_lock:
+        _pending_reloads.update( subsystems )
@@ -2,114 +2,123 @@
 
 import os
 import glob
-import re
-import copy
+import json
+import hashlib
+import threading
 import logging
 from collections import defaultdict
 
-from flask import jsonify, send_from_directory, abort
+from flask import request, Response, send_from_directory, send_file, safe_join, abort
 
 from asl_rulebook2.utils import plural
 from asl_rulebook2.webapp import app
-from asl_rulebook2.webapp.utils import load_data_file
+from asl_rulebook2.webapp.utils import load_data_file, load_data_files, parse_int
+from asl_rulebook2.webapp.fixups import Fixups
+from asl_rulebook2.webapp.thumbnails import parse_thumbnail_size, get_thumbnail
+from asl_rulebook2.webapp.records import QAEntry, Annotation, make_records, to_json
 
 _qa_index = None
 _qa_images_dir = None
 _errata = None
 _user_anno = None
 
+_rule_info_counts = {}
+_rule_info_counts_json = None
+_rule_info_cache = {}
+_rule_info_cache_lock = threading.Lock()
+
 # ---------------------------------------------------------------------
 
 def init_qa( startup_msgs, logger ):
     """Initialize the Q+A."""
 
     # initialize
+    # NOTE: We build everything in local variables, then install them at the end, so that if we are
+    # being reloaded, requests being handled in the meantime will see either the old or new Q+A.
     global _qa_index, _qa_images_dir
-    _qa_index, _qa_images_dir = {}, None
+    qa_index = {}
 
     # get the data directory
     data_dir = app.config.get( "DATA_DIR" )
     if not data_dir:
+        _qa_index, _qa_images_dir = {}, None
+        _update_rule_info_counts( "qa", _qa_index )
         return None, None
     base_dir = os.path.join( data_dir, "q+a" )
-    _qa_images_dir = os.path.abspath( os.path.join( base_dir, "images" ) )
 
-    qa = {}
-    def load_qa( fname ):
-        """Load the Q+A entries from a data file."""
+    # load the Q+A fixups and sources
+    # NOTE: We load these first, so that we can apply them to each Q+A entry as it is loaded.
+    fixups = _load_fixups( base_dir, "Q+A", startup_msgs, logger )
+    sources = _load_sources( base_dir, "Q+A", startup_msgs, logger )
+    usage, unknown = defaultdict(int), set()
+
+    def fixup_qa_entry( qa_entry ):
+        """Apply the fixups to a Q+A entry, and resolve its sources."""
+        for content in qa_entry.get( "content", [] ):
+            if fixups and "question" in content:
+                content["question"] = fixups( content["question"] )
+            for answer in content.get( "answers", [] ):
+                if fixups:
+                    answer[0] = fixups( answer[0] )
+                if sources:
+                    source = answer[1]
+                    usage[ source ] += 1
+                    source_name = sources.get( source )
+                    if source_name:
+                        answer[1] = source_name
+                    else:
+                        unknown.add( source )
+
+    # load the Q+A entries
+    # NOTE: The files are loaded in parallel, but processed in order. Entries are grouped by key (in the order
+    # each key was first seen), then by file, so we remember each key's rank, and sort each ruleid's entries
+    # by it at the end (if they came from more than one file).
+    qa, key_ranks = {}, {}
+    qa_fnames = [
+        fname for fname in sorted( glob.glob( os.path.join( base_dir, "*.json" ) ) )
+        if os.path.basename( fname ) not in ("sources.json", "fixups.json")
+    ]
+    for fname in qa_fnames:
         logger.info( "Loading Q+A: %s", fname )
-        qa_entries = load_data_file( fname, "Q+A", "json", logger, startup_msgs.warning )
+    all_qa_entries = load_data_files( qa_fnames, "Q+A", "json", logger, startup_msgs.warning )
+    for fname, qa_entries in zip( qa_fnames, all_qa_entries ):
         if qa_entries is None:
-            return
+            continue
+        n = 0
         for key, entries in qa_entries.items():
+            entries = make_records( QAEntry, entries )
+            key_rank = key_ranks.setdefault( key, len(key_ranks) )
+            for qa_entry in entries:
+                fixup_qa_entry( qa_entry )
+                for ruleid in qa_entry.get( "ruleids", [] ):
+                    if ruleid in qa_index:
+                        qa_index[ ruleid ].append( ( key_rank, qa_entry ) )
+                    else:
+                        qa_index[ ruleid ] = [ ( key_rank, qa_entry ) ]
             if key in qa:
                 qa[ key ].extend( entries )
             else:
                 qa[ key ] = entries
-        n = sum( len(v) for v in qa_entries.values() )
-        logger.info( "- Loaded %s.", plural(n,"entry","entries") )
-
-    # load the Q+A entries
-    qa_fnames = []
-    fspec = os.path.join( base_dir, "*.json" )
-    for fname in sorted( glob.glob( fspec ) ):
-        if os.path.basename( fname ) in ("sources.json", "fixups.json"):
-            continue
-        load_qa( fname )
-        qa_fnames.append( fname )
-
-    # build an index of the Q+A entries
-    for qa_entries in qa.values():
-        for qa_entry in qa_entries:
-            for ruleid in qa_entry.get( "ruleids", [] ):
-                if ruleid in _qa_index:
-                    _qa_index[ ruleid ].append( qa_entry )
-                else:
-                    _qa_index[ ruleid ] = [ qa_entry ]
-
-    # fixup the Q+A content
-    fname = os.path.join( base_dir, "fixups.json" )
-    if os.path.isfile( fname ):
-        logger.info( "Loading Q+A fixups: %s", fname )
-        fixups = load_data_file( fname, "fixups", "json", logger, startup_msgs.warning )
-        if fixups:
-            for qa_entries in qa.values():
-                for qa_entry in qa_entries:
-                    for content in qa_entry.get( "content", [] ):
-                        if "question" in content:
-                            content["question"] = _apply_fixups( content["question"], fixups )
-                        for answer in content.get( "answers", [] ):
-                            answer[0] = _apply_fixups( answer[0], fixups )
-
-    # load the Q+A sources
-    sources = {}
-    fname = os.path.join( base_dir, "sources.json" )
-    if os.path.isfile( fname ):
-        logger.info( "Loading Q+A sources: %s", fname )
-        sources = load_data_file( fname, "sources", "json", logger, startup_msgs.warning )
-        if sources:
-            logger.info( "- Loaded %s.", plural(len(sources),"source","sources") )
-
-    # fix up all the Q+A entries with their real source
-    if sources:
-        usage, unknown = defaultdict(int), set()
-        for qa_entries in qa.values():
-            for qa_entry in qa_entries:
-                for content in qa_entry.get( "content", [] ):
-                    for answer in content.get( "answers", [] ):
-                        source = answer[1]
-                        usage[ source ] += 1
-                        source_name = sources.get( source )
-                        if source_name:
-                            answer[1] = source_name
-                        else:
-                            unknown.add( source )
-        if unknown:
-            logger.warning( "Unknown Q+A sources: %s", " ; ".join(unknown) )
-        if logger.isEnabledFor( logging.DEBUG ):
-            usage = sorted( usage.items(), key=lambda v: v[1], reverse=True )
-            for u in usage:
-                logger.debug( "-   %s (%s) = %d", sources.get(u[0],"???"), u[0], u[1] )
+            n += len( entries )
+        logger.info( "- Loaded %s (%s).", plural(n,"entry","entries"), os.path.basename(fname) )
+    multiple_files = len(qa_fnames) > 1
+    for ruleid, entries in qa_index.items():
+        if multiple_files:
+            entries.sort( key=lambda e: e[0] ) # nb: this is a stable sort
+        qa_index[ ruleid ] = [ e[1] for e in entries ]
+
+    # report on the Q+A sources
+    if unknown:
+        logger.warning( "Unknown Q+A sources: %s", " ; ".join(unknown) )
+    if sources and logger.isEnabledFor( logging.DEBUG ):
+        usage = sorted( usage.items(), key=lambda v: v[1], reverse=True )
+        for u in usage:
+            logger.debug( "-   %s (%s) = %d", sources.get(u[0],"???"), u[0], u[1] )
+
+    # install the new Q+A
+    _qa_index = qa_index
+    _qa_images_dir = os.path.abspath( os.path.join( base_dir, "images" ) )
+    _update_rule_info_counts( "qa", qa_index )
 
     return qa, qa_fnames
 
@@ -120,20 +129,26 @@ def init_annotations( startup_msgs, logger ):
 
     # initialize
     global _user_anno
-    _user_anno = {}
+    user_anno = {}
 
     # get the data directory
     data_dir = app.config.get( "DATA_DIR" )
     if not data_dir:
+        _user_anno = user_anno
+        _update_rule_info_counts( "user-anno", user_anno )
         return None, None
 
     # load the user-defined annotations
     fname = os.path.join( data_dir, "annotations.json" )
     if os.path.isfile( fname ):
-        _load_anno( fname, "annotations", _user_anno, logger, startup_msgs )
+        _load_anno( fname, "annotations", user_anno, logger, startup_msgs )
     else:
         fname = None
 
+    # install the new annotations
+    _user_anno = user_anno
+    _update_rule_info_counts( "user-anno", user_anno )
+
     return _user_anno, fname
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -147,47 +162,43 @@ def init_errata( startup_msgs, logger ):
 
     # initialize
     global _errata
-    _errata = {}
+    errata = {}
 
     # get the data directory
     data_dir = app.config.get( "DATA_DIR" )
     if not data_dir:
+        _errata = errata
+        _update_rule_info_counts( "errata", errata )
         return None, None
     base_dir = os.path.join( data_dir, "errata" )
 
-    # load the errata
-    errata_fnames = []
-    fspec = os.path.join( base_dir, "*.json" )
-    for fname in sorted( glob.glob( fspec ) ):
-        if os.path.basename( fname ) in ("sources.json", "fixups.json"):
-            continue
-        _load_anno( fname, "errata", _errata, logger, startup_msgs )
-        errata_fnames.append( fname )
+    # load the errata fixups and sources
+    # NOTE: We load these first, so that we can apply them to each erratum as it is loaded.
+    fixups = _load_fixups( base_dir, "errata", startup_msgs, logger )
+    sources = _load_sources( base_dir, "errata", startup_msgs, logger )
 
-    # apply any fixups
-    fname = os.path.join( base_dir, "fixups.json" )
-    if os.path.isfile( fname ):
-        logger.info( "Loading errata fixups: %s", fname )
-        fixups = load_data_file( fname, "fixups", "json", logger, startup_msgs.warning )
-        if fixups:
-            for ruleid in _errata:
-                for anno in _errata[ruleid]:
-                    anno["content"] = _apply_fixups( anno["content"], fixups )
-
-    # load the errata sources
-    sources = {}
-    fname = os.path.join( base_dir, "sources.json" )
-    if os.path.isfile( fname ):
-        logger.info( "Loading errata sources: %s", fname )
-        sources = load_data_file( fname, "sources", "json", logger, startup_msgs.warning )
-        if sources:
-            logger.info( "- Loaded %s.", plural(len(sources),"source","sources") )
+    def fixup_anno( anno ):
+        """Apply the fixups to an erratum, and resolve its source."""
+        if fixups and "content" in anno:
+            anno["content"] = fixups( anno["content"] )
+        if "source" in anno:
+            anno["source"] = sources.get( anno["source"], anno["source"] )
 
-    # fixup all the errata entries with their real source
-    for ruleid in _errata:
-        for anno in _errata[ruleid]:
-            if "source" in anno:
-                anno["source"] = sources.get( anno["source"], anno["source"] )
+    # load the errata
+    errata_fnames = [
+        fname for fname in sorted( glob.glob( os.path.join( base_dir, "*.json" ) ) )
+        if os.path.basename( fname ) not in ("sources.json", "fixups.json")
+    ]
+    for fname in errata_fnames:
+        logger.info( "Loading errata: %s", fname )
+    all_anno_entries = load_data_files( errata_fnames, "errata", "json", logger, startup_msgs.warning )
+    for anno_entries in all_anno_entries:
+        if anno_entries:
+            _add_anno( anno_entries, errata, fixup_anno )
+
+    # install the new errata
+    _errata = errata
+    _update_rule_info_counts( "errata", errata )
 
     return _errata, errata_fnames
 
@@ -199,36 +210,143 @@ def _load_anno( fname, atype, save_loc, logger, startup_msgs ):
     anno_entries = load_data_file( fname, atype, "json", logger, startup_msgs.warning )
     if not anno_entries:
         return
-    for anno in anno_entries:
+    _add_anno( anno_entries, save_loc )
+
+def _add_anno( anno_entries, save_loc, fixup_anno=None ):
+    """Add annotations loaded from a data file."""
+    for anno in make_records( Annotation, anno_entries ):
+        if fixup_anno:
+            fixup_anno( anno )
         if anno["ruleid"] in save_loc:
             save_loc[ anno["ruleid"] ].append( anno )
         else:
             save_loc[ anno["ruleid"] ] = [ anno ]
 
-# ---------------------------------------------------------------------
-
-def _apply_fixups( val, fixups ):
-    """Apply used-defined fixups to a value."""
-    for search_for, replace_with in fixups.get( "replace", {} ).items():
-        val = val.replace( search_for, replace_with )
-    val = re.sub( r"\[EXC: .*?\]", r"<span class='exc'>\g<0></span>", val )
-    return val
+def _load_fixups( base_dir, caption, startup_msgs, logger ):
+    """Load the fixups for Q+A or errata."""
+    fname = os.path.join( base_dir, "fixups.json" )
+    if not os.path.isfile( fname ):
+        return None
+    logger.info( "Loading %s fixups: %s", caption, fname )
+    fixups = load_data_file( fname, "fixups", "json", logger, startup_msgs.warning )
+    if not fixups:
+        return None
+    return Fixups( fixups )
+
+def _load_sources( base_dir, caption, startup_msgs, logger ):
+    """Load the sources for Q+A or errata."""
+    fname = os.path.join( base_dir, "sources.json" )
+    if not os.path.isfile( fname ):
+        return {}
+    logger.info( "Loading %s sources: %s", caption, fname )
+    sources = load_data_file( fname, "sources", "json", logger, startup_msgs.warning )
+    if sources:
+        logger.info( "- Loaded %s.", plural(len(sources),"source","sources") )
+    return sources or {}
+
+def _update_rule_info_counts( ri_type, index ):
+    """Update the number of Q+A entries/errata/annotations there are for each ruleid."""
+    # NOTE: This lets the front-end know which ruleid's have rule info, without having to ask for each one.
+    global _rule_info_counts_json
+    counts = {}
+    for ruleid, entries in index.items():
+        if isinstance( ruleid, str ) and entries:
+            ruleid = ruleid.upper()
+            counts[ ruleid ] = counts.get( ruleid, 0 ) + len( entries )
+    _rule_info_counts[ ri_type ] = counts
+    _rule_info_counts_json = None
+    flush_rule_info_cache()
 
 # ---------------------------------------------------------------------
 
 @app.route( "/rule-info/<ruleid>" )
 def get_rule_info( ruleid ):
     """Get the Q+A and annotations for the specified ruleid."""
+    return Response( _get_rule_info_json( ruleid ), mimetype="application/json" )
+
+@app.route( "/rule-info-counts" )
+def get_rule_info_counts():
+    """Get the number of Q+A entries, errata and annotations for each ruleid."""
+    global _rule_info_counts_json
+    data = _rule_info_counts_json
+    if data is None:
+        counts = defaultdict( dict )
+        for ri_type in ( "user-anno", "errata", "qa" ):
+            for ruleid, n in _rule_info_counts.get( ri_type, {} ).items():
+                counts[ ruleid ][ ri_type ] = n
+        data = _rule_info_counts_json = json.dumps( counts, separators=(",",":"), sort_keys=True ).encode( "utf-8" )
+    resp = Response( data, mimetype="application/json" )
+    resp.set_etag( hashlib.md5( data ).hexdigest() )
+    resp.cache_control.no_cache = True
+    return resp.make_conditional( request )
+
+@app.route( "/rule-info" )
+def get_rule_info_batch():
+    """Get the Q+A and annotations for multiple ruleid's."""
+    # NOTE: We return a dict, keyed by ruleid. Ruleid's that have no Q+A or annotations are left out.
+    ruleids = [ r.strip() for r in request.args.get( "ruleids", "" ).split( "," ) ]
+    buf, seen = [], set()
+    for ruleid in ruleids:
+        if not ruleid or ruleid in seen:
+            continue
+        seen.add( ruleid )
+        rule_info = _get_rule_info_json( ruleid )
+        if rule_info != b"[]":
+            buf.append( json.dumps( ruleid ).encode( "utf-8" ) + b":" + rule_info )
+    return Response( b"{" + b",".join( buf ) + b"}", mimetype="application/json" )
+
+def _get_rule_info_json( ruleid ):
+    """Get the Q+A and annotations for the specified ruleid, as JSON."""
+
+    # NOTE: Generating the response means copying every entry for the ruleid (so that we can add the ri_type),
+    # so we only do this once for each ruleid, and cache the result. Entries can be changed by the startup tasks
+    # (when they fixup the content), but they call invalidate_rule_info() after each change, and since both
+    # that and the code below hold the lock, we can never cache a response that was built from old content.
+    ruleid = ruleid.upper()
+    rule_info = _rule_info_cache.get( ruleid )
+    if rule_info is not None:
+        return rule_info
+    with _rule_info_cache_lock:
+        rule_info = _rule_info_cache.get( ruleid )
+        if rule_info is None:
+            rule_info = _rule_info_cache[ ruleid ] = _make_rule_info_json( ruleid )
+    return rule_info
+
+def _make_rule_info_json( ruleid ):
+    """Generate the Q+A and annotations for the specified ruleid, as JSON."""
     results = []
     def get_entries( index, ri_type ):
-        for entry in index.get( ruleid.upper(), [] ):
-            entry = copy.deepcopy( entry )
+        for entry in ( index or {} ).get( ruleid, [] ):
+            entry = to_json( entry ) # nb: this also makes a copy of the entry
             entry[ "ri_type" ] = ri_type
             results.append( entry )
     get_entries( _user_anno, "user-anno" )
     get_entries( _errata, "errata" )
     get_entries( _qa_index, "qa" )
-    return jsonify( results )
+    return json.dumps( results, separators=(",",":") ).encode( "utf-8" )
+
+def precompute_rule_info():
+    """Generate the responses for every ruleid that has Q+A or annotations."""
+    ruleids = set()
+    for index in ( _user_anno, _errata, _qa_index ):
+        ruleids.update( r.upper() for r in ( index or {} ) if isinstance( r, str ) )
+    for ruleid in ruleids:
+        _get_rule_info_json( ruleid )
+    return plural( len(ruleids), "ruleid", "ruleids" )
+
+def invalidate_rule_info( entry ):
+    """Discard the cached responses for a Q+A entry or annotation (after it has been changed)."""
+    ruleids = entry.get( "ruleids" ) or []
+    if entry.get( "ruleid" ):
+        ruleids = ruleids + [ entry["ruleid"] ]
+    with _rule_info_cache_lock:
+        for ruleid in ruleids:
+            _rule_info_cache.pop( ruleid.upper(), None )
+
+def flush_rule_info_cache():
+    """Discard all the cached responses."""
+    with _rule_info_cache_lock:
+        _rule_info_cache.clear()
 
 # ---------------------------------------------------------------------
 
@@ -237,4 +355,25 @@ def get_qa_image( fname ):
     """Get an image that is part of a Q+A entry."""
     if not _qa_images_dir:
         abort( 404 )
-    return send_from_directory( _qa_images_dir, fname )
+    return send_from_directory( _qa_images_dir, fname,
+        cache_timeout = _get_qa_image_max_age()
+    )
+
+@app.route( "/qa/thumbnail/<size>/<fname>" )
+def get_qa_thumbnail( size, fname ):
+    """Get a smaller version of an image that is part of a Q+A entry."""
+    # NOTE: Q+A images are shown quite small, so there's no point sending the full-size image
+    # (unless the user zooms in on it).
+    if not _qa_images_dir:
+        abort( 404 )
+    size = parse_thumbnail_size( size )
+    fname = safe_join( _qa_images_dir, fname )
+    if not size or not fname or not os.path.isfile( fname ):
+        abort( 404 )
+    fname = get_thumbnail( fname, size[0], size[1] )
+    return send_file( fname, conditional=True, cache_timeout=_get_qa_image_max_age() )
+
+def _get_qa_image_max_age():
+    """Get how long the browser can cache Q+A images for."""
+    # NOTE: The browser will still check with us (using the ETag) after this time, so it can be quite long.
+    return parse_int( app.config.get( "QA_IMAGE_MAX_AGE" ), 24*60*60 )
@@ -0,0 +1,106 @@
+""" Find known ruleid's in a piece of content. """
+
+# ---------------------------------------------------------------------
+
+class RuleidMatcher:
+    """Find known ruleid's in a piece of content, in a single pass.
+
+    We used to look for each ruleid with its own regex, but this meant scanning the content once for every
+    known ruleid (there are thousands of them), which was the main cost of fixing up content at startup.
+    We now build a trie of the ruleid's, and walk it from each position in the content, which gives
+    exactly the same results as the regex's did i.e. for a ruleid like "A1.23":
+        \\bA1\\.23(-\\.\\d+)?\\b
+    (where underscores in a ruleid match spaces in the content).
+    """
+
+    def __init__( self, ruleids ):
+        self._trie = {}
+        # NOTE: We remember the order in which the ruleid's were added, so that we can break ties
+        # in the same way as before (when the regex's were checked in this order).
+        self._ruleid_order = {}
+        for ruleid in ruleids:
+            if ruleid in self._ruleid_order or not ruleid:
+                continue
+            self._ruleid_order[ ruleid ] = len( self._ruleid_order )
+            node = self._trie
+            for ch in ruleid.replace( "_", " " ):
+                node = node.setdefault( ch, {} )
+            node[ None ] = ruleid # nb: None is used as the key for the ruleid that ends at this node
+
+    def __len__( self ):
+        return len( self._ruleid_order )
+
+    @property
+    def ruleids( self ):
+        """Return the ruleid's being looked for."""
+        return self._ruleid_order.keys()
+
+    def find_matches( self, content ):
+        """Find all the ruleid's in the content.
+
+        Returns a list of ( start, end, ruleid ) tuples, sorted by start position, longer matches first.
+        """
+
+        matches = []
+        last_end = {}
+        trie = self._trie
+        content_len = len( content )
+        for start in range( content_len ):
+
+            # check if a ruleid could start here
+            node = trie.get( content[ start ] )
+            if node is None or not _is_boundary( content, start ):
+                continue
+
+            # walk the trie, looking for ruleid's
+            pos = start + 1
+            while True:
+                ruleid = node.get( None )
+                if ruleid is not None:
+                    end = _match_end( content, pos )
+                    # NOTE: Regex matches for the same ruleid can't overlap.
+                    if end is not None and start >= last_end.get( ruleid, 0 ):
+                        matches.append( ( start, end, ruleid ) )
+                        last_end[ ruleid ] = end
+                if pos >= content_len:
+                    break
+                node = node.get( content[ pos ] )
+                if node is None:
+                    break
+                pos += 1
+
+        # sort the matches by start position, longer matches first
+        matches.sort( key = lambda m: (
+            m[0], m[0]-m[1], self._ruleid_order[ m[2] ]
+        ) )
+        return matches
+
+# ---------------------------------------------------------------------
+
+def _is_word_char( ch ):
+    """Check if a character is a regex word character."""
+    return ch.isalnum() or ch == "_"
+
+def _is_boundary( content, pos ):
+    """Check if there is a regex word boundary (\\b) at the specified position."""
+    before = pos > 0 and _is_word_char( content[ pos-1 ] )
+    after = pos < len(content) and _is_word_char( content[ pos ] )
+    return before != after
+
+def _match_end( content, pos ):
+    """Figure out where a ruleid match ends (or None if it's not a valid match).
+
+    The ruleid itself ends at the specified position, and may be followed by a range e.g. "A1.23-.45".
+    """
+    # check for a range
+    if content.startswith( "-.", pos ):
+        end = pos + 2
+        while end < len(content) and content[ end ].isdecimal():
+            end += 1
+        # NOTE: A regex would backtrack if there is no word boundary after the digits, but there can't be one
+        # between two digits, so it would end up dropping the range altogether.
+        if end > pos+2 and _is_boundary( content, end ):
+            return end
+    if _is_boundary( content, pos ):
+        return pos
+    return None
@@ -11,6 +11,7 @@ import flask_socketio
 import click
 
 from asl_rulebook2.webapp import app, globvars
+from asl_rulebook2.webapp.utils import parse_int
 
 # ---------------------------------------------------------------------
 
@@ -51,7 +52,9 @@ def main( bind_addr, data_dir, force_init_delay, flask_debug ):
     # monitor extra files for changes
     extra_files = []
     fspecs = [ "static/", "templates/", "config/" ]
-    if app.config.get( "DATA_DIR" ):
+    # NOTE: If we are watching the data directory, changes to the data files will be handled by the webapp
+    # (which will only reload what has changed), so we don't need to restart the server.
+    if app.config.get( "DATA_DIR" ) and not parse_int( app.config.get( "WATCH_DATA_DIR" ), 0 ):
         data_dir = app.config["DATA_DIR"]
         fspecs.append( data_dir )
         fspecs.append( os.path.join( data_dir, "annotations.json" ) )
@@ -4,7 +4,6 @@ import os
 import shutil
 import threading
 import sqlite3
-import hashlib
 import io
 import json
 import re
@@ -13,6 +12,7 @@ import string
 import copy
 import time
 import tempfile
+import concurrent.futures
 import logging
 import traceback
 
@@ -21,14 +21,18 @@ import lxml.html
 
 from asl_rulebook2.utils import plural
 from asl_rulebook2.webapp import app
+from asl_rulebook2.webapp.bundle import get_bundled_searchdb
 from asl_rulebook2.webapp import startup as webapp_startup
-from asl_rulebook2.webapp.content import tag_ruleids
-from asl_rulebook2.webapp.utils import make_config_path, make_data_path, split_strip
+from asl_rulebook2.webapp.content import tag_ruleids_batch
+from asl_rulebook2.webapp.rule_info import invalidate_rule_info
+from asl_rulebook2.webapp.records import to_json
+from asl_rulebook2.webapp.utils import make_config_path, make_data_path, hash_file, split_strip, parse_int
 
 _searchdb_fname = None
 _cached_searchdb_fname = None
 _fts_index = None
 _fixup_content_lock = threading.Lock()
+_fixup_tasks = None
 
 _logger = logging.getLogger( "search" )
 
@@ -69,6 +73,10 @@ _NO_QA_QUESTION = "_??_"
 
 _SEARCH_TERM_ADJUSTMENTS = None
 
+# NOTE: Searchable content is fixed up in batches of this many rows, so that we can tag the ruleid's
+# in all of them at once (see tag_ruleids_batch()).
+_FIXUP_BATCH_SIZE = 200
+
 # ---------------------------------------------------------------------
 
 @app.route( "/search", methods=["POST"] )
@@ -177,7 +185,7 @@ def _do_search( args ):
 def _unload_index_sr( row ):
     """Unload an index search result from the database."""
     index_entry = _fts_index["index"][ row[0] ] # nb: our copy of the index entry (must remain unchanged)
-    result = copy.deepcopy( index_entry ) # nb: the index entry we will return to the caller
+    result = to_json( index_entry ) # nb: the index entry we will return to the caller
     result[ "cset_id" ] = row[2]
     _get_result_col( result, "title", row[4] )
     _get_result_col( result, "subtitle", row[5] )
@@ -201,7 +209,7 @@ def _unload_index_sr( row ):
 def _unload_qa_sr( row ):
     """Unload a Q+A search result from the database."""
     qa_entry = _fts_index["qa"][ row[0] ] # nb: our copy of the Q+A entry (must remain unchanged)
-    result = copy.deepcopy( qa_entry ) # nb: the Q+A entry we will return to the caller (will be changed)
+    result = to_json( qa_entry ) # nb: the Q+A entry we will return to the caller (will be changed)
     # replace the content in the Q+A entry we will return to the caller with the values
     # from the search index (which will have search term highlighting)
     if row[4]:
@@ -226,7 +234,7 @@ def _unload_qa_sr( row ):
 def _unload_anno_sr( row, atype ):
     """Unload an annotation search result from the database."""
     anno = _fts_index[atype][ row[0] ] # nb: our copy of the annotation (must remain unchanged)
-    result = copy.deepcopy( anno ) # nb: the annotation we will return to the caller (will be changed)
+    result = to_json( anno ) # nb: the annotation we will return to the caller (will be changed)
     _get_result_col( result, "content", row[6] )
     return result
 
@@ -492,6 +500,49 @@ def init_search( content_sets, #pylint: disable=too-many-arguments
     # load the search config
     load_search_config( startup_msgs, logger )
 
+def reload_searchable_content( logger, qa=None, errata=None, user_anno=None, asop=None ):
+    """Reload searchable content (after its data files have changed).
+
+    Each argument is what was returned by the corresponding init function, or None if that content
+    has not been reloaded.
+    """
+
+    # initialize
+    # NOTE: The rows we add will have different rowid's to what's in the cached database (if any),
+    # so we can't use it any more.
+    global _cached_searchdb_fname, _fixup_tasks
+    _cached_searchdb_fname = None
+    _fixup_tasks = []
+
+    # replace the searchable content
+    # NOTE: We do this inside the lock, and in a single transaction, so that searches will see
+    # either the old or new content. The new content will be fixed up by the startup tasks that
+    # get registered, after which the caller needs to run them.
+    with _fixup_content_lock, sqlite3.connect( _searchdb_fname ) as conn:
+        curs = conn.cursor()
+        def remove_rows( sr_type ):
+            curs.execute( "DELETE FROM searchable WHERE sr_type=?", ( sr_type, ) )
+            _fts_index[ sr_type ] = {}
+        if qa is not None:
+            remove_rows( "qa" )
+            if qa[0]:
+                _init_qa( curs, qa[0], logger )
+        if errata is not None:
+            remove_rows( "errata" )
+            if errata[0]:
+                _init_errata( curs, errata[0], logger )
+        if user_anno is not None:
+            remove_rows( "user-anno" )
+            if user_anno[0]:
+                _init_user_anno( curs, user_anno[0], logger )
+        if asop is not None:
+            remove_rows( "asop-entry" )
+            curs.execute( "DROP TABLE IF EXISTS fixedup_asop_preamble" )
+            curs.execute( "DROP TABLE IF EXISTS fixedup_asop_section" )
+            if asop[0]:
+                _init_asop( curs, asop[0], asop[1], asop[2], logger )
+        conn.commit()
+
 def _init_searchdb( content_sets, #pylint: disable=too-many-arguments
     qa, qa_fnames,
     errata, errata_fnames,
@@ -515,11 +566,15 @@ def _init_searchdb( content_sets, #pylint: disable=too-many-arguments
     #   Banana Pi       17:59   0:08
 
     # check if there is a cached database
-    global _cached_searchdb_fname
+    global _cached_searchdb_fname, _fixup_tasks
     _cached_searchdb_fname = None
-    fname = app.config.get( "CACHED_SEARCHDB" )
+    _fixup_tasks = []
+    # NOTE: If we're using a data bundle, it contains the finished search database, which we use in the same way.
+    bundled_searchdb = get_bundled_searchdb()
+    fname = bundled_searchdb or app.config.get( "CACHED_SEARCHDB" )
     # NOTE: We treat an empty file as being not present since files must exist to be able to mount them
     # into Docker (run-container.sh creates the file if it is being created for this first time).
+    curr_file_hashes = None
     if fname and os.path.isfile( fname ) and os.path.getsize( fname ) > 0:
         # yup - compare the file hashes
         logger.debug( "Checking cached search database: %s", fname )
@@ -529,14 +584,25 @@ def _init_searchdb( content_sets, #pylint: disable=too-many-arguments
             query = curs.execute( "SELECT * from file_hash" )
             old_file_hashes = [ dict(row) for row in query ]
             logger.debug( "- cached hashes:\n%s", _dump_file_hashes( old_file_hashes, prefix="  " ) )
+            # NOTE: We pass in the cached hashes, so that we don't have to re-hash files that haven't changed.
             curr_file_hashes = _make_file_hashes(
-                content_sets, qa_fnames, errata_fnames, user_anno_fname, asop_fnames
+                content_sets, qa_fnames, errata_fnames, user_anno_fname, asop_fnames,
+                prev_file_hashes = old_file_hashes
             )
             logger.debug( "- curr. hashes:\n%s", _dump_file_hashes( curr_file_hashes, prefix="  " ) )
-            if old_file_hashes == curr_file_hashes:
+            if _cmp_file_hashes( old_file_hashes, curr_file_hashes ):
                 # the file hashes are the same - flag that we should use the cached database
                 logger.info( "Using cached search database: %s", fname )
                 _cached_searchdb_fname = fname
+                # NOTE: If any files have been touched (but not changed), we update the stat info
+                # in the cached database, so that we don't have to re-hash them next time.
+                # nb: the data bundle may be mounted read-only, so we never update it
+                if old_file_hashes != curr_file_hashes and not bundled_searchdb:
+                    try:
+                        conn.execute( "DROP TABLE file_hash" )
+                        _save_file_hashes( conn, curr_file_hashes, logger )
+                    except sqlite3.Error as ex:
+                        logger.warning( "Can't update the cached file hashes: %s", ex )
 
     # initialize the database
     if os.path.isfile( _searchdb_fname ):
@@ -567,23 +633,17 @@ def _init_searchdb( content_sets, #pylint: disable=too-many-arguments
     conn.commit()
 
     # save the file hashes
-    logger.info( "Calculating file hashes..." )
-    conn.execute( "CREATE TABLE file_hash ( ftype, fname, hash )" )
-    file_hashes = _make_file_hashes(
-        content_sets, qa_fnames, errata_fnames, user_anno_fname, asop_fnames
-    )
-    for fh in file_hashes:
-        logger.debug( "- %s/%s = %s", fh["ftype"], fh["fname"], fh["hash"] )
-        conn.execute( "INSERT INTO file_hash"
-            " ( ftype, fname, hash )"
-            " VALUES ( :ftype, :fname, :hash )",
-            fh
+    # NOTE: If we checked a cached database, we will have already calculated these.
+    if curr_file_hashes is None:
+        logger.info( "Calculating file hashes..." )
+        curr_file_hashes = _make_file_hashes(
+            content_sets, qa_fnames, errata_fnames, user_anno_fname, asop_fnames
         )
-    conn.commit()
+    _save_file_hashes( conn, curr_file_hashes, logger )
 
     # register a task for post-fixup processing
     fname = app.config.get( "CACHED_SEARCHDB" )
-    if fname:
+    if fname and not bundled_searchdb:
         def on_post_fixup():
             # check if the database was built using the cached version
             if _cached_searchdb_fname:
@@ -598,8 +658,7 @@ def _init_searchdb( content_sets, #pylint: disable=too-many-arguments
                 # I don't think any of these cases apply here, and we can just copy the database file itself.
                 logger.info( "Saving a copy of the search database: %s", fname )
                 shutil.copyfile( _searchdb_fname, fname )
-        from asl_rulebook2.webapp.startup import _add_startup_task
-        _add_startup_task( "post-fixup processing", on_post_fixup )
+        add_post_fixup_task( "post-fixup processing", on_post_fixup )
 
 def _check_searchdb( logger ):
     """Compare the newly-built search database with the cached one."""
@@ -666,14 +725,13 @@ def _init_content_sets( conn, curs, content_sets, logger ):
     assert len(_fts_index[sr_type]) == _get_row_count( conn, "searchable" )
 
     # register a task to fixup the content
-    def fixup_row( rowid, cset_id ):
-        index_entry = _fts_index[ sr_type ][ rowid ]
-        _tag_ruleids_in_field( index_entry, "subtitle", cset_id )
-        _tag_ruleids_in_field( index_entry, "content", cset_id )
-        return index_entry
-    from asl_rulebook2.webapp.startup import _add_startup_task
-    _add_startup_task( "fixup index searchable content",
-        lambda: _fixup_searchable_content( sr_type, fixup_row, make_fields )
+    fixup_rows = _make_fixup_rows( sr_type,
+        lambda index_entry: [ ( index_entry, "subtitle" ), ( index_entry, "content" ) ]
+    )
+    # NOTE: The index entries are what the user will most often see, so we fix them up first.
+    _add_fixup_task( "fixup index searchable content",
+        lambda: _fixup_searchable_content( sr_type, fixup_rows, make_fields ),
+        priority = 40
     )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -726,17 +784,17 @@ def _init_qa( curs, qa, logger ):
     logger.info( "  - Added %s.", plural(nrows,"Q+A entry","Q+A entries"),  )
 
     # register a task to fixup the content
-    def fixup_row( rowid, cset_id ):
-        qa_entry = _fts_index[ sr_type ][ rowid ]
-        _tag_ruleids_in_field( qa_entry, "caption", cset_id )
+    def get_fixup_fields( qa_entry ):
+        fields = [ ( qa_entry, "caption" ) ]
         for content in qa_entry.get( "content", [] ):
-            _tag_ruleids_in_field( content, "question", cset_id )
+            fields.append( ( content, "question" ) )
             for answer in content.get( "answers", [] ):
-                _tag_ruleids_in_field( answer, 0, cset_id )
-        return qa_entry
-    from asl_rulebook2.webapp.startup import _add_startup_task
-    _add_startup_task( "fixup Q+A searchable content",
-        lambda: _fixup_searchable_content( sr_type, fixup_row, make_fields, unload_fields=unload_fields )
+                fields.append( ( answer, 0 ) )
+        return fields
+    fixup_rows = _make_fixup_rows( sr_type, get_fixup_fields )
+    _add_fixup_task( "fixup Q+A searchable content",
+        lambda: _fixup_searchable_content( sr_type, fixup_rows, make_fields, unload_fields=unload_fields ),
+        priority = 30
     )
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -778,13 +836,10 @@ def _do_init_anno( curs, anno, atype ):
             nrows += 1
 
     # register a task to fixup the content
-    def fixup_row( rowid, cset_id ):
-        anno = _fts_index[ sr_type ][ rowid ]
-        _tag_ruleids_in_field( anno, "content", cset_id )
-        return anno
-    from asl_rulebook2.webapp.startup import _add_startup_task
-    _add_startup_task( "fixup {} searchable content".format( atype ),
-        lambda: _fixup_searchable_content( sr_type, fixup_row, make_fields )
+    fixup_rows = _make_fixup_rows( sr_type, lambda anno: [ ( anno, "content" ) ] )
+    _add_fixup_task( "fixup {} searchable content".format( atype ),
+        lambda: _fixup_searchable_content( sr_type, fixup_rows, make_fields ),
+        priority = 20
     )
 
     return nrows
@@ -824,7 +879,7 @@ def _init_asop( curs, asop, asop_preambles, asop_content, logger ):
 
     # register a task to fixup the content
     def fixup_content():
-        _fixup_searchable_content( sr_type, fixup_row, make_fields )
+        _fixup_searchable_content( sr_type, fixup_rows, make_fields )
         # we also need to fixup the in-memory data structures
         if _cached_searchdb_fname is None:
             cset_id = None
@@ -832,17 +887,20 @@ def _init_asop( curs, asop, asop_preambles, asop_content, logger ):
             # searchable row, which means that we would have to reconstitute the sections from these rows
             # when they are read back from a cached database. While it's maybe possible to do this, it's safer
             # to just stored the fixed-up sections verbatim.
-            with sqlite3.connect( _searchdb_fname ) as conn:
+            _tag_ruleids_in_fields(
+                [ ( asop_preambles, chapter_id, cset_id ) for chapter_id in asop_preambles ]
+                + [ ( asop_content, section["section_id"], cset_id ) for section in fixup_sections ]
+            )
+            # NOTE: We write to the database inside the lock, since other startup tasks may be running.
+            with _fixup_content_lock, sqlite3.connect( _searchdb_fname ) as conn:
                 conn.execute( "CREATE TABLE fixedup_asop_preamble ( chapter_id, content )" )
                 conn.execute( "CREATE TABLE fixedup_asop_section ( section_id, content )" )
                 for chapter_id in asop_preambles:
-                    _tag_ruleids_in_field( asop_preambles, chapter_id, cset_id )
                     conn.execute( "INSERT INTO fixedup_asop_preamble ( chapter_id, content ) VALUES ( ?, ? )", (
                         chapter_id, asop_preambles[chapter_id]
                     ) )
                 for section in fixup_sections:
                     section_id = section["section_id"]
-                    _tag_ruleids_in_field( asop_content, section_id, cset_id )
                     conn.execute( "INSERT INTO fixedup_asop_section ( section_id, content ) VALUES ( ?, ? )", (
                         section_id, asop_content[section_id]
                     ) )
@@ -855,14 +913,29 @@ def _init_asop( curs, asop, asop_preambles, asop_content, logger ):
                 for row in conn.execute( "SELECT section_id, content FROM fixedup_asop_section" ):
                     asop_content[ row[0] ] = row[1]
 
-    def fixup_row( rowid, cset_id ):
-        entry = _fts_index[ sr_type ][ rowid ].pop()
-        entry = tag_ruleids( entry, cset_id )
-        return entry
+    def fixup_rows( rows ):
+        entries = [ _fts_index[ sr_type ][ rowid ].pop() for rowid, _ in rows ]
+        entries = tag_ruleids_batch( [
+            ( entry, cset_id ) for entry, ( _, cset_id ) in zip( entries, rows )
+        ] )
+        webapp_startup.yield_to_foreground()
+        return entries
     def make_fields( entry ):
         return { "content": entry }
+    _add_fixup_task( "fixup ASOP searchable content", fixup_content,
+        priority = 10
+    )
+
+def add_post_fixup_task( ctype, func ):
+    """Register a startup task that must run after the searchable content has been fixed up."""
+    from asl_rulebook2.webapp.startup import _add_startup_task
+    _add_startup_task( ctype, func, priority=-1, depends_on=_fixup_tasks )
+
+def _add_fixup_task( ctype, func, priority ):
+    """Register a startup task to fixup searchable content."""
     from asl_rulebook2.webapp.startup import _add_startup_task
-    _add_startup_task( "fixup ASOP searchable content", fixup_content )
+    _add_startup_task( ctype, func, priority=priority )
+    _fixup_tasks.append( ctype )
 
 def _extract_section_entries( content ):
     """Separate out each entry from the section's content."""
@@ -884,18 +957,39 @@ def _extract_section_entries( content ):
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def _make_file_hashes( content_sets, qa_fnames, errata_fnames, user_anno_fname, asop_fnames ):
+def _make_file_hashes( content_sets, #pylint: disable=too-many-arguments
+    qa_fnames, errata_fnames, user_anno_fname, asop_fnames,
+    prev_file_hashes=None
+):
     """Generate hashes for the files that are used to populate the search index."""
 
-    file_hashes = []
+    # NOTE: Hashing every data file can take a while if there is a lot of content, so if we've been given
+    # the hashes from a previous run, we compare the files' stat info (size, modified time and inode),
+    # and only re-hash those files that look like they've changed.
+    prev_file_hashes = {
+        ( fh["ftype"], fh["fname"] ): fh
+        for fh in ( prev_file_hashes or [] )
+        if fh.get( "size" ) is not None # nb: the cached database may have been created by an older version
+    }
+
+    # figure out which files we need to hash
+    file_hashes, hash_files = [], []
     def add_file( fh_type, fname ):
-        with open( fname, "rb" ) as fp:
-            hashval = hashlib.md5( fp.read() ).hexdigest()
-        file_hashes.append( {
+        st = os.stat( fname )
+        fh = {
             "ftype": fh_type,
             "fname": os.path.basename( fname ),
-            "hash": hashval
-        } )
+            "hash": None,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "inode": st.st_ino,
+        }
+        prev_fh = prev_file_hashes.get( ( fh["ftype"], fh["fname"] ) )
+        if prev_fh and all( prev_fh[k] == fh[k] for k in ("size","mtime_ns","inode") ):
+            fh["hash"] = prev_fh["hash"]
+        else:
+            hash_files.append( ( fh, fname ) )
+        file_hashes.append( fh )
 
     # add each file to the table
     if content_sets:
@@ -913,11 +1007,40 @@ def _make_file_hashes( content_sets, qa_fnames, errata_fnames, user_anno_fname,
         for fname in asop_fnames:
             add_file( "asop", fname )
 
+    # hash the files that need it
+    # NOTE: hashlib releases the GIL when hashing large buffers, so we can do this in parallel.
+    if len(hash_files) > 1:
+        max_workers = min( len(hash_files), parse_int( app.config.get("FILE_HASH_THREADS"), 4 ) )
+        with concurrent.futures.ThreadPoolExecutor( max_workers=max_workers ) as executor:
+            hashvals = list( executor.map( hash_file, [ hf[1] for hf in hash_files ] ) )
+    else:
+        hashvals = [ hash_file( hf[1] ) for hf in hash_files ]
+    for hf, hashval in zip( hash_files, hashvals ):
+        hf[0]["hash"] = hashval
+
     file_hashes.sort(
         key = lambda row: ( row["ftype"], row["fname"] )
     )
     return file_hashes
 
+def _save_file_hashes( conn, file_hashes, logger ):
+    """Save file hashes in a search database."""
+    conn.execute( "CREATE TABLE file_hash ( ftype, fname, hash, size, mtime_ns, inode )" )
+    for fh in file_hashes:
+        logger.debug( "- %s/%s = %s", fh["ftype"], fh["fname"], fh["hash"] )
+        conn.execute( "INSERT INTO file_hash"
+            " ( ftype, fname, hash, size, mtime_ns, inode )"
+            " VALUES ( :ftype, :fname, :hash, :size, :mtime_ns, :inode )",
+            fh
+        )
+    conn.commit()
+
+def _cmp_file_hashes( file_hashes, file_hashes2 ):
+    """Compare two sets of file hashes."""
+    def get_keys( fh ):
+        return [ ( row["ftype"], row["fname"], row["hash"] ) for row in fh ]
+    return get_keys( file_hashes ) == get_keys( file_hashes2 )
+
 def _dump_file_hashes( file_hashes, prefix="" ):
     """Dump file hashes."""
     if not file_hashes:
@@ -1033,7 +1156,7 @@ def load_search_config( startup_msgs, logger ):
 
 # ---------------------------------------------------------------------
 
-def _fixup_searchable_content( sr_type, fixup_row, make_fields, unload_fields=None ):
+def _fixup_searchable_content( sr_type, fixup_rows, make_fields, unload_fields=None ):
     """Fixup the searchable content for the specified search result type."""
 
     # initialize
@@ -1047,63 +1170,87 @@ def _fixup_searchable_content( sr_type, fixup_row, make_fields, unload_fields=No
         cached_searchdb_conn = sqlite3.connect( _cached_searchdb_fname )
         cached_searchdb_conn.row_factory = sqlite3.Row
 
+    # NOTE: Other startup tasks may be updating the database at the same time as us, so we collect
+    # our updates, and write them out in blocks, inside the lock. This means that we never hold
+    # a write lock on the database outside the lock, which would cause "database is locked" errors.
+    pending_updates = []
+    def write_updates():
+        with _fixup_content_lock:
+            for query, vals in pending_updates:
+                curs.execute( query, vals )
+            conn.commit()
+        pending_updates.clear()
+
     # update the searchable content in each row
+    # NOTE: We read all the rows up-front, since holding a read cursor open would stop other connections
+    # from being able to write to the database.
     nrows = 0
     last_commit_time = time.time()
-    query = conn.execute( "SELECT rowid, cset_id FROM searchable WHERE sr_type=?",
+    rows = conn.execute( "SELECT rowid, cset_id FROM searchable WHERE sr_type=?",
         ( sr_type, )
-    )
-    for row in query:
+    ).fetchall()
+    webapp_startup.report_task_progress( 0, len(rows) )
+    for batch_start in range( 0, len(rows), _FIXUP_BATCH_SIZE ):
 
-        # prepare the row
-        row = dict( row )
-        nrows += 1
+        # prepare the next batch of rows
+        batch = [ dict( row ) for row in rows[ batch_start : batch_start+_FIXUP_BATCH_SIZE ] ]
+        nrows += len( batch )
 
-        # fixup the searchable row
+        # fixup the searchable rows
         if cached_searchdb_conn:
-            # find the corresponding row in the cached database
-            # IMPORTANT! This relies on the 2 rows having the same rowid.
-            cached_row = dict( cached_searchdb_conn.execute(
-                "SELECT * FROM searchable WHERE rowid=?", (row["rowid"],)
-            ).fetchone() )
-            _restore_cached_searchable_row( row, sr_type, make_fields, unload_fields, cached_row, curs )
+            for row in batch:
+                # find the corresponding row in the cached database
+                # IMPORTANT! This relies on the 2 rows having the same rowid.
+                cached_row = dict( cached_searchdb_conn.execute(
+                    "SELECT * FROM searchable WHERE rowid=?", (row["rowid"],)
+                ).fetchone() )
+                _restore_cached_searchable_row( row, sr_type, make_fields, unload_fields, cached_row,
+                    pending_updates
+                )
         else:
-            _fixup_searchable_row( row, fixup_row, make_fields, curs )
+            _fixup_searchable_rows( batch, fixup_rows, make_fields, pending_updates )
+        if sr_type in ("errata", "qa", "user-anno"):
+            # NOTE: The in-memory objects may have been changed, so any $/rule-info responses
+            # that were generated from them are now out-of-date.
+            for row in batch:
+                invalidate_rule_info( _fts_index[ sr_type ][ row["rowid"] ] )
+        webapp_startup.report_task_progress( nrows )
 
         # commit the changes regularly (so that they are available to the front-end)
         if time.time() - last_commit_time >= 1:
-            conn.commit()
+            write_updates()
             last_commit_time = time.time()
 
     # commit the last block of updates
-    conn.commit()
+    write_updates()
 
     return plural( nrows, "row", "rows" )
 
-def _fixup_searchable_row( row, fixup_row, make_fields, curs ):
-    """Fix up a single row in the searchable table."""
+def _fixup_searchable_rows( rows, fixup_rows, make_fields, pending_updates ):
+    """Fix up a batch of rows in the searchable table."""
 
-    # NOTE: The fixup_row() callback will usually be using _tag_ruleids_in_field(), which manages
+    # NOTE: The fixup_rows() callback will usually be using _tag_ruleids_in_fields(), which manages
     # the lock; otherwise the callback needs to do it itself. We don't want to invoke this callback
-    # inside the lock since it can be quite slow; _tag_ruleids_in_field() holds the lock for the
+    # inside the lock since it can be quite slow; _tag_ruleids_in_fields() holds the lock for the
     # minimum amount of time.
-    new_row = fixup_row( row["rowid"], row["cset_id"] )
+    new_rows = fixup_rows( [ ( row["rowid"], row["cset_id"] ) for row in rows ] )
 
     with _fixup_content_lock:
+        for row, new_row in zip( rows, new_rows ):
 
-        # NOTE: The make_fields() callback will usually be accessing the fields we want to fixup,
-        # so we need to protect them with the lock.
-        fields = make_fields( new_row )
+            # NOTE: The make_fields() callback will usually be accessing the fields we want to fixup,
+            # so we need to protect them with the lock.
+            fields = make_fields( new_row )
 
-        # NOTE: We update the row inside the lock to prevent "database is locked" errors, if the user
-        # tries to do a search while this is happening.
-        query = "UPDATE searchable SET {} WHERE rowid={}".format(
-            ", ".join( "{}=?".format( f ) for f in fields ),
-            row["rowid"]
-        )
-        curs.execute( query, tuple(fields.values()) )
+            # NOTE: The update will be written to the database later, inside the lock, to prevent
+            # "database is locked" errors, if the user tries to do a search while this is happening.
+            query = "UPDATE searchable SET {} WHERE rowid={}".format(
+                ", ".join( "{}=?".format( f ) for f in fields ),
+                row["rowid"]
+            )
+            pending_updates.append( ( query, tuple(fields.values()) ) )
 
-def _restore_cached_searchable_row( row, sr_type, make_fields, unload_fields, cached_row, curs ):
+def _restore_cached_searchable_row( row, sr_type, make_fields, unload_fields, cached_row, pending_updates ):
     """Restore a searchable row from the cached database."""
 
     # get the in-memory object corresponding to the next searchable row
@@ -1136,35 +1283,48 @@ def _restore_cached_searchable_row( row, sr_type, make_fields, unload_fields, ca
                 for field in update_fields:
                     obj[ field ] = cached_row[ field ]
         # update the searchable row
-        with _fixup_content_lock:
-            query = "UPDATE searchable SET {} WHERE rowid={}".format(
-                ", ".join( "{}=?".format( f ) for f in update_fields ),
-                row["rowid"]
-            )
-            curs.execute( query, tuple(
-                cached_row[f] for f in update_fields
-            ) )
+        query = "UPDATE searchable SET {} WHERE rowid={}".format(
+            ", ".join( "{}=?".format( f ) for f in update_fields ),
+            row["rowid"]
+        )
+        pending_updates.append( ( query, tuple(
+            cached_row[f] for f in update_fields
+        ) ) )
 
-_last_sleep_time = 0
+def _make_fixup_rows( sr_type, get_fields ):
+    """Generate a callback that tags the ruleid's in a batch of searchable rows.
 
-def _tag_ruleids_in_field( obj, key, cset_id ):
-    """Tag ruleid's in an optional field."""
-    if not isinstance( key, int ) and key not in obj:
+    get_fields() returns the ( obj, key ) pairs for the fields to be tagged in an in-memory object.
+    """
+    def fixup_rows( rows ):
+        objs = [ _fts_index[ sr_type ][ rowid ] for rowid, _ in rows ]
+        fields = []
+        for obj, ( _, cset_id ) in zip( objs, rows ):
+            fields.extend( ( obj2, key, cset_id ) for obj2, key in get_fields( obj ) )
+        _tag_ruleids_in_fields( fields )
+        return objs
+    return fixup_rows
+
+def _tag_ruleids_in_fields( fields ):
+    """Tag ruleid's in multiple optional fields (a list of ( obj, key, cset_id ) tuples)."""
+    fields = [
+        f for f in fields
+        if isinstance( f[1], int ) or f[1] in f[0]
+    ]
+    if not fields:
         return
     # NOTE: The data structures we use to manage all the in-memory objects never change after
     # they have been loaded, so the only thread-safety we need to worry about is when we read
-    # the original value from an object, and when we update it with a new value. The actual process
+    # the original values from an object, and when we update them with new values. The actual process
     # of tagging ruleid's in a piece of content is done outside the lock, since it's quite slow.
     with _fixup_content_lock:
-        val = obj[key]
-    new_val = tag_ruleids( val, cset_id )
+        vals = [ ( obj[key], cset_id ) for obj, key, cset_id in fields ]
+    new_vals = tag_ruleids_batch( vals )
     with _fixup_content_lock:
-        obj[key] = new_val
-    # FUDGE! Give other threads a chance to run :-/
-    global _last_sleep_time
-    if time.time() - _last_sleep_time > 1:
-        time.sleep( 0.1 )
-        _last_sleep_time = time.time()
+        for ( obj, key, _ ), new_val in zip( fields, new_vals ):
+            obj[key] = new_val
+    # give any foreground requests a chance to run
+    webapp_startup.yield_to_foreground()
 
 def _get_row_count( conn, table_name ):
     """Get the number of rows in a table."""
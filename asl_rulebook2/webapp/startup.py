@@ -9,18 +9,24 @@ import traceback
 import enum
 from collections import defaultdict
 
-from flask import jsonify
+from flask import request, jsonify, g
 
 from asl_rulebook2.webapp import app
-from asl_rulebook2.webapp.content import load_content_sets
-from asl_rulebook2.webapp.search import init_search
-from asl_rulebook2.webapp.rule_info import init_qa, init_errata, init_annotations
+from asl_rulebook2.webapp.bundle import init_data_bundle, invalidate_data_bundle
+from asl_rulebook2.webapp.content import load_content_sets, flush_tag_cache
+from asl_rulebook2.webapp.search import init_search, reload_searchable_content, load_search_config, \
+    add_post_fixup_task
+from asl_rulebook2.webapp.rule_info import init_qa, init_errata, init_annotations, precompute_rule_info
 from asl_rulebook2.webapp.asop import init_asop
+from asl_rulebook2.webapp.memory import start_memory_tracing, record_memory_phase
+from asl_rulebook2.webapp.reload import init_data_watcher, get_pending_reloads, flag_pending_reloads
 from asl_rulebook2.webapp.utils import parse_int
 
 _capabilities = None
 
 _startup_tasks = None
+_task_progress = None
+_task_local = threading.local()
 
 _logger = logging.getLogger( "startup" )
 _startup_msgs = None
@@ -45,28 +51,35 @@ def init_webapp():
     """
 
     # initialize
-    global _startup_status, _startup_msgs, _capabilities, _startup_tasks
+    global _startup_status, _startup_msgs, _capabilities, _startup_tasks, _task_progress
     _startup_status = StartupStatusEnum.STARTED
     _startup_msgs = StartupMsgs()
     _capabilities = {}
     _startup_tasks = []
+    _task_progress = {}
 
     # initialize the webapp
+    start_memory_tracing()
+    init_data_bundle( _startup_msgs, _logger )
     content_sets = load_content_sets( _startup_msgs, _logger )
     if content_sets:
         _capabilities[ "content-sets" ] = True
+    record_memory_phase( "content sets" )
     qa, qa_fnames = init_qa( _startup_msgs, _logger )
     if qa:
         _capabilities[ "qa" ] = True
+    record_memory_phase( "Q+A" )
     errata, errata_fnames = init_errata( _startup_msgs, _logger )
     if errata:
         _capabilities[ "errata" ] = True
     user_anno, user_anno_fname = init_annotations( _startup_msgs, _logger )
     if user_anno:
         _capabilities[ "user-anno" ] = True
+    record_memory_phase( "errata and annotations" )
     asop, asop_preambles, asop_content, asop_fnames = init_asop( _startup_msgs, _logger )
     if asop:
         _capabilities[ "asop" ] = True
+    record_memory_phase( "ASOP" )
     init_search(
         content_sets,
         qa, qa_fnames,
@@ -75,6 +88,8 @@ def init_webapp():
         asop, asop_preambles, asop_content, asop_fnames,
         _startup_msgs, _logger
     )
+    record_memory_phase( "search" )
+    add_post_fixup_task( "precompute rule info", precompute_rule_info )
 
     # everything has been initialized - now we can go back and fixup content
     # NOTE: This is quite a slow process (~1 minute for a full data load), which is why we don't do it inline,
@@ -83,6 +98,13 @@ def init_webapp():
     # eventually start to be returned as search results. We could do this process once, and save the results
     # in a file, then reload everything at startup, which will obviously be much faster, but we then have to
     # figure out when that file needs to be rebuolt :-/
+    _start_startup_tasks()
+
+    # start watching the data directory for changes
+    init_data_watcher()
+
+def _start_startup_tasks():
+    """Start running the startup tasks."""
     if app.config.get( "BLOCKING_STARTUP_TASKS" ):
         # NOTE: It's useful to do this synchronously when running the test suite, since if the tests
         # need the linkified ruleid's, they can't start until the fixup has finished (and if they don't
@@ -93,55 +115,344 @@ def init_webapp():
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def _add_startup_task( ctype, func ):
-    """Register a function to run at startup."""
+def apply_pending_reloads():
+    """Reload any subsystems whose data files have changed.
+
+    NOTE: This must be called with the init lock held.
+    """
+
+    # check if there is anything to reload
+    subsystems = get_pending_reloads()
+    if not subsystems:
+        return
+
+    # NOTE: The data bundle was built from the old data files, so we can't use it any more.
+    invalidate_data_bundle()
+
+    # check if we need to reload everything
+    # NOTE: If a content set has changed, the ruleid's that have been tagged in the other content
+    # may no longer be valid, so it's simplest to just reload everything.
+    if "content" in subsystems:
+        _logger.info( "Content sets have changed, reloading everything." )
+        init_webapp()
+        return
+
+    # reload the affected subsystems
+    if not reload_data( subsystems ):
+        # NOTE: We can't reload while the startup tasks are still running - we'll try again later.
+        flag_pending_reloads( subsystems )
+
+def reload_data( subsystems ):
+    """Reload the specified subsystems (after their data files have changed).
+
+    Returns False if the reload couldn't be done (because the startup tasks are still running).
+    """
+
+    # check if the startup tasks are still running
+    # NOTE: These will be updating the in-memory objects and search database, so we can't reload anything
+    # until they've finished.
+    global _startup_status, _startup_tasks, _task_progress
+    if _startup_status not in ( StartupStatusEnum.NOT_STARTED, StartupStatusEnum.COMPLETED ):
+        return False
+    _logger.info( "Reloading data: %s", " ; ".join( sorted( subsystems ) ) )
+    _startup_status = StartupStatusEnum.STARTED
+    _startup_tasks = []
+    _task_progress = {}
+
+    def update_capability( key, val ):
+        if val:
+            _capabilities[ key ] = True
+        else:
+            _capabilities.pop( key, None )
+
+    # reload the subsystems
+    # NOTE: Each subsystem installs its new data when it has finished loading, and the search database
+    # is then updated in a single transaction, so requests being handled in the meantime will see
+    # either the old or new data.
+    reloads = {}
+    if "qa" in subsystems:
+        reloads[ "qa" ] = init_qa( _startup_msgs, _logger )
+        update_capability( "qa", reloads["qa"][0] )
+    if "errata" in subsystems:
+        reloads[ "errata" ] = init_errata( _startup_msgs, _logger )
+        update_capability( "errata", reloads["errata"][0] )
+    if "user-anno" in subsystems:
+        reloads[ "user_anno" ] = init_annotations( _startup_msgs, _logger )
+        update_capability( "user-anno", reloads["user_anno"][0] )
+    if "asop" in subsystems:
+        reloads[ "asop" ] = init_asop( _startup_msgs, _logger )
+        update_capability( "asop", reloads["asop"][0] )
+    if reloads:
+        reload_searchable_content( _logger, **reloads )
+        add_post_fixup_task( "precompute rule info", precompute_rule_info )
+    if "search-config" in subsystems:
+        load_search_config( _startup_msgs, _logger )
+
+    # fixup the reloaded content
+    _start_startup_tasks()
+
+    return True
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _add_startup_task( ctype, func, priority=0, depends_on=None ):
+    """Register a function to run at startup.
+
+    Tasks with a higher priority are started first, and a task will not be started until all the tasks
+    it depends on have finished. Tasks that don't depend on each other may be run in parallel.
+    """
     if app.config.get( "DISABLE_STARTUP_TASKS" ):
         return
-    _startup_tasks.append( ( ctype, func ) )
+    _startup_tasks.append( {
+        "ctype": ctype,
+        "func": func,
+        "priority": priority,
+        "depends_on": list( depends_on or [] ),
+    } )
+    _task_progress[ ctype ] = {
+        "ctype": ctype, "state": "pending",
+        "ndone": 0, "ntotal": None,
+        "start_time": None, "end_time": None, "last_log_time": None,
+    }
 
 def _do_startup_tasks( delay ):
     """Run each registered startup task."""
 
     # initialize
-    global _startup_status
+    global _startup_status, _yield_to_foreground
     if not _startup_tasks:
         _startup_status = StartupStatusEnum.COMPLETED
         return
 
     # FUDGE! If we start processing straight away, the main PDF loads very slowly because of us :-/,
-    # and since there's no way to set thread priorities in Python, we delay for a short time, to give
-    # the PDF time to load, before we start working.
-    # NOTE: This delay only helps the initial load of the main ASLRB PDF. After processing has started,
+    # and since there's no way to set thread priorities in Python, we wait for the front-end to finish
+    # loading before we start working (i.e. until there have been no requests for a short time).
+    # NOTE: This only helps the initial load of the main ASLRB PDF. After processing has started,
     # if the user reloads the page, or tries to load another PDF, they will have the same problem of
-    # very slow loads. To work around this, _tag_ruleids_in_field() sleeps periodically, to give
-    # other threads a chance to run. The PDF's load a bit slowly, but it's acceptable.
+    # very slow loads. To work around this, the tasks call yield_to_foreground() regularly, which will
+    # back off while there are requests in progress.
     # NOTE: If there is a cached search database, things are very fast and so we don't need to delay.
     fname = app.config.get( "CACHED_SEARCHDB" )
     have_cached_searchdb = fname and os.path.isfile( fname ) and os.path.getsize( fname ) > 0
     if delay and not have_cached_searchdb:
-        delay = parse_int( app.config.get( "STARTUP_TASKS_DELAY" ), 5 )
-        time.sleep( delay )
+        max_delay = parse_int( app.config.get( "STARTUP_TASKS_DELAY" ), 5 )
+        idle_time = parse_int( app.config.get( "STARTUP_TASKS_IDLE_TIME" ), 2 )
+        _wait_for_idle_foreground( idle_time, max_delay )
+    # NOTE: We only back off for foreground requests if we're running in the background, since if we're not,
+    # we will be running inside a request (that is waiting for us to finish).
+    _yield_to_foreground = delay
+
+    # initialize
+    tasks = list( _startup_tasks )
+    task_ctypes = set( t["ctype"] for t in tasks )
+    pending_tasks = sorted( enumerate( tasks ),
+        key = lambda t: ( -t[1]["priority"], t[0] )
+    )
+    pending_tasks = [ t[1] for t in pending_tasks ]
+    running_tasks, done_tasks = set(), set()
+    max_threads = max( parse_int( app.config.get( "STARTUP_TASKS_THREADS" ), 2 ), 1 )
+    cond = threading.Condition()
+
+    def is_ready( task ):
+        # NOTE: We ignore dependencies on tasks that were never registered.
+        return all(
+            ctype in done_tasks or ctype not in task_ctypes
+            for ctype in task["depends_on"]
+        )
+
+    def run_task( task, task_no ):
+        ctype = task["ctype"]
+        _logger.debug( "Running startup task (%d/%d): %s", task_no, len(tasks), ctype )
+        progress = _task_progress.get( ctype )
+        if progress:
+            progress.update( { "state": "running", "start_time": time.time() } )
+            progress[ "last_log_time" ] = progress[ "start_time" ]
+        _task_local.progress = progress
+        try:
+            msg = task["func"]()
+            if progress:
+                progress.update( { "state": "completed", "end_time": time.time() } )
+                progress_info = _get_task_progress( progress )
+                elapsed_time = datetime.timedelta( seconds = int( progress_info["elapsed"] ) )
+                if progress_info.get( "rate" ):
+                    elapsed_time = "{}, {:.1f}/sec".format( elapsed_time, progress_info["rate"] )
+            else:
+                elapsed_time = "-"
+            msg = ": {}".format( msg ) if msg else "."
+            _logger.debug( "- Finished startup task '%s' (%s)%s", ctype, elapsed_time, msg )
+        except Exception as ex: #pylint: disable=broad-except
+            if progress:
+                progress.update( { "state": "failed", "end_time": time.time() } )
+            _logger.error( "Startup task '%s' failed: %s\n%s", ctype, ex, traceback.format_exc() )
+        finally:
+            _task_local.progress = None
+            with cond:
+                running_tasks.discard( ctype )
+                done_tasks.add( ctype )
+                cond.notify_all()
 
     # process each startup task
     _startup_status = StartupStatusEnum.TASKS_RUNNING
     _logger.info( "Processing startup tasks..." )
     start_time = time.time()
-    for task_no, (ctype, func) in enumerate( _startup_tasks ):
-        _logger.debug( "Running startup task (%d/%d): %s", 1+task_no, len(_startup_tasks), ctype )
-        start_time2 = time.time()
-        try:
-            msg = func()
-        except Exception as ex: #pylint: disable=broad-except
-            _logger.error( "Startup task '%s' failed: %s\n%s", ctype, ex, traceback.format_exc() )
-            continue
-        elapsed_time = datetime.timedelta( seconds = int( time.time() - start_time2 ) )
-        msg = ": {}".format( msg ) if msg else "."
-        _logger.debug( "- Finished startup task (%s)%s", elapsed_time, msg )
+    with cond:
+        task_no = 0
+        while pending_tasks or running_tasks:
+            # check if we can start another task
+            ready_tasks = [ t for t in pending_tasks if is_ready( t ) ]
+            if ready_tasks and len(running_tasks) < max_threads:
+                # yup - make it so
+                task = ready_tasks[0]
+                pending_tasks.remove( task )
+                running_tasks.add( task["ctype"] )
+                task_no += 1
+                threading.Thread( target=run_task, args=(task,task_no), daemon=True ).start()
+                continue
+            if not running_tasks:
+                # NOTE: We can only get here if there is a dependency loop.
+                _logger.error( "Can't run startup tasks (circular dependencies?): %s",
+                    " ; ".join( t["ctype"] for t in pending_tasks )
+                )
+                break
+            # wait for a running task to finish
+            cond.wait()
 
     # finish up
+    flush_tag_cache()
+    record_memory_phase( "startup tasks" )
     elapsed_time = datetime.timedelta( seconds = int( time.time() - start_time ) )
     _logger.info( "All startup tasks completed (%s).", elapsed_time )
     _startup_status = StartupStatusEnum.COMPLETED
+    _yield_to_foreground = False
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def report_task_progress( ndone, ntotal=None ):
+    """Report progress for the currently-running startup task.
+
+    Startup tasks should call this regularly, with the number of items processed so far (and the total
+    number of items to process, if known), so that we can report throughput and an ETA.
+    """
+
+    # update the progress for the current task
+    progress = getattr( _task_local, "progress", None )
+    if not progress:
+        return
+    progress[ "ndone" ] = ndone
+    if ntotal is not None:
+        progress[ "ntotal" ] = ntotal
+
+    # log progress regularly
+    now = time.time()
+    if now - progress["last_log_time"] < parse_int( app.config.get( "STARTUP_PROGRESS_LOG_INTERVAL" ), 10 ):
+        return
+    progress[ "last_log_time" ] = now
+    progress_info = _get_task_progress( progress )
+    if progress_info.get( "ntotal" ):
+        _logger.info( "- Startup task '%s': %d/%d (%.1f%%), %.1f/sec, ETA %s",
+            progress["ctype"], ndone, progress_info["ntotal"],
+            progress_info["percent"], progress_info["rate"],
+            datetime.timedelta( seconds = int( progress_info["eta"] ) )
+        )
+    else:
+        _logger.info( "- Startup task '%s': %d, %.1f/sec",
+            progress["ctype"], ndone, progress_info["rate"]
+        )
+
+def _get_task_progress( progress ):
+    """Get the progress of a startup task."""
+    result = {
+        "ctype": progress["ctype"],
+        "state": progress["state"],
+        "ndone": progress["ndone"],
+    }
+    if progress["ntotal"] is not None:
+        result[ "ntotal" ] = progress["ntotal"]
+        result[ "percent" ] = 100.0 * progress["ndone"] / progress["ntotal"] if progress["ntotal"] > 0 else 100.0
+    if progress["start_time"] is None:
+        return result
+    # calculate the throughput and ETA
+    elapsed = ( progress["end_time"] or time.time() ) - progress["start_time"]
+    result[ "elapsed" ] = elapsed
+    if elapsed > 0:
+        result[ "rate" ] = progress["ndone"] / elapsed
+        if progress["state"] == "running" and progress["ntotal"] is not None and result["rate"] > 0:
+            result[ "eta" ] = max( progress["ntotal"] - progress["ndone"], 0 ) / result["rate"]
+    return result
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+_foreground_lock = threading.Lock()
+_foreground_idle = threading.Event()
+_foreground_idle.set()
+_nforeground_requests = 0
+_last_foreground_time = 0
+_yield_to_foreground = False
+
+# NOTE: These requests don't count as foreground activity (the front-end polls $/startup-status
+# while the startup tasks are running, and the test suite pings the server to detect when it's up).
+_BACKGROUND_REQUESTS = ( "/startup-status", "/ping", "/control-tests" )
+
+@app.before_request
+def _on_begin_request():
+    """Called before each request."""
+    if request.path in _BACKGROUND_REQUESTS:
+        return
+    global _nforeground_requests
+    with _foreground_lock:
+        _nforeground_requests += 1
+        _foreground_idle.clear()
+    g.foreground_request = True
+
+@app.after_request
+def _on_end_request( resp ):
+    """Called after each request."""
+    # NOTE: Responses can be streamed after the request has finished (e.g. PDF content), so we only
+    # flag the foreground request as done after the response has been sent.
+    if g.pop( "foreground_request", False ):
+        resp.call_on_close( _end_foreground_request )
+    return resp
+
+@app.teardown_request
+def _on_teardown_request( exc ): #pylint: disable=unused-argument
+    """Called after each request (even if it failed)."""
+    # NOTE: If the request failed, _on_end_request() will not have been called.
+    if g.pop( "foreground_request", False ):
+        _end_foreground_request()
+
+def _end_foreground_request():
+    """Flag that a foreground request has finished."""
+    global _nforeground_requests, _last_foreground_time
+    with _foreground_lock:
+        _nforeground_requests = max( _nforeground_requests - 1, 0 )
+        _last_foreground_time = time.time()
+        if _nforeground_requests == 0:
+            _foreground_idle.set()
+
+def yield_to_foreground():
+    """Give foreground requests a chance to run.
+
+    Startup tasks should call this regularly. If there are requests in progress (e.g. the front-end
+    is loading a PDF), we back off until they have finished, otherwise we just relinquish the CPU.
+    """
+    if not _yield_to_foreground:
+        return
+    if _foreground_idle.is_set():
+        time.sleep( 0 )
+        return
+    # NOTE: We limit how long we wait, in case a request never finishes (e.g. the client went away).
+    _foreground_idle.wait( parse_int( app.config.get( "STARTUP_TASKS_MAX_BACKOFF" ), 2 ) )
+
+def _wait_for_idle_foreground( idle_time, max_delay ):
+    """Wait until there have been no foreground requests for a while."""
+    start_time = time.time()
+    while True:
+        now = time.time()
+        if now - start_time >= max_delay:
+            break
+        if _foreground_idle.is_set() and now - max( _last_foreground_time, start_time ) >= idle_time:
+            break
+        time.sleep( 0.1 )
 
 # ---------------------------------------------------------------------
 
@@ -178,9 +489,12 @@ def get_startup_msgs():
 @app.route( "/startup-status" )
 def get_startup_status():
     """Return the current startup status."""
-    return jsonify( {
+    resp = {
         "status": _startup_status
-    } )
+    }
+    if _task_progress:
+        resp[ "tasks" ] = [ _get_task_progress( p ) for p in _task_progress.values() ]
+    return jsonify( resp )
 
 # ---------------------------------------------------------------------
 
@@ -1,5 +1,5 @@
 import { gMainApp, gASOPChapterIndex, gASOPSectionIndex, gEventBus } from "./MainApp.js" ;
-import { getURL, getASOPChapterIdFromSectionId, linkifyAutoRuleids, wrapExcBlocks, isChildOf } from "./utils.js" ;
+import { getJSON, getURL, getASOPChapterIdFromSectionId, linkifyAutoRuleids, wrapExcBlocks, isChildOf } from "./utils.js" ;
 
 let gSectionContentOverrides = {} ;
 
@@ -101,33 +101,27 @@ gMainApp.component( "asop", {
             this.isSingleSection = false ;
             this.chapterId = chapter.chapter_id ;
             // show the preamble and each section
-            this.showPreamble( chapter.chapter_id ) ;
-            if ( this.sections.length == 0 )
-                return ;
-            let addSectionContent = (sectionNo, content) => {
-                this.sections[ sectionNo ] =
-                    "<div class='caption'>" + chapter.sections[sectionNo].caption + "</div>"
-                    + this.fixupContent( content ) ;
-            } ;
-            chapter.sections.forEach( (section, sectionNo) => {
-                // check if there is an override for the next section
-                let sectionId = chapter.chapter_id + "-" + (1+sectionNo) ;
-                let contentOverride = gSectionContentOverrides[ sectionId ] ;
-                if ( contentOverride ) {
-                    // yup - just use that
-                    addSectionContent( sectionNo, contentOverride ) ;
-                } else {
-                    // nope - download the section from the backend
-                    let url = gGetASOPSectionUrl.replace( "SECTION_ID", sectionId ) ; //eslint-disable-line no-undef
-                    getURL( url ).then( (resp) => {
-                        addSectionContent( sectionNo, resp ) ;
-                    } ).catch( (xhr) => {
+            // NOTE: We get the whole chapter in one request, rather than the preamble and each section separately.
+            let url = gGetASOPChapterUrl.replace( "CHAPTER_ID", chapter.chapter_id ) ; //eslint-disable-line no-undef
+            getJSON( url ).then( (resp) => {
+                this.preamble = resp.preamble ? this.fixupContent( resp.preamble ) : null ;
+                ( chapter.sections || [] ).forEach( (section, sectionNo) => {
+                    // check if there is an override for the next section
+                    let sectionId = chapter.chapter_id + "-" + (1+sectionNo) ;
+                    let content = gSectionContentOverrides[ sectionId ] || resp.sections[ sectionId ] ;
+                    if ( ! content ) {
                         // NOTE: We show the error in the content, not as a notification balloon.
-                        this.sections[ sectionNo ] =
-                            "Couldn't get ASOP section <tt>" + sectionId + "</tt>."
-                            + " <div class='pre'>" + xhr.statusText + "</div>" ;
-                    } ) ;
-                }
+                        this.sections[ sectionNo ] = "Couldn't get ASOP section <tt>" + sectionId + "</tt>." ;
+                        return ;
+                    }
+                    this.sections[ sectionNo ] =
+                        "<div class='caption'>" + section.caption + "</div>"
+                        + this.fixupContent( content ) ;
+                } ) ;
+            } ).catch( (errorMsg) => {
+                // NOTE: We show the error in the content, not as a notification balloon.
+                this.preamble = "Couldn't get ASOP chapter <tt>" + chapter.chapter_id + "</tt>."
+                    + " <div class='pre'>" + errorMsg + "</div>" ;
             } ) ;
         },
 
@@ -1,4 +1,4 @@
-import { getJSON, showErrorMsg, showNotificationMsg, hideFootnotes } from "./utils.js" ;
+import { getJSON, clearRuleInfoCache, showErrorMsg, showNotificationMsg, hideFootnotes } from "./utils.js" ;
 
 // parse any URL parameters
 export let gUrlParams = new URLSearchParams( window.location.search.substring(1) ) ;
@@ -21,6 +21,7 @@ export let gFootnoteIndex = null ;
 export let gChapterResources = null ;
 export let gASOPChapterIndex = null ;
 export let gASOPSectionIndex = null ;
+export let gRuleInfoCounts = null ;
 
 // --------------------------------------------------------------------
 
@@ -81,6 +82,7 @@ gMainApp.component( "main-app", {
             this.getASOP(),
         ] ).then( () => {
             this.onStartupDone() ;
+            this.getRuleInfoCounts() ;
         } ).catch( () => {
             // NOTE: Each individual Promise should report their own errors i.e. what could we do here,
             // other than show a generic "startup failed" error?
@@ -114,11 +116,42 @@ gMainApp.component( "main-app", {
                     resp["empty"] = { "cdoc_id": "empty", "title": "Empty document" } ; // nb: for testing porpoises
                 self.contentDocs = resp ;
                 self.installContentDocs( resp ) ;
+                self.loadDeferredTargets( resp ) ;
             } ).catch( (errorMsg) => {
                 showErrorMsg( "Couldn't get the content docs.", errorMsg ) ;
             } ) ;
         },
 
+        loadDeferredTargets( contentDocs ) {
+            // NOTE: The backend can be configured to leave the targets out of the content docs (since they
+            // can be quite large), in which case we load them in the background, and re-install the content docs
+            // when they arrive. We only need the captions (the PDF's know where the targets are).
+            let promises = [] ;
+            Object.values( contentDocs ).forEach( (cdoc) => {
+                if ( ! cdoc.targets_url || cdoc.targets )
+                    return ;
+                promises.push( getJSON( cdoc.targets_url + "?fields=caption" ).then( (resp) => {
+                    cdoc.targets = resp ;
+                } ) ) ;
+            } ) ;
+            if ( promises.length == 0 )
+                return ;
+            Promise.all( promises ).then( () => {
+                this.installContentDocs( contentDocs ) ;
+            } ).catch( (errorMsg) => {
+                showErrorMsg( "Couldn't get the content doc targets.", errorMsg ) ;
+            } ) ;
+        },
+
+        getRuleInfoCounts() {
+            // get the number of Q+A entries, errata and annotations for each ruleid
+            // NOTE: This lets us avoid asking the backend for the rule info for targets that don't have any.
+            // We don't need it to start up, so we don't wait for it (or complain if we can't get it).
+            getJSON( gGetRuleInfoCountsUrl ).then( (resp) => { //eslint-disable-line no-undef
+                gRuleInfoCounts = resp ;
+            } ).catch( () => {} ) ;
+        },
+
         getFootnoteIndex() {
             // get the footnotes
             return getJSON( gGetFootnotesUrl ).then( (resp) => { //eslint-disable-line no-undef
@@ -256,10 +289,14 @@ gMainApp.component( "main-app", {
                 // NOTE: To avoid forcing the user to configure which document this is,
                 // we assume that it's the one with the most targets.
                 let targetCdocId = null ;
+                function countTargets( cdoc ) {
+                    // nb: the targets may not have been loaded yet (see loadDeferredTargets())
+                    return cdoc.targets ? Object.keys( cdoc.targets ).length : cdoc.ntargets ;
+                }
                 for ( let cdocId in this.contentDocs ) {
-                    if ( this.contentDocs[cdocId].targets == undefined )
+                    if ( countTargets( this.contentDocs[cdocId] ) == undefined )
                         continue
-                    if ( targetCdocId == null || Object.keys(this.contentDocs[cdocId].targets).length > Object.keys(this.contentDocs[targetCdocId].targets).length )
+                    if ( targetCdocId == null || countTargets(this.contentDocs[cdocId]) > countTargets(this.contentDocs[targetCdocId]) )
                         targetCdocId = cdocId ;
                 }
                 if ( targetCdocId != null ) {
@@ -286,6 +323,7 @@ gMainApp.component( "main-app", {
                     $( "#startup-tasks-loading" ).fadeOut() ;
                     clearInterval( this.startupTimerId ) ;
                     this.startupTimerId = -1 ;
+                    clearRuleInfoCache() ;
                 } else if ( resp.status == 2 ) {
                     // startup is in progress
                     // NOTE: We don't show the loading spinner for STARTED, since for most users, the startup process
@@ -1,5 +1,5 @@
 import { gMainApp, gAppConfig, gContentDocs, gEventBus, gUrlParams } from "./MainApp.js" ;
-import { getJSON, getURL, linkifyAutoRuleids, getASOPChapterIdFromSectionId, showWarningMsg, makeImageUrl } from "./utils.js" ;
+import { getURL, getRuleInfo, linkifyAutoRuleids, getASOPChapterIdFromSectionId, showWarningMsg, makeImageUrl } from "./utils.js" ;
 
 // --------------------------------------------------------------------
 
@@ -40,8 +40,8 @@ gMainApp.component( "nav-pane", {
             // NOTE: Targets are associated with a content set, but the Q+A is global, which is not quite
             // the right thing to do - what if there is a ruleid that exists in multiple content set,
             // but is referenced in the Q+A? Hopefully, this will never happen... :-/
-            let url = gGetRuleInfoUrl.replace( "RULEID", ruleid ) ; //eslint-disable-line no-undef
-            getJSON( url ).then( (resp) => {
+            // NOTE: The search results pane will often have already asked for this (see prefetchRuleInfo()).
+            getRuleInfo( ruleid ).then( (resp) => {
                 if ( resp.length > 0 ) {
                     // install the rule info entries
                     this.ruleInfo = resp ;
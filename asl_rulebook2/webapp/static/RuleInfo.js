@@ -82,7 +82,7 @@ gMainApp.component( "qa-entry", {
                 <!-- this is a normal question + one or more answers -->
                 <img :src=questionImageUrl class="icon" />
                 <div class="question">
-                    <img v-if=content.image :src=makeQAImageUrl(content.image) class="imageZoom" />
+                    <img v-if=content.image :src=makeQAThumbnailUrl(content.image) :data-zoom-src=makeQAImageUrl(content.image) class="imageZoom" />
                     <div v-html=fixupContent(content.question) />
                 </div>
                 <div v-for="answer in content.answers" class="answer" >
@@ -118,6 +118,12 @@ gMainApp.component( "qa-entry", {
             return gGetQAImageUrl.replace( "FNAME", fname ) ; //eslint-disable-line no-undef
         },
 
+        makeQAThumbnailUrl( fname ) {
+            // return the URL to a thumbnail of an image associated with a Q+A entry
+            // NOTE: Images are shown 100px high, so we ask for twice that (for high-DPI screens).
+            return gGetQAThumbnailUrl.replace( "SIZE", "x200" ).replace( "FNAME", fname ) ; //eslint-disable-line no-undef
+        },
+
         fixupHilites( val ) {
             // convert search term highlights returned to us by the search engine to HTML
             return fixupSearchHilites( val ) ;
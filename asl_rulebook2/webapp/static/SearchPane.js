@@ -1,6 +1,6 @@
 import { gMainApp, gAppConfig, gEventBus } from "./MainApp.js" ;
 import { gUserSettings, saveUserSettings } from "./UserSettings.js" ;
-import { postURL, findTargets, getPrimaryTarget, linkifyAutoRuleids, fixupSearchHilites, hideFootnotes } from "./utils.js" ;
+import { postURL, findTargets, getPrimaryTarget, prefetchRuleInfo, linkifyAutoRuleids, fixupSearchHilites, hideFootnotes } from "./utils.js" ;
 
 // --------------------------------------------------------------------
 
@@ -277,6 +277,15 @@ gMainApp.component( "search-results", {
                 // load the search results into the UI
                 this.$el.scrollTop = 0;
                 this.searchResults = resp ;
+                // get the Q+A and annotations for the search results' main ruleid's, in case the user clicks on them
+                // NOTE: We do this in a single request, rather than one request for each ruleid.
+                let ruleids = [] ;
+                resp.forEach( (sr) => {
+                    let target = sr.sr_type == "index" ? getPrimaryTarget( sr ) : null ;
+                    if ( target )
+                        ruleids.push( target.ruleid ) ;
+                } ) ;
+                prefetchRuleInfo( ruleids ) ;
                 // auto-show the primary target for the first search result
                 if ( resp.length > 0 && resp[0].sr_type == "index" ) {
                     let target = getPrimaryTarget( resp[0] ) ;
@@ -1,4 +1,4 @@
-import { gContentDocs, gTargetIndex, gChapterResources, gEventBus, gUrlParams } from "./MainApp.js" ;
+import { gContentDocs, gTargetIndex, gChapterResources, gRuleInfoCounts, gEventBus, gUrlParams } from "./MainApp.js" ;
 
 // --------------------------------------------------------------------
 
@@ -116,6 +116,62 @@ export function linkifyAutoRuleids( $root )
 
 // --------------------------------------------------------------------
 
+// NOTE: This holds a Promise for the Q+A and annotations for each ruleid that has been requested.
+let _ruleInfoCache = {} ;
+
+// this is the maximum number of ruleid's we will ask for in a single request
+const RULE_INFO_BATCH_SIZE = 50 ;
+
+export function getRuleInfo( ruleid )
+{
+    // get the Q+A and annotations for a ruleid
+    ruleid = ruleid.toUpperCase() ;
+    prefetchRuleInfo( [ ruleid ] ) ;
+    return _ruleInfoCache[ ruleid ] || Promise.resolve( [] ) ;
+}
+
+export function prefetchRuleInfo( ruleids )
+{
+    // figure out which ruleid's we need to ask for
+    // NOTE: We don't ask for ruleid's that we already have (or have already asked for), or that we know
+    // have no Q+A or annotations (if the rule info counts have arrived).
+    let todo = [] ;
+    ruleids.forEach( (ruleid) => {
+        ruleid = ruleid.toUpperCase() ;
+        if ( ruleid in _ruleInfoCache || todo.indexOf( ruleid ) >= 0 )
+            return ;
+        if ( gRuleInfoCounts && ! gRuleInfoCounts[ ruleid ] )
+            return ;
+        todo.push( ruleid ) ;
+    } ) ;
+
+    // get the rule info for the ruleid's, in batches
+    for ( let i=0 ; i < todo.length ; i += RULE_INFO_BATCH_SIZE ) {
+        let batch = todo.slice( i, i+RULE_INFO_BATCH_SIZE ) ;
+        let url = gGetRuleInfoBatchUrl + "?ruleids=" + encodeURIComponent( batch.join( "," ) ) ; //eslint-disable-line no-undef
+        let promise = getJSON( url ) ;
+        batch.forEach( (ruleid) => {
+            _ruleInfoCache[ ruleid ] = promise.then( (resp) => {
+                return resp[ ruleid ] || [] ; // nb: ruleid's that have nothing are left out of the response
+            } ) ;
+        } ) ;
+        promise.catch( () => {
+            // nb: we will try again the next time these ruleid's are needed
+            batch.forEach( (ruleid) => { delete _ruleInfoCache[ ruleid ] ; } ) ;
+        } ) ;
+    }
+}
+
+export function clearRuleInfoCache()
+{
+    // clear the cached rule info
+    // NOTE: The startup tasks can change the Q+A and annotations (when they fixup the content),
+    // so we need to get them again once the startup tasks have finished.
+    _ruleInfoCache = {} ;
+}
+
+// --------------------------------------------------------------------
+
 export function getChapterResource( rtype, chapterId )
 {
     // get the URL for a chapter resource (if available)
@@ -172,10 +228,11 @@ export function hideFootnotes( fast )
 export function makeImagesZoomable( $elem )
 {
     // look for images that have been marked as zoomable, and make it so
+    // NOTE: If the image is a thumbnail, it will tell us where the full-size image is.
     $elem.find( "img.imageZoom" ).each( function() {
         $(this).wrap( $( "<a>", {
             class: "imageZoom",
-            href: $(this).attr( "src" ),
+            href: $(this).attr( "data-zoom-src" ) || $(this).attr( "src" ),
             title: "Click to zoom",
             onFocus: "javascript:this.blur()"
         } ) ) ;
@@ -0,0 +1,126 @@
+""" Persistent cache for tagged ruleid's. """
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+# NOTE: This should be changed if the way tag_ruleids() marks up ruleid's changes, to invalidate
+# any previously-cached results.
+_TAG_FORMAT_VERSION = 2
+
+# ---------------------------------------------------------------------
+
+class TagCache:
+    """Disk-backed cache of tag_ruleids() results.
+
+    Much of the content we run through tag_ruleids() is identical across restarts (and across content
+    types e.g. errata that quote rules), so we remember the results in an SQLite database, keyed by
+    a hash of the content, the content set, and a fingerprint of the known ruleid's. The cache has
+    a bounded size, and the least-recently used entries are evicted when it fills up.
+
+    Unlike the cached search database, this file doesn't need to be rebuilt when the data files change
+    (entries for content that is no longer used will simply age out).
+    """
+
+    def __init__( self, fname, max_entries, logger ):
+        self.fname = fname
+        self.max_entries = max( max_entries, 1 )
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect( fname, check_same_thread=False )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tagged ( key TEXT PRIMARY KEY, content TEXT, last_used INTEGER )"
+        )
+        self._conn.execute( "CREATE INDEX IF NOT EXISTS tagged_last_used ON tagged ( last_used )" )
+        row = self._conn.execute( "SELECT count(*), max(last_used) FROM tagged" ).fetchone()
+        self._nentries = row[0]
+        # NOTE: We track usage with a counter (rather than timestamps), so that the LRU order is stable.
+        self._clock = row[1] or 0
+        self._last_commit_time = time.time()
+        self.nhits = self.nmisses = 0
+
+    @staticmethod
+    def make_key( content, cset_id, ruleids_fingerprint ):
+        """Generate the cache key for a piece of content."""
+        key = "{}|{}|{}|".format( _TAG_FORMAT_VERSION, ruleids_fingerprint, cset_id or "" )
+        return hashlib.sha1( ( key + content ).encode( "utf-8" ) ).hexdigest()
+
+    def get( self, key ):
+        """Get a cached result."""
+        return self.get_many( [ key ] ).get( key )
+
+    def get_many( self, keys ):
+        """Get multiple cached results (returned as a dict, keyed by cache key)."""
+        results = {}
+        with self._lock:
+            if self._conn is None:
+                return results # nb: the cache has been closed (e.g. the webapp is being reloaded)
+            for key in keys:
+                row = self._conn.execute( "SELECT content FROM tagged WHERE key=?", (key,) ).fetchone()
+                if row is None:
+                    self.nmisses += 1
+                    continue
+                self.nhits += 1
+                self._clock += 1
+                self._conn.execute( "UPDATE tagged SET last_used=? WHERE key=?", ( self._clock, key ) )
+                results[ key ] = row[0]
+            self._maybe_commit()
+        return results
+
+    def put( self, key, content ):
+        """Save a result in the cache."""
+        self.put_many( [ ( key, content ) ] )
+
+    def put_many( self, entries ):
+        """Save multiple results in the cache (a list of ( key, content ) pairs)."""
+        with self._lock:
+            if self._conn is None:
+                return
+            for key, content in entries:
+                self._clock += 1
+                curs = self._conn.execute(
+                    "INSERT OR IGNORE INTO tagged ( key, content, last_used ) VALUES ( ?, ?, ? )",
+                    ( key, content, self._clock )
+                )
+                if curs.rowcount > 0:
+                    self._nentries += 1
+            if self._nentries > self.max_entries:
+                self._evict()
+            self._maybe_commit()
+
+    def flush( self ):
+        """Write any pending changes to disk."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.commit()
+            self._last_commit_time = time.time()
+        self._logger.debug( "Flushed the tag cache: #entries=%d, #hits=%d, #misses=%d",
+            self._nentries, self.nhits, self.nmisses
+        )
+
+    def close( self ):
+        """Close the cache."""
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def _evict( self ):
+        """Evict the least-recently used entries."""
+        # NOTE: We evict in blocks, to avoid having to do this every time a new entry is added.
+        nevict = self._nentries - self.max_entries + max( self.max_entries // 10, 1 )
+        self._conn.execute(
+            "DELETE FROM tagged WHERE key IN ( SELECT key FROM tagged ORDER BY last_used LIMIT ? )",
+            ( nevict, )
+        )
+        self._nentries = self._conn.execute( "SELECT count(*) FROM tagged" ).fetchone()[0]
+
+    def _maybe_commit( self ):
+        """Commit changes regularly (but not too often, since it's slow)."""
+        if time.time() - self._last_commit_time >= 1:
+            self._conn.commit()
+            self._last_commit_time = time.time()
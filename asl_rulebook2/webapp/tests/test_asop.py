@@ -2,6 +2,11 @@
 
 import os
 import json
+import gzip
+import urllib.request
+import urllib.error
+
+import pytest
 
 from asl_rulebook2.webapp.tests.test_search import do_search
 from asl_rulebook2.webapp.tests.utils import init_webapp, select_tabbed_page, \
@@ -261,6 +266,75 @@ def test_asop_entries( webdriver, webapp ):
 
 # ---------------------------------------------------------------------
 
+def test_asop_etags( webdriver, webapp ):
+    """Test ETags for ASOP content."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "asop" )
+    init_webapp( webapp, webdriver )
+
+    def get_content( endpoint, etag=None, **kwargs ):
+        req = urllib.request.Request( webapp.url_for( endpoint, **kwargs ) )
+        if etag:
+            req.add_header( "If-None-Match", etag )
+        with urllib.request.urlopen( req ) as resp:
+            return resp.read().decode( "utf-8" ), resp.headers[ "ETag" ]
+
+    for endpoint, kwargs in [
+        ( "get_asop_intro", {} ),
+        ( "get_asop_footer", {} ),
+        ( "get_asop_preamble", { "chapter_id": "movement" } ),
+        ( "get_asop_section", { "section_id": "movement-1" } ),
+    ]:
+        # get the content (twice, to make sure it's the same when it comes from the cache)
+        content, etag = get_content( endpoint, **kwargs )
+        assert content and etag
+        assert get_content( endpoint, **kwargs ) == ( content, etag )
+        # check that we get a 304 if the browser already has the content
+        with pytest.raises( urllib.error.HTTPError ) as exc_info:
+            get_content( endpoint, etag=etag, **kwargs )
+        assert exc_info.value.code == 304
+
+def test_asop_chapter( webdriver, webapp ):
+    """Test getting an entire ASOP chapter."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "asop" )
+    init_webapp( webapp, webdriver )
+
+    def get_chapter( chapter_id, accept_encoding=None ):
+        req = urllib.request.Request( webapp.url_for( "get_asop_chapter", chapter_id=chapter_id ) )
+        if accept_encoding:
+            req.add_header( "Accept-Encoding", accept_encoding )
+        with urllib.request.urlopen( req ) as resp:
+            data = resp.read()
+            if resp.headers.get( "Content-Encoding" ) == "gzip":
+                data = gzip.decompress( data )
+            return json.loads( data ), resp.headers[ "ETag" ]
+
+    # get a chapter, and check that it's the same as getting each piece individually
+    chapter, etag = get_chapter( "movement" )
+    assert chapter[ "chapter_id" ] == "movement"
+    def get_content( endpoint, **kwargs ):
+        with urllib.request.urlopen( webapp.url_for( endpoint, **kwargs ) ) as resp:
+            return resp.read().decode( "utf-8" )
+    assert chapter[ "preamble" ] == get_content( "get_asop_preamble", chapter_id="movement" )
+    assert "movement-1" in chapter[ "sections" ]
+    for section_id, content in chapter[ "sections" ].items():
+        assert content == get_content( "get_asop_section", section_id=section_id )
+
+    # check that we get the same thing if it's compressed
+    chapter2, etag2 = get_chapter( "movement", accept_encoding="gzip" )
+    assert chapter2 == chapter
+    assert etag2 != etag
+
+    # check getting an unknown chapter
+    with pytest.raises( urllib.error.HTTPError ) as exc_info:
+        get_chapter( "unknown" )
+    assert exc_info.value.code == 404
+
+# ---------------------------------------------------------------------
+
 def open_asop_chapter( chapter_id, nav=None ):
     """Open the specified ASOP chapter."""
     if not nav:
@@ -0,0 +1,86 @@
+""" Test data bundles. """
+
+import sys
+import os
+import shutil
+import subprocess
+import sqlite3
+import json
+import urllib.request
+
+import pytest
+
+from asl_rulebook2.webapp.bundle import BUNDLE_MANIFEST_FNAME, BUNDLE_SEARCHDB_FNAME
+from asl_rulebook2.webapp.tests import pytest_options
+from asl_rulebook2.webapp.tests.test_search import do_search
+from asl_rulebook2.webapp.tests.utils import init_webapp
+
+# ---------------------------------------------------------------------
+
+@pytest.mark.skipif( pytest_options.webapp_url is not None, reason="Can't configure data files on a remote server." )
+def test_data_bundle( webapp, webdriver, tmp_path ):
+    """Test building and using a data bundle."""
+
+    # initialize
+    data_dir = str( tmp_path / "data" )
+    shutil.copytree( os.path.join( os.path.dirname(__file__), "fixtures/full" ), data_dir )
+    bundle_dir = str( tmp_path / "bundle" )
+
+    # build the data bundle
+    subprocess.run(
+        [ sys.executable, "-m", "asl_rulebook2.webapp.bake", "--data", data_dir, "--output", bundle_dir ],
+        check=True, capture_output=True
+    )
+    with open( os.path.join( bundle_dir, BUNDLE_MANIFEST_FNAME ), "r", encoding="utf-8" ) as fp:
+        manifest = json.load( fp )
+
+    # NOTE: We change the bundle in ways that don't affect how things work, so that we can tell
+    # when things are being served from it:
+    # - add some whitespace to the start of the $/content-docs response
+    # - add a word to an index entry in the search database
+    fname = os.path.join( bundle_dir, manifest["payloads"]["/content-docs"]["fname"] )
+    with open( fname, "rb" ) as fp:
+        content_docs = b" " + fp.read()
+    with open( fname, "wb" ) as fp:
+        fp.write( content_docs )
+    with sqlite3.connect( os.path.join( bundle_dir, BUNDLE_SEARCHDB_FNAME ) ) as conn:
+        conn.execute( "UPDATE searchable SET content = coalesce( content, '' ) || ' xyzzy'"
+            " WHERE rowid = ( SELECT min(rowid) FROM searchable WHERE sr_type = 'index' )"
+        )
+        conn.commit()
+
+    def get_content_docs():
+        with urllib.request.urlopen( webapp.url_for( "get_content_docs" ) ) as resp:
+            return resp.read()
+
+    try:
+
+        # start the webapp, using the data bundle
+        # NOTE: We also configure a cache inside the data directory, which shouldn't stop the bundle
+        # from being used, even though it will be written to.
+        webapp.control_tests \
+            .set_app_config_val( "DATA_DIR", data_dir ) \
+            .set_app_config_val( "DATA_BUNDLE", bundle_dir ) \
+            .set_app_config_val( "TAG_RULEIDS_CACHE", os.path.join( data_dir, "tag-cache.db" ) )
+        init_webapp( webapp, webdriver )
+        assert get_content_docs() == content_docs
+        assert len( do_search( "xyzzy" ) ) == 1
+        assert os.path.isfile( os.path.join( data_dir, "tag-cache.db" ) )
+
+        # restart the webapp (the bundle should still be used)
+        init_webapp( webapp, webdriver )
+        assert get_content_docs() == content_docs
+
+        # change a data file, and restart the webapp (the bundle should be ignored)
+        with open( os.path.join( data_dir, "annotations.json" ), "a", encoding="utf-8" ) as fp:
+            fp.write( "\n" )
+        init_webapp( webapp, webdriver,
+            expected_warnings = [ "The data bundle doesn't match the data files, and will be ignored." ]
+        )
+        assert not get_content_docs().startswith( b" " )
+        assert do_search( "xyzzy" ) is None
+
+    finally:
+        webapp.control_tests \
+            .set_app_config_val( "DATA_BUNDLE", "" ) \
+            .set_app_config_val( "TAG_RULEIDS_CACHE", "" )
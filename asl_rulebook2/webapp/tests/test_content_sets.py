@@ -1,5 +1,19 @@
 """ Test how content sets are handled. """
 
+import os
+import shutil
+import json
+import threading
+import time
+import logging
+import urllib.request
+import urllib.error
+from collections import defaultdict
+
+import pytest
+
+from asl_rulebook2.webapp import app, content
+from asl_rulebook2.webapp.startup import StartupMsgs
 from asl_rulebook2.webapp.tests.utils import init_webapp, select_tabbed_page, get_curr_target, \
     set_stored_msg_marker, get_last_error_msg, find_child, find_children, wait_for, has_class
 from asl_rulebook2.webapp.tests.test_search import do_search
@@ -126,6 +140,258 @@ def test_chapters( webapp, webdriver ):
 
 # ---------------------------------------------------------------------
 
+def test_cached_responses( webapp, webdriver ):
+    """Test the caching of responses that don't change after startup."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "full" )
+    init_webapp( webapp, webdriver )
+
+    for endpoint in [ "get_content_docs", "get_footnotes", "get_content_css", "get_vo_note_targets" ]:
+
+        # get the response, and check its ETag
+        url = webapp.url_for( endpoint )
+        with urllib.request.urlopen( url ) as resp:
+            etag = resp.headers[ "ETag" ]
+            assert etag
+            assert resp.headers[ "Cache-Control" ] == "no-cache"
+            data = resp.read()
+        with urllib.request.urlopen( url ) as resp:
+            assert resp.headers[ "ETag" ] == etag
+            assert resp.read() == data
+
+        # check that we get a 304 if the browser's copy is still valid
+        req = urllib.request.Request( url, headers={ "If-None-Match": etag } )
+        with pytest.raises( urllib.error.HTTPError ) as exc_info:
+            urllib.request.urlopen( req )
+        assert exc_info.value.code == 304
+
+# ---------------------------------------------------------------------
+
+def test_target_lookups( webapp, webdriver ):
+    """Test looking up targets."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "full" )
+    init_webapp( webapp, webdriver )
+
+    def get_json( endpoint, **kwargs ):
+        with urllib.request.urlopen( webapp.url_for( endpoint, **kwargs ) ) as resp:
+            return json.load( resp )
+
+    # find the main rulebook
+    content_docs = get_json( "get_content_docs" )
+    cdoc = next( c for c in content_docs.values() if "A1" in c.get( "targets", {} ) )
+    cdoc_id = cdoc["cdoc_id"]
+
+    # look up a single target
+    assert get_json( "get_target", cdoc_id=cdoc_id, ruleid="A1" ) == cdoc["targets"]["A1"]
+    for cdoc_id2, ruleid in [ (cdoc_id,"XYZ"), ("unknown","A1") ]:
+        with pytest.raises( urllib.error.HTTPError ) as exc_info:
+            get_json( "get_target", cdoc_id=cdoc_id2, ruleid=ruleid )
+        assert exc_info.value.code == 404
+
+    # look up multiple targets
+    assert get_json( "get_targets", cdoc_id=cdoc_id ) == cdoc["targets"]
+    assert get_json( "get_targets", cdoc_id=cdoc_id, ruleids="A1,XYZ,A2" ) == {
+        "A1": cdoc["targets"]["A1"], "A2": cdoc["targets"]["A2"]
+    }
+    assert get_json( "get_targets", cdoc_id=cdoc_id, ruleids="A1", fields="caption" ) == {
+        "A1": { "caption": "PERSONNEL COUNTERS" }
+    }
+
+    # leave the targets out of the content docs
+    webapp.control_tests.set_app_config_val( "CONTENT_DOC_TARGETS", "none" )
+    init_webapp( webapp, webdriver, add_empty_doc=1 )
+    cdoc2 = get_json( "get_content_docs" )[ cdoc_id ]
+    assert "targets" not in cdoc2
+    assert cdoc2["ntargets"] == len( cdoc["targets"] )
+    assert cdoc2["targets_url"].endswith( "/targets/" + cdoc_id )
+
+    # make sure that the front-end still knows about the targets (it loads them in the background)
+    select_tabbed_page( "content", "empty" )
+    do_search( "A1" )
+    wait_for( 2, lambda: get_curr_target() == ( cdoc_id, "A1" ) )
+
+    # return only the captions in the content docs
+    webapp.control_tests.set_app_config_val( "CONTENT_DOC_TARGETS", "captions" )
+    init_webapp( webapp, webdriver )
+    cdoc2 = get_json( "get_content_docs" )[ cdoc_id ]
+    assert cdoc2["targets"] == {
+        ruleid: { "caption": target["caption"] }
+        for ruleid, target in cdoc["targets"].items()
+    }
+    webapp.control_tests.set_app_config_val( "CONTENT_DOC_TARGETS", "full" ) # nb: restore the default
+
+# ---------------------------------------------------------------------
+
+def test_lazy_load( tmp_path, monkeypatch ):
+    """Test loading the content doc data files on demand."""
+
+    # NOTE: We do this in-process, so that we can see which data files are being loaded.
+
+    # initialize
+    data_dir = str( tmp_path / "data" )
+    shutil.copytree( os.path.join( os.path.dirname(__file__), "fixtures/full" ), data_dir )
+    manifest_cache = str( tmp_path / "manifest.json" )
+    for key, val in [
+        ( "DATA_DIR", data_dir ), ( "LAZY_LOAD_CONTENT", True ), ( "CONTENT_DOC_TARGETS", "none" ),
+        ( "CONTENT_MANIFEST_CACHE", manifest_cache ), ( "PACKED_DATA_CACHE", None ), ( "TAG_RULEIDS_CACHE", None )
+    ]:
+        monkeypatch.setitem( app.config, key, val )
+    index_fnames = set( [ "ASL Rulebook.index", "Kampfgruppe Scherer.index" ] )
+    targets_fnames = set( [
+        "ASL Rulebook.targets", "ASL Rulebook (Red Barricades).targets", "Kampfgruppe Scherer.targets"
+    ] )
+
+    # keep track of which data files are loaded
+    # nb: we also slow things down, to give other threads a chance to load the same file at the same time
+    loaded = defaultdict( int )
+    orig_load_data_file = content.load_data_file
+    def load_data_file( fname, *args ):
+        loaded[ os.path.basename( fname ) ] += 1
+        time.sleep( 0.1 )
+        return orig_load_data_file( fname, *args )
+    monkeypatch.setattr( content, "load_data_file", load_data_file )
+
+    def load_content_sets():
+        loaded.clear()
+        with app.test_request_context():
+            content.load_content_sets( StartupMsgs(), logging.getLogger( "test" ) )
+        assert set( loaded ) == index_fnames # nb: only the index files should be loaded at startup
+        loaded.clear()
+    def get_content_docs():
+        with app.test_request_context():
+            return json.loads( content._make_content_docs().get_data() ) #pylint: disable=protected-access
+
+    # load the targets from multiple threads (each targets file should only be loaded once)
+    load_content_sets()
+    cdoc_ids = list( content._cdoc_index ) #pylint: disable=protected-access
+    threads = [
+        threading.Thread( target=lambda: [
+            content._get_targets( cdoc_id ) #pylint: disable=protected-access
+            for cdoc_id in cdoc_ids
+        ] )
+        for _ in range( 5 )
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loaded == { fname: 1 for fname in targets_fnames }
+    assert len( content._get_targets( "asl-rulebook!" ) ) > 0 #pylint: disable=protected-access
+
+    # get the content docs (the data files need to be loaded, and the manifest cache is created)
+    load_content_sets()
+    cdocs = get_content_docs()
+    assert targets_fnames.issubset( loaded ) and "ASL Rulebook.chapters" in loaded
+    assert all( n == 1 for n in loaded.values() )
+    assert os.path.isfile( manifest_cache )
+    with open( os.path.join( data_dir, "ASL Rulebook.targets" ), "r", encoding="utf-8" ) as fp:
+        assert cdocs["asl-rulebook!"]["ntargets"] == len( json.load( fp ) )
+
+    # reload, and get the content docs again (everything should come from the manifest cache)
+    load_content_sets()
+    assert get_content_docs() == cdocs
+    assert "<span data-ruleid='A1' " in content.tag_ruleids( "See A1.", None )
+    assert not loaded
+
+    # make sure we get the same results when loading the data files normally
+    monkeypatch.setitem( app.config, "LAZY_LOAD_CONTENT", False )
+    with app.test_request_context():
+        content.load_content_sets( StartupMsgs(), logging.getLogger( "test" ) )
+    assert get_content_docs() == cdocs
+    monkeypatch.setitem( app.config, "LAZY_LOAD_CONTENT", True )
+
+    # change a data file (it should be re-loaded)
+    with open( os.path.join( data_dir, "Kampfgruppe Scherer.targets" ), "a", encoding="utf-8" ) as fp:
+        fp.write( "\n" )
+    load_content_sets()
+    assert get_content_docs() == cdocs
+    assert loaded == { "Kampfgruppe Scherer.targets": 1 }
+
+# ---------------------------------------------------------------------
+
+def test_send_pdf( tmp_path, monkeypatch ):
+    """Test sending PDF files."""
+
+    # initialize
+    #pylint: disable=protected-access
+    data_dir = str( tmp_path / "data" )
+    os.makedirs( os.path.join( data_dir, "chapters" ) )
+    fname = os.path.join( data_dir, "chapters", "Chapter A (#1).pdf" )
+    pdf_data = b"%PDF-1.4\n" + bytes( range(256) ) * 16
+    with open( fname, "wb" ) as fp:
+        fp.write( pdf_data )
+    monkeypatch.setitem( app.config, "DATA_DIR", data_dir )
+
+    def send_pdf( headers=None ):
+        with app.test_request_context( headers=headers ):
+            return content._send_pdf( fname )
+
+    # send the file ourself
+    monkeypatch.setitem( app.config, "PDF_OFFLOAD", "" )
+    monkeypatch.setitem( app.config, "PDF_BUFFER_SIZE", 1000 )
+    resp = send_pdf()
+    try:
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/pdf"
+        assert resp.headers["Accept-Ranges"] == "bytes"
+        assert resp.content_length == len( pdf_data )
+        assert b"".join( resp.response ) == pdf_data
+    finally:
+        resp.close()
+
+    # request part of the file (this is what PDF.js does, to get the end of the file first)
+    resp = send_pdf( { "Range": "bytes=-100" } )
+    try:
+        assert resp.status_code == 206
+        assert resp.headers["Content-Range"] == "bytes {}-{}/{}".format(
+            len(pdf_data)-100, len(pdf_data)-1, len(pdf_data)
+        )
+        assert b"".join( resp.response ) == pdf_data[-100:]
+    finally:
+        resp.close()
+    resp = send_pdf( { "Range": "bytes=10-2009" } )
+    try:
+        assert resp.status_code == 206
+        assert b"".join( resp.response ) == pdf_data[10:2010]
+    finally:
+        resp.close()
+
+    # check that the browser can use its cached copy
+    resp = send_pdf()
+    etag = resp.headers["ETag"]
+    resp.close()
+    resp = send_pdf( { "If-None-Match": etag } )
+    assert resp.status_code == 304
+    resp.close()
+
+    # get nginx to send the file
+    monkeypatch.setitem( app.config, "PDF_OFFLOAD", "x-accel-redirect" )
+    resp = send_pdf()
+    assert resp.mimetype == "application/pdf"
+    assert resp.headers["X-Accel-Redirect"] == "/asl-rulebook2-data/chapters/Chapter%20A%20%28%231%29.pdf"
+    assert not resp.get_data()
+    monkeypatch.setitem( app.config, "PDF_OFFLOAD_PREFIX", "/pdfs/" )
+    resp = send_pdf()
+    assert resp.headers["X-Accel-Redirect"] == "/pdfs/chapters/Chapter%20A%20%28%231%29.pdf"
+
+    # get Apache to send the file
+    monkeypatch.setitem( app.config, "PDF_OFFLOAD", "x-sendfile" )
+    resp = send_pdf()
+    assert resp.mimetype == "application/pdf"
+    assert resp.headers["X-Sendfile"] == fname
+    assert "X-Accel-Redirect" not in resp.headers
+    assert not resp.get_data()
+
+    # check that an invalid setting is reported
+    monkeypatch.setitem( app.config, "PDF_OFFLOAD", "unknown" )
+    with pytest.raises( RuntimeError ):
+        send_pdf()
+
+# ---------------------------------------------------------------------
+
 def _unload_chapters():
     """Unload the chapters and their entries."""
     chapters = []
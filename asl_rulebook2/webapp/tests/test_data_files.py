@@ -0,0 +1,89 @@
+""" Test loading data files. """
+
+import os
+import time
+import logging
+
+import pytest
+
+from asl_rulebook2.webapp import app, utils
+
+# ---------------------------------------------------------------------
+
+def test_load_data_files( tmp_path, monkeypatch ):
+    """Test loading data files in parallel."""
+
+    # initialize
+    fixtures_dir = os.path.join( os.path.dirname(__file__), "fixtures/full" )
+    fnames = [
+        os.path.join( fixtures_dir, "q+a", "demo.json" ),
+        os.path.join( fixtures_dir, "errata", "demo.json" ),
+        os.path.join( fixtures_dir, "annotations.json" ),
+        os.path.join( fixtures_dir, "q+a", "sources.json" ),
+        os.path.join( fixtures_dir, "asop", "index.json" ),
+    ]
+    logger = logging.getLogger( "test" )
+    monkeypatch.setitem( app.config, "DISABLE_FAST_JSON_PARSER", True )
+    expected = [ utils.load_data_file( fname, "test", "json", logger, None ) for fname in fnames ]
+    assert all( expected )
+
+    # NOTE: We make the earlier files slower to load, so that they finish after the later ones.
+    orig_load_data_file = utils.load_data_file
+    def load_data_file( fname, *args ):
+        time.sleep( 0.05 * ( len(fnames) - fnames.index(fname) ) if fname in fnames else 0 )
+        return orig_load_data_file( fname, *args )
+    monkeypatch.setattr( utils, "load_data_file", load_data_file )
+
+    # load the files (they should be returned in the same order as the files)
+    for nthreads in ( 1, 2, 10 ):
+        monkeypatch.setitem( app.config, "DATA_FILE_THREADS", nthreads )
+        assert utils.load_data_files( fnames, "test", "json", logger, None ) == expected
+
+    # check that a file that can't be loaded is reported
+    bad_fname = str( tmp_path / "bad.json" )
+    with open( bad_fname, "w", encoding="utf-8" ) as fp:
+        fp.write( "{ not json" )
+    errors = []
+    data = utils.load_data_files( [ fnames[0], bad_fname, fnames[1] ], "test", "json", logger,
+        lambda msg, ex: errors.append( msg )
+    )
+    assert data == [ expected[0], None, expected[1] ]
+    assert errors == [ "Couldn't load \"bad.json\"." ]
+
+# ---------------------------------------------------------------------
+
+@pytest.mark.skipif( utils.orjson is None, reason="orjson is not installed." )
+def test_fast_json_parser( monkeypatch ):
+    """Test loading data files with orjson."""
+
+    # initialize
+    fixtures_dir = os.path.join( os.path.dirname(__file__), "fixtures/full" )
+    fnames = [
+        os.path.join( root, fname )
+        for root, _, fnames in os.walk( fixtures_dir )
+        for fname in fnames
+        if fname.endswith( ".json" )
+    ]
+    logger = logging.getLogger( "test" )
+    monkeypatch.setitem( app.config, "DATA_FILE_THREADS", 4 )
+
+    # keep track of when orjson is used
+    nloads = [ 0 ]
+    class FakeOrjson: #pylint: disable=too-few-public-methods
+        """Stand-in for orjson."""
+        @staticmethod
+        def loads( data ): #pylint: disable=missing-function-docstring
+            nloads[0] += 1
+            return orig_orjson.loads( data ) #pylint: disable=no-member
+    orig_orjson = utils.orjson
+    monkeypatch.setattr( utils, "orjson", FakeOrjson )
+
+    # load the files using the standard library
+    monkeypatch.setitem( app.config, "DISABLE_FAST_JSON_PARSER", True )
+    expected = utils.load_data_files( fnames, "test", "json", logger, None )
+    assert nloads[0] == 0
+
+    # load the files using orjson (we should get the same results)
+    monkeypatch.setitem( app.config, "DISABLE_FAST_JSON_PARSER", False )
+    assert utils.load_data_files( fnames, "test", "json", logger, None ) == expected
+    assert nloads[0] == len( fnames )
@@ -0,0 +1,44 @@
+""" Test applying fixups to Q+A and errata content. """
+
+import re
+
+from asl_rulebook2.webapp.fixups import Fixups
+
+# ---------------------------------------------------------------------
+
+def test_fixups():
+    """Test applying fixups."""
+
+    def do_test( replace, content, expected, expected_nstages ):
+        fixups = Fixups( { "replace": replace } )
+        assert fixups( content ) == expected
+        assert fixups.nstages == expected_nstages
+        # compare the results with applying each fixup in turn (which is how it used to be done)
+        assert fixups( content ) == _apply_fixups( replace, content )
+
+    # test some simple cases
+    do_test( {}, "Nothing to do.", "Nothing to do.", 0 )
+    do_test( { "foo": "bar" }, "foo bar foo", "bar bar bar", 1 )
+    do_test( { "FOO": "foo", "BAR": "bar" }, "FOO BAR BAZ", "foo bar BAZ", 1 )
+    do_test( {}, "See [EXC: this].", "See <span class='exc'>[EXC: this]</span>.", 0 )
+
+    # test fixups that interact with each other
+    do_test( { "ab": "X", "bc": "Y" }, "abc", "Xc", 2 )
+    do_test( { "a": "b", "b": "c" }, "ab", "cc", 2 )
+    do_test( { "a": "x", "xb": "y" }, "ab", "y", 2 )
+    do_test( { "b": "", "ac": "z" }, "abc", "z", 2 )
+
+    # test a lot of fixups (so that a regex is used)
+    replace = { "WORD{}X".format( i ): "word{}".format( i ) for i in range( 100 ) }
+    replace[ "word5" ] = "!!!" # nb: this interacts with one of the previous fixups
+    content = " ".join( "WORD{}X".format( i ) for i in range( 0, 120, 5 ) )
+    do_test( replace, content,
+        _apply_fixups( replace, content ), 2
+    )
+    assert "word10 word15" in Fixups( { "replace": replace } )( content )
+
+def _apply_fixups( replace, content ):
+    """Apply each fixup in turn."""
+    for search_for, replace_with in replace.items():
+        content = content.replace( search_for, replace_with )
+    return re.sub( r"\[EXC: .*?\]", r"<span class='exc'>\g<0></span>", content )
@@ -0,0 +1,50 @@
+""" Test reporting memory usage. """
+
+import json
+import urllib.request
+import urllib.error
+
+import pytest
+
+from asl_rulebook2.webapp.memory import get_deep_size
+from asl_rulebook2.webapp.records import IndexEntry
+from asl_rulebook2.webapp.tests.utils import init_webapp
+
+# ---------------------------------------------------------------------
+
+def test_deep_size():
+    """Test calculating the size of objects."""
+
+    # check that shared objects are only counted once
+    val = [ "x" * 1000 ]
+    size, nobjs, _ = get_deep_size( [ val, val ] )
+    assert nobjs == 3
+    assert size > 1000 and size < 2000
+
+    # check that we look inside records
+    entry = IndexEntry.from_json( { "title": "x" * 1000, "_comment_": "y" * 1000 } )
+    size, _, _ = get_deep_size( entry )
+    assert size > 2000
+
+# ---------------------------------------------------------------------
+
+def test_memory_report( webapp, webdriver ):
+    """Test the memory report."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "full" )
+    init_webapp( webapp, webdriver )
+
+    # check that the memory report is disabled by default
+    url = webapp.url_for( "get_memory_usage" )
+    with pytest.raises( urllib.error.HTTPError ) as exc_info:
+        urllib.request.urlopen( url ) #pylint: disable=consider-using-with
+    assert exc_info.value.code == 404
+
+    # enable the memory report
+    webapp.control_tests.set_app_config_val( "ENABLE_MEMORY_REPORT", True )
+    with urllib.request.urlopen( url ) as resp:
+        report = json.load( resp )
+    assert report["subsystems"]["content-sets"]["size"] > 0
+    assert report["subsystems"]["search-index"]["objects"] > 0
+    webapp.control_tests.set_app_config_val( "ENABLE_MEMORY_REPORT", False )
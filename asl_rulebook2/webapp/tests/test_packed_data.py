@@ -0,0 +1,57 @@
+""" Test the packed data cache. """
+
+import os
+import json
+import logging
+
+from asl_rulebook2.webapp.packed_data import load_packed_data_file, unpack_data, PackedRecords
+
+# ---------------------------------------------------------------------
+
+def test_packed_data( tmpdir ):
+    """Test packing data files."""
+
+    # initialize
+    cache_dir = os.path.join( tmpdir, "cache" )
+    logger = logging.getLogger( "test" )
+
+    def do_test( data ):
+        fname = os.path.join( tmpdir, "test.json" )
+        with open( fname, "w", encoding="utf-8" ) as fp:
+            json.dump( data, fp )
+        return load_packed_data_file( fname, cache_dir, logger )
+
+    # test packing targets
+    targets = {
+        "A1": { "caption": "PERSONNEL COUNTERS", "page_no": 3, "pos": [ 100, 200 ] },
+        "A.2": { "caption": "ERRORS é" },
+        "B3": { "page_no": 12, "pos": [ -5, 0 ] },
+    }
+    packed = do_test( targets )
+    assert isinstance( packed, PackedRecords )
+    assert len( packed ) == 3
+    assert list( packed ) == [ "A1", "A.2", "B3" ] # nb: the original order is preserved
+    assert packed[ "A1" ] == targets[ "A1" ]
+    assert packed.get_caption( "A.2" ) == "ERRORS é"
+    assert "B3" in packed and "XYZ" not in packed and packed.get( "XYZ" ) is None
+    assert unpack_data( packed ) == targets
+
+    # test packing nested data (like the vehicle/ordnance notes)
+    vo_notes = {
+        "german": {
+            "vehicles": { "1": { "caption": "PzKpfw IVH", "page_no": 5 } },
+            "ordnance": {},
+        },
+        "landing-craft": { "1": { "caption": "LCVP", "page_no": 7, "pos": [ 1, 2 ] } },
+    }
+    packed = do_test( vo_notes )
+    assert isinstance( packed["german"]["vehicles"], PackedRecords )
+    assert unpack_data( packed ) == vo_notes
+
+    # test data that can't be packed
+    assert do_test( { "A1": { "caption": "Foo", "extra": 1 } } ) is None
+    assert do_test( { "A1": { "caption": "Foo", "pos": [ 1.5, 2 ] } } ) is None
+
+    # check that the packed data file is rebuilt if the data file changes
+    assert unpack_data( do_test( targets ) ) == targets
+    assert unpack_data( do_test( { "A1": { "caption": "Changed!" } } ) ) == { "A1": { "caption": "Changed!" } }
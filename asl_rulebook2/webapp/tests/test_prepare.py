@@ -1,6 +1,8 @@
 """ Test preparing the data files. """
 
+import sys
 import os
+import subprocess
 import json
 import zipfile
 import io
@@ -97,6 +99,20 @@ def test_full_prepare( webapp, webdriver ):
 
 # ---------------------------------------------------------------------
 
+def test_deferred_imports():
+    """Test that the PDF toolchain is not loaded when the webapp starts."""
+
+    # NOTE: We do this in a new process, since other tests may have already loaded these modules.
+    code = "import sys, asl_rulebook2.webapp ; print( ' '.join( sys.modules.keys() ) )"
+    proc = subprocess.run( [ sys.executable, "-c", code ],
+        capture_output=True, text=True, check=True
+    )
+    modules = set( proc.stdout.split() )
+    for module_name in [ "pdfminer", "pikepdf", "grpc", "asl_rulebook2.extract.all" ]:
+        assert module_name not in modules
+
+# ---------------------------------------------------------------------
+
 def _unload_progress():
     """Unload the progress messages."""
 
@@ -1,5 +1,15 @@
 """ Test Q+A. """
 
+import os
+import io
+import json
+import urllib.request
+import urllib.error
+
+import pytest
+from PIL import Image
+
+from asl_rulebook2.webapp.thumbnails import get_thumbnail, _get_cache_dir
 from asl_rulebook2.webapp.tests.utils import init_webapp, \
     check_sr_filters, find_child, find_children, wait_for_elem, get_image_filename, unload_elem, unload_sr_text
 from asl_rulebook2.webapp.tests.test_search import do_search
@@ -129,6 +139,84 @@ def test_missing_answer( webapp, webdriver ):
 
 # ---------------------------------------------------------------------
 
+def test_rule_info_batch( webapp, webdriver ):
+    """Test getting the Q+A for multiple ruleid's, and how many each one has."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "qa" )
+    init_webapp( webapp, webdriver )
+
+    def get_json( endpoint, **kwargs ):
+        with urllib.request.urlopen( webapp.url_for( endpoint, **kwargs ) ) as resp:
+            return json.load( resp )
+
+    # get the Q+A for a single ruleid
+    rule_info = get_json( "get_rule_info", ruleid="E1" )
+    assert [ ri["caption"] for ri in rule_info ] == [ "F1", "I1", "Missing content", "N1" ]
+    assert all( ri["ri_type"] == "qa" for ri in rule_info )
+    assert get_json( "get_rule_info", ruleid="XYZ" ) == []
+
+    # get the Q+A for multiple ruleid's
+    rule_info2 = get_json( "get_rule_info_batch", ruleids="E1,F1,XYZ,E1" )
+    assert list( rule_info2.keys() ) == [ "E1", "F1" ]
+    assert rule_info2["E1"] == rule_info
+    assert rule_info2["F1"] == get_json( "get_rule_info", ruleid="F1" )
+    assert get_json( "get_rule_info_batch" ) == {}
+
+    # check the number of Q+A entries for each ruleid
+    assert get_json( "get_rule_info_counts" ) == {
+        "E1": { "qa": 4 },
+        "F1": { "qa": 1 }, "I1": { "qa": 1 }, "M1": { "qa": 1 }, "N1": { "qa": 1 },
+    }
+
+# ---------------------------------------------------------------------
+
+def test_qa_thumbnails( webapp, webdriver ):
+    """Test generating thumbnails of Q+A images."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "qa" )
+    init_webapp( webapp, webdriver )
+
+    def get_image( endpoint, **kwargs ):
+        with urllib.request.urlopen( webapp.url_for( endpoint, **kwargs ) ) as resp:
+            assert resp.headers[ "ETag" ]
+            assert "max-age" in resp.headers[ "Cache-Control" ]
+            return Image.open( io.BytesIO( resp.read() ) ).size
+
+    # get the full-size image
+    fname = "thought-bubble.png"
+    assert get_image( "get_qa_image", fname=fname ) == ( 129, 124 )
+
+    # get some thumbnails (sizes are rounded up to a multiple of 50)
+    assert get_image( "get_qa_thumbnail", size="x40", fname=fname ) == ( 52, 50 )
+    assert get_image( "get_qa_thumbnail", size="50", fname=fname ) == ( 50, 48 )
+    assert get_image( "get_qa_thumbnail", size="100x50", fname=fname ) == ( 52, 50 )
+    assert get_image( "get_qa_thumbnail", size="x40", fname=fname ) == ( 52, 50 ) # nb: this will be cached
+
+    # check that images are never made bigger
+    assert get_image( "get_qa_thumbnail", size="x500", fname=fname ) == ( 129, 124 )
+
+    # check invalid requests
+    for size, fname2 in [ ("xyz",fname), ("0",fname), ("x",fname), ("x100","unknown.png") ]:
+        with pytest.raises( urllib.error.HTTPError ) as exc_info:
+            get_image( "get_qa_thumbnail", size=size, fname=fname2 )
+        assert exc_info.value.code == 404
+
+def test_bad_qa_thumbnail( tmp_path ):
+    """Test generating a thumbnail of an image that can't be loaded."""
+
+    # try to generate a thumbnail of a corrupt image (we should get back the original file)
+    fname = str( tmp_path / "corrupt.png" )
+    with open( fname, "wb" ) as fp:
+        fp.write( b"\x89PNG\r\n\x1a\n" + b"x" * 100 )
+    assert get_thumbnail( fname, 50, None ) == fname
+
+    # make sure nothing was left behind in the cache
+    assert not [ f for f in os.listdir( _get_cache_dir() ) if f.endswith( ".tmp" ) ]
+
+# ---------------------------------------------------------------------
+
 def unload_qa( qa_elem ):
     """Unload a Q+A entry from the UI."""
 
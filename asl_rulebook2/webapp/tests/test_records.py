@@ -0,0 +1,46 @@
+""" Test the record types used to hold rule data. """
+
+import copy
+import json
+
+from asl_rulebook2.webapp.records import IndexEntry, Annotation, RecordJSONEncoder, to_json
+
+# ---------------------------------------------------------------------
+
+def test_records():
+    """Test records."""
+
+    # create a record
+    vals = {
+        "title": "Test entry",
+        "ruleids": [ "A1", "B2" ],
+        "rulerefs": [ { "caption": "A ruleref", "ruleids": [ "C3" ] } ],
+        "_comment_": "This is not a known field.",
+    }
+    entry = IndexEntry.from_json( vals )
+    assert not hasattr( entry, "__dict__" )
+    assert entry == vals
+    assert entry["title"] == "Test entry"
+    assert "subtitle" not in entry and entry.get( "subtitle" ) is None
+    assert entry["_comment_"] == "This is not a known field."
+
+    # update the record
+    entry[ "_fts_rowid" ] = 42
+    entry[ "cset_id" ] = "test"
+    del entry[ "_comment_" ]
+    assert set( entry.keys() ) == set( [ "title", "ruleids", "rulerefs", "_fts_rowid", "cset_id" ] )
+
+    # check that copies are independent of the original
+    entry2 = copy.deepcopy( entry )
+    entry2[ "title" ] = "Changed!"
+    entry3 = to_json( entry )
+    assert isinstance( entry3, dict ) and isinstance( entry3["rulerefs"][0], dict )
+    entry3[ "rulerefs" ][0][ "caption" ] = "Changed!"
+    assert entry["title"] == "Test entry" and entry["rulerefs"][0]["caption"] == "A ruleref"
+
+    # check converting the record to JSON
+    assert json.loads( json.dumps( entry, cls=RecordJSONEncoder ) ) == to_json( entry )
+
+    # check that ruleid's are interned
+    anno = Annotation.from_json( { "ruleid": "".join( [ "A", "1.23" ] ) } )
+    assert anno["ruleid"] is IndexEntry.from_json( { "ruleids": [ "A1.23" ] } )["ruleids"][0]
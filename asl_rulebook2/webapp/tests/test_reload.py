@@ -0,0 +1,146 @@
+""" Test reloading data files when they change. """
+
+import os
+import shutil
+import threading
+import time
+
+from asl_rulebook2.webapp import app, reload, startup
+from asl_rulebook2.webapp.tests.utils import wait_for
+
+# ---------------------------------------------------------------------
+
+def test_get_subsystem():
+    """Test figuring out which subsystem a data file belongs to."""
+
+    #pylint: disable=protected-access
+    for path, expected in [
+        ( "q+a/demo.json", "qa" ),
+        ( "q+a/images/foo.png", "qa" ),
+        ( "errata/demo.json", "errata" ),
+        ( "asop/index.json", "asop" ),
+        ( "annotations.json", "user-anno" ),
+        ( "search-replacements.json", "search-config" ),
+        ( "search-aliases.json", "search-config" ),
+        ( "search-notes.txt", "content" ),
+        ( "ASL Rulebook.targets", "content" ),
+        ( "modules/annotations.json", "content" ),
+    ]:
+        assert reload._get_subsystem( path.replace( "/", os.sep ) ) == expected
+
+# ---------------------------------------------------------------------
+
+def test_data_watcher( tmp_path, monkeypatch ):
+    """Test watching the data directory for changes."""
+
+    # initialize
+    data_dir = str( tmp_path / "data" )
+    shutil.copytree( os.path.join( os.path.dirname(__file__), "fixtures/full" ), data_dir )
+    cache_fname = os.path.join( data_dir, "tag-cache.db" )
+    monkeypatch.setitem( app.config, "DATA_DIR", data_dir )
+    monkeypatch.setitem( app.config, "TAG_RULEIDS_CACHE", cache_fname )
+    reload.get_pending_reloads()
+
+    # NOTE: We run the watcher in-process, and make it poll a lot faster than it normally would.
+    class FastPoll:
+        """Stand-in for the shutdown event."""
+        def __init__( self ):
+            self.stopped = False
+        def wait( self, timeout ): #pylint: disable=unused-argument,missing-function-docstring
+            time.sleep( 0.05 )
+            return self.stopped
+    fast_poll = FastPoll()
+    monkeypatch.setattr( reload, "shutdown_event", fast_poll )
+    thread = threading.Thread( target=reload._watch_data_dir, args=(1,), daemon=True ) #pylint: disable=protected-access
+    thread.start()
+
+    pending_reloads = set()
+    def check_pending_reloads( expected ):
+        if expected:
+            wait_for( 2, lambda: pending_reloads.update( reload.get_pending_reloads() ) or pending_reloads == expected )
+        else:
+            time.sleep( 0.5 )
+            assert not reload.get_pending_reloads()
+        pending_reloads.clear()
+
+    def touch( fname ):
+        st = os.stat( fname )
+        os.utime( fname, ns=( st.st_atime_ns, st.st_mtime_ns + 1000*1000*1000 ) )
+
+    try:
+
+        # write to a cache inside the data directory (this should not trigger a reload)
+        time.sleep( 0.2 ) # nb: give the watcher a chance to take its first snapshot
+        for fname in [ cache_fname, cache_fname+"-journal" ]:
+            with open( fname, "w", encoding="utf-8" ) as fp:
+                fp.write( "cache" )
+        check_pending_reloads( None )
+
+        # touch a Q+A file (only the Q+A should be reloaded)
+        touch( os.path.join( data_dir, "q+a", "demo.json" ) )
+        check_pending_reloads( set( [ "qa" ] ) )
+
+        # change some other data files
+        touch( os.path.join( data_dir, "errata", "demo.json" ) )
+        with open( os.path.join( data_dir, "annotations.json" ), "a", encoding="utf-8" ) as fp:
+            fp.write( "\n" )
+        check_pending_reloads( set( [ "errata", "user-anno" ] ) )
+
+        # add and remove a content set file
+        with open( os.path.join( data_dir, "New Module.index" ), "w", encoding="utf-8" ) as fp:
+            fp.write( "[]" )
+        check_pending_reloads( set( [ "content" ] ) )
+        os.unlink( os.path.join( data_dir, "New Module.index" ) )
+        check_pending_reloads( set( [ "content" ] ) )
+
+        # make sure that temp files are ignored
+        with open( os.path.join( data_dir, "q+a", ".demo.json.swp" ), "w", encoding="utf-8" ) as fp:
+            fp.write( "temp" )
+        check_pending_reloads( None )
+
+    finally:
+        fast_poll.stopped = True
+        thread.join()
+        reload.get_pending_reloads()
+
+# ---------------------------------------------------------------------
+
+def test_apply_pending_reloads( monkeypatch ):
+    """Test applying pending reloads."""
+
+    # initialize
+    calls = []
+    reload_ok = [ True ]
+    def reload_data( subsystems ):
+        calls.append( ( "reload_data", subsystems ) )
+        return reload_ok[0]
+    monkeypatch.setattr( startup, "init_webapp", lambda: calls.append( ( "init_webapp", None ) ) )
+    monkeypatch.setattr( startup, "reload_data", reload_data )
+    monkeypatch.setattr( startup, "invalidate_data_bundle", lambda: calls.append( ( "invalidate_data_bundle", None ) ) )
+    reload.get_pending_reloads()
+
+    # check that nothing happens if nothing has changed
+    startup.apply_pending_reloads()
+    assert not calls
+
+    # check that only the affected subsystems are reloaded
+    reload.flag_pending_reloads( [ "qa" ] )
+    reload.flag_pending_reloads( [ "errata" ] )
+    startup.apply_pending_reloads()
+    assert calls == [ ( "invalidate_data_bundle", None ), ( "reload_data", set( [ "qa", "errata" ] ) ) ]
+    assert not reload.get_pending_reloads()
+
+    # check that everything is reloaded if a content set has changed
+    del calls[:]
+    reload.flag_pending_reloads( [ "qa", "content" ] )
+    startup.apply_pending_reloads()
+    assert calls == [ ( "invalidate_data_bundle", None ), ( "init_webapp", None ) ]
+    assert not reload.get_pending_reloads()
+
+    # check that the reload is tried again later if it can't be done now (e.g. the startup tasks are running)
+    del calls[:]
+    reload_ok[0] = False
+    reload.flag_pending_reloads( [ "asop" ] )
+    startup.apply_pending_reloads()
+    assert calls[-1] == ( "reload_data", set( [ "asop" ] ) )
+    assert reload.get_pending_reloads() == set( [ "asop" ] )
@@ -0,0 +1,136 @@
+""" Test finding ruleid's in content. """
+
+import re
+import logging
+
+from asl_rulebook2.webapp import content
+from asl_rulebook2.webapp.ruleid_matcher import RuleidMatcher
+from asl_rulebook2.webapp.tag_cache import TagCache
+
+# ---------------------------------------------------------------------
+
+def test_ruleid_matcher():
+    """Test finding ruleid's in content."""
+
+    # initialize
+    ruleids = [ "A1", "A1.2", "A1.23", "A1.234", "B3", "KGS_CG1", "O6.7" ]
+    matcher = RuleidMatcher( ruleids )
+
+    def do_test( content, expected ):
+        matches = [
+            ( content[ m[0] : m[1] ], m[2] )
+            for m in matcher.find_matches( content )
+        ]
+        assert matches == expected
+        # compare the results with the per-ruleid regex's that used to be used
+        assert [ m[:2] for m in matcher.find_matches( content ) ] == _find_with_regexes( content, ruleids )
+
+    # test some simple cases
+    do_test( "", [] )
+    do_test( "No ruleid's here.", [] )
+    do_test( "See A1.", [ ("A1","A1") ] )
+    do_test( "See A1.23.", [ ("A1.23","A1.23"), ("A1","A1") ] )
+    do_test( "A1.2 and B3", [ ("A1.2","A1.2"), ("A1","A1"), ("B3","B3") ] )
+
+    # test word boundaries
+    do_test( "XA1 A1X A12 1A1", [] )
+    do_test( "(A1.2)", [ ("A1.2","A1.2"), ("A1","A1") ] )
+    do_test( "A1.2345", [ ("A1","A1") ] )
+
+    # test ranges
+    do_test( "A1.23-.45", [ ("A1.23-.45","A1.23"), ("A1","A1") ] )
+    do_test( "A1.2-.5x", [ ("A1.2","A1.2"), ("A1","A1") ] )
+    do_test( "A1.2-.", [ ("A1.2","A1.2"), ("A1","A1") ] )
+
+    # test ruleid's with underscores
+    do_test( "KGS CG1", [ ("KGS CG1","KGS_CG1") ] )
+    do_test( "KGS_CG1", [] )
+
+# ---------------------------------------------------------------------
+
+def test_tag_ruleid_scope( monkeypatch ):
+    """Test figuring out which ruleid's to look for when tagging content."""
+
+    # initialize
+    matchers = {
+        "asl-rulebook": RuleidMatcher( [ "A1", "A2" ] ),
+        "module": RuleidMatcher( [ "M1" ] ),
+        None: RuleidMatcher( [ "A1", "A2", "M1" ] ),
+    }
+    monkeypatch.setattr( content, "_tag_ruleid_matchers", matchers )
+    monkeypatch.setattr( content, "_tag_ruleid_scopes", {} )
+
+    #pylint: disable=protected-access
+    # check a known content set (we should also look for the core ruleid's)
+    scope = content._get_tag_ruleid_scope( "module" )
+    assert scope[0] == [ matchers["asl-rulebook"], matchers["module"] ]
+    assert content._get_tag_ruleid_scope( "module" ) is scope
+
+    # check an unknown content set (we should look for every ruleid)
+    scope = content._get_tag_ruleid_scope( "unknown" )
+    assert scope[0] == [ matchers[None] ]
+    assert content._tag_ruleid_scopes[ "unknown" ] is scope
+    assert content._get_tag_ruleid_scope( "unknown" ) is scope
+    assert content._get_tag_ruleid_scope( None )[1] == scope[1]
+    #pylint: enable=protected-access
+
+# ---------------------------------------------------------------------
+
+def test_tag_ruleids_batch( monkeypatch, tmp_path ):
+    """Test tagging multiple pieces of content at once."""
+
+    # initialize
+    matchers = {
+        "asl-rulebook": RuleidMatcher( [ "A1", "A2" ] ),
+        "module": RuleidMatcher( [ "M1" ] ),
+        None: RuleidMatcher( [ "A1", "A2", "M1" ] ),
+    }
+    monkeypatch.setattr( content, "_tag_ruleid_matchers", matchers )
+    monkeypatch.setattr( content, "_tag_ruleid_scopes", {} )
+    monkeypatch.setattr( content, "_tag_cache", None )
+    items = [
+        ( "See A1 and M1.", None ),
+        ( "See A1 and M1.", "module" ),
+        ( "See A1 and M1.", "asl-rulebook" ),
+        ( "RB CG1 and A2.", "unknown" ),
+        ( "No ruleid's here.", None ),
+        ( "Yes.", "module" ),
+        ( "", None ),
+        ( None, "module" ),
+        ( "See A1 and M1.", None ), # nb: the same content again
+    ]
+
+    # tag the content (we should get the same results as tagging each item individually)
+    expected = [ content.tag_ruleids( *item ) for item in items ]
+    assert content.tag_ruleids_batch( items ) == expected
+    assert expected[0] == "See <span data-ruleid='A1' class='auto-ruleid'>A1</span>" \
+        " and <span data-ruleid='M1' class='auto-ruleid'>M1</span>."
+    assert "data-ruleid='M1' class='auto-ruleid' data-csetid='module'" in expected[1]
+    assert "data-ruleid='M1'" not in expected[2] # nb: M1 is not in the core content set
+    assert expected[4:] == [ "No ruleid's here.", "Yes.", "", None, expected[0] ]
+    assert content.tag_ruleids_batch( [] ) == []
+
+    # tag the content again, using the tag cache
+    tag_cache = TagCache( str( tmp_path / "tag-cache.db" ), 100, logging.getLogger( "test" ) )
+    monkeypatch.setattr( content, "_tag_cache", tag_cache )
+    try:
+        assert content.tag_ruleids_batch( items ) == expected
+        assert tag_cache.nhits == 0 and tag_cache.nmisses == 5 # nb: content without digits isn't looked up
+        # everything should now come from the cache
+        assert content.tag_ruleids_batch( items ) == expected
+        assert tag_cache.nhits == 5 and tag_cache.nmisses == 5
+        assert [ content.tag_ruleids( *item ) for item in items ] == expected
+        assert tag_cache.nhits == 10 and tag_cache.nmisses == 5
+    finally:
+        tag_cache.close()
+
+# ---------------------------------------------------------------------
+
+def _find_with_regexes( content, ruleids ):
+    """Find ruleid's using a regex for each one."""
+    matches = []
+    for ruleid in ruleids:
+        regex = re.compile( r"\b{}(-\.\d+)?\b".format( ruleid.replace( ".", "\\." ).replace( "_", " " ) ) )
+        matches.extend( ( mo.start(), mo.end() ) for mo in regex.finditer( content ) )
+    matches.sort( key = lambda m: ( m[0], m[0]-m[1] ) )
+    return matches
@@ -1,9 +1,13 @@
 """ Test search. """
 
+import os
+import shutil
+import sqlite3
 import logging
 
 from selenium.webdriver.common.keys import Keys
 
+from asl_rulebook2.webapp import app, search as webapp_search
 from asl_rulebook2.webapp.search import load_search_config, _make_fts_query_string
 from asl_rulebook2.webapp.startup import StartupMsgs
 from asl_rulebook2.webapp.tests.utils import init_webapp, make_webapp_main_url, \
@@ -312,6 +316,81 @@ def test_make_fts_query_string():
 
 # ---------------------------------------------------------------------
 
+def test_cached_searchdb_file_hashes( tmp_path, monkeypatch ):
+    """Test checking the data files used to build a cached search database."""
+
+    # NOTE: We do this in-process, so that we can see which files are being hashed.
+
+    # initialize
+    #pylint: disable=protected-access
+    data_dir = str( tmp_path / "data" )
+    shutil.copytree( os.path.join( os.path.dirname(__file__), "fixtures/full" ), data_dir )
+    qa_fnames = [ os.path.join( data_dir, "q+a", "demo.json" ), os.path.join( data_dir, "q+a", "sources.json" ) ]
+    errata_fnames = [ os.path.join( data_dir, "errata", "demo.json" ) ]
+    cached_searchdb_fname = str( tmp_path / "cached-searchdb.db" )
+    monkeypatch.setitem( app.config, "CACHED_SEARCHDB", cached_searchdb_fname )
+    monkeypatch.setattr( webapp_search, "_searchdb_fname", str( tmp_path / "searchdb.db" ) )
+    monkeypatch.setattr( webapp_search, "_cached_searchdb_fname", None )
+    monkeypatch.setattr( webapp_search, "_fixup_tasks", None )
+    monkeypatch.setattr( webapp_search, "get_bundled_searchdb", lambda: None )
+    monkeypatch.setattr( webapp_search, "add_post_fixup_task", lambda ctype, func: None )
+
+    # keep track of which files are hashed
+    hashed = []
+    orig_hash_file = webapp_search.hash_file
+    def hash_file( fname ):
+        hashed.append( os.path.basename( os.path.dirname( fname ) ) + "/" + os.path.basename( fname ) )
+        return orig_hash_file( fname )
+    monkeypatch.setattr( webapp_search, "hash_file", hash_file )
+
+    def init_searchdb():
+        # initialize the search database, and return the cached search database, if it was used
+        del hashed[:]
+        webapp_search._init_searchdb( None,
+            None, qa_fnames, None, errata_fnames, None, None, None, None, None, None,
+            logging.getLogger( "test" )
+        )
+        hashed.sort()
+        return webapp_search._cached_searchdb_fname
+    def get_cached_file_hashes():
+        with sqlite3.connect( cached_searchdb_fname ) as conn:
+            return {
+                row[0]: row[1:]
+                for row in conn.execute( "SELECT fname, hash, size, mtime_ns FROM file_hash WHERE ftype='q+a'" )
+            }
+
+    # build the search database, and save it as the cached version
+    assert init_searchdb() is None
+    assert hashed == [ "errata/demo.json", "q+a/demo.json", "q+a/sources.json" ]
+    shutil.copyfile( webapp_search._searchdb_fname, cached_searchdb_fname )
+
+    # initialize again (the cached search database should be used, without having to hash any files)
+    assert init_searchdb() == cached_searchdb_fname
+    assert not hashed
+
+    # touch a file, without changing it (the cached search database should still be used)
+    fname = qa_fnames[0]
+    prev_file_hashes = get_cached_file_hashes()
+    st = os.stat( fname )
+    os.utime( fname, ns=( st.st_atime_ns, st.st_mtime_ns + 1000*1000*1000 ) )
+    assert init_searchdb() == cached_searchdb_fname
+    assert hashed == [ "q+a/demo.json" ]
+    # make sure that the new stat info was saved in the cached search database
+    file_hashes = get_cached_file_hashes()
+    assert file_hashes["demo.json"] == prev_file_hashes["demo.json"][:2] + ( st.st_mtime_ns + 1000*1000*1000, )
+    assert file_hashes["sources.json"] == prev_file_hashes["sources.json"]
+    # ...so the file doesn't need to be hashed again
+    assert init_searchdb() == cached_searchdb_fname
+    assert not hashed
+
+    # change a file (the cached search database should not be used)
+    with open( fname, "a", encoding="utf-8" ) as fp:
+        fp.write( "\n" )
+    assert init_searchdb() is None
+    assert hashed == [ "q+a/demo.json" ]
+
+# ---------------------------------------------------------------------
+
 def do_search( query_string ):
     """Do a search."""
 
@@ -1,5 +1,11 @@
 """ Test the startup process. """
 
+import urllib.request
+import json
+import threading
+import time
+
+from asl_rulebook2.webapp import app, startup
 from asl_rulebook2.webapp.tests.utils import init_webapp, find_children
 
 # ---------------------------------------------------------------------
@@ -45,3 +51,92 @@ def test_init_search( webapp, webdriver ):
     init_webapp( webapp, webdriver,
         expected_warnings = [ "Can't load user search synonyms." ]
     )
+
+# ---------------------------------------------------------------------
+
+def test_startup_status( webapp, webdriver ):
+    """Test reporting the startup status."""
+
+    # initialize
+    webapp.control_tests.set_data_dir( "full" )
+    init_webapp( webapp, webdriver )
+
+    # check the startup status
+    # NOTE: The test suite runs the startup tasks synchronously, so they should all have completed.
+    resp = json.load(
+        urllib.request.urlopen( webapp.url_for( "get_startup_status" ) )
+    )
+    assert resp["status"] == -1
+    tasks = { t["ctype"]: t for t in resp["tasks"] }
+    assert all( t["state"] == "completed" for t in tasks.values() )
+
+    # check the progress reported by the fixup tasks
+    task = tasks[ "fixup index searchable content" ]
+    assert task["ntotal"] > 0
+    assert task["ndone"] == task["ntotal"]
+    assert task["percent"] == 100
+    assert "eta" not in task
+
+# ---------------------------------------------------------------------
+
+def test_startup_task_scheduler( monkeypatch ):
+    """Test scheduling the startup tasks."""
+
+    # NOTE: We do this in-process, so that we can control which tasks are run.
+
+    # initialize
+    monkeypatch.setitem( app.config, "DISABLE_STARTUP_TASKS", None )
+    monkeypatch.setattr( startup, "_startup_status", startup.StartupStatusEnum.NOT_STARTED )
+    errors = []
+    monkeypatch.setattr( startup._logger, "error", #pylint: disable=protected-access
+        lambda msg, *args: errors.append( msg % args )
+    )
+    events, lock = [], threading.Lock()
+
+    def run_tasks( tasks, nthreads ):
+        # register the tasks, then run them
+        #pylint: disable=protected-access
+        monkeypatch.setitem( app.config, "STARTUP_TASKS_THREADS", nthreads )
+        monkeypatch.setattr( startup, "_startup_tasks", [] )
+        monkeypatch.setattr( startup, "_task_progress", {} )
+        del events[:]
+        del errors[:]
+        for ctype, priority, depends_on, delay in tasks:
+            startup._add_startup_task( ctype, make_task( ctype, delay ), priority=priority, depends_on=depends_on )
+        startup._do_startup_tasks( False )
+        assert startup._startup_status == startup.StartupStatusEnum.COMPLETED
+        return { ctype: progress["state"] for ctype, progress in startup._task_progress.items() }
+    def make_task( ctype, delay ):
+        def task():
+            with lock:
+                events.append( "start:" + ctype )
+            time.sleep( delay )
+            with lock:
+                events.append( "end:" + ctype )
+        return task
+
+    # check that tasks are started in priority order (and in the order they were registered, for the same priority)
+    states = run_tasks( [
+        ( "a", 0, None, 0 ), ( "b", 5, None, 0 ), ( "c", 0, None, 0 ), ( "d", 10, None, 0 ),
+    ], 1 )
+    assert [ e for e in events if e.startswith( "start:" ) ] == [ "start:d", "start:b", "start:a", "start:c" ]
+    assert states == { "a": "completed", "b": "completed", "c": "completed", "d": "completed" }
+
+    # check that tasks are not started until the tasks they depend on have finished
+    # NOTE: "b" has a higher priority, but can't start until "a" has finished, so "c" runs alongside "a".
+    # Dependencies on tasks that have not been registered are ignored.
+    run_tasks( [
+        ( "a", 0, None, 0.2 ), ( "b", 10, ["a"], 0 ), ( "c", 0, None, 0 ), ( "d", 0, ["b","unknown"], 0 ),
+    ], 2 )
+    assert events.index( "end:a" ) < events.index( "start:b" )
+    assert events.index( "end:b" ) < events.index( "start:d" )
+    assert events.index( "start:c" ) < events.index( "end:a" )
+    assert len( events ) == 8 and not errors
+
+    # check that tasks with circular dependencies are not run
+    states = run_tasks( [
+        ( "a", 0, ["b"], 0 ), ( "b", 0, ["a"], 0 ), ( "c", 0, None, 0 ),
+    ], 2 )
+    assert events == [ "start:c", "end:c" ]
+    assert states == { "a": "pending", "b": "pending", "c": "completed" }
+    assert errors == [ "Can't run startup tasks (circular dependencies?): a ; b" ]
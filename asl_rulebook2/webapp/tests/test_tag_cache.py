@@ -0,0 +1,58 @@
+""" Test the tag cache. """
+
+import logging
+
+from asl_rulebook2.webapp.tag_cache import TagCache
+
+# ---------------------------------------------------------------------
+
+def test_tag_cache( tmp_path ):
+    """Test the tag cache."""
+
+    # initialize
+    fname = str( tmp_path / "tag-cache.db" )
+    logger = logging.getLogger( "test" )
+    tag_cache = TagCache( fname, 10, logger )
+
+    # add some entries to the cache, and read them back
+    keys = [ TagCache.make_key( "Content {}.".format( i ), None, "fingerprint" ) for i in range(10) ]
+    tag_cache.put( keys[0], "Tagged 0." )
+    tag_cache.put_many( [ ( keys[i], "Tagged {}.".format( i ) ) for i in range(1,10) ] )
+    assert tag_cache.get( keys[0] ) == "Tagged 0."
+    assert tag_cache.get_many( keys[5:] + [ "unknown" ] ) == {
+        keys[i]: "Tagged {}.".format( i ) for i in range(5,10)
+    }
+    assert tag_cache.get( "unknown" ) is None
+    assert tag_cache.nhits == 6 and tag_cache.nmisses == 2
+
+    # make sure that the cache keys depend on the content, the content set, and the known ruleid's
+    key = TagCache.make_key( "Content 0.", None, "fingerprint" )
+    assert key == keys[0]
+    assert TagCache.make_key( "Content 0!", None, "fingerprint" ) != key
+    assert TagCache.make_key( "Content 0.", "cset", "fingerprint" ) != key
+    key2 = TagCache.make_key( "Content 0.", None, "new-fingerprint" )
+    assert key2 != key
+    assert tag_cache.get( key2 ) is None # nb: the ruleid's have changed, so the cached result can't be used
+
+    # add another entry (this should evict the least-recently used entries)
+    # NOTE: Entries 1-4 have not been used since they were added, so they are the oldest, and entries
+    # are evicted in blocks of 10% of the cache size (i.e. 2 entries).
+    tag_cache.put( key2, "Tagged again." )
+    assert tag_cache.get( key2 ) == "Tagged again."
+    for i in range(1,3):
+        assert tag_cache.get( keys[i] ) is None
+    assert tag_cache.get( keys[0] ) == "Tagged 0."
+    assert len( tag_cache.get_many( keys ) ) == 8
+
+    # close the cache, then re-open it (the entries should still be there)
+    tag_cache.close()
+    assert tag_cache.get( key2 ) is None # nb: the cache is closed
+    tag_cache.put( "closed", "Not saved." )
+    tag_cache = TagCache( fname, 10, logger )
+    try:
+        assert tag_cache.get( key2 ) == "Tagged again."
+        assert tag_cache.get( keys[0] ) == "Tagged 0."
+        assert tag_cache.get( keys[1] ) is None
+        assert tag_cache.get( "closed" ) is None
+    finally:
+        tag_cache.close()
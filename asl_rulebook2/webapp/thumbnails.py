@@ -0,0 +1,120 @@
+""" Generate smaller versions of images. """
+
+import os
+import shutil
+import atexit
+import hashlib
+import tempfile
+import threading
+import logging
+
+from asl_rulebook2.webapp import app
+
+_cache_dir = None
+_cache_lock = threading.Lock()
+
+_logger = logging.getLogger( "thumbnails" )
+
+# NOTE: Requested sizes are rounded up to a multiple of this, so that we don't end up
+# with lots of slightly different versions of each image.
+_SIZE_STEP = 50
+_MAX_SIZE = 2000
+
+_IMAGE_FORMATS = { ".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".gif": "GIF", ".webp": "WEBP" }
+
+# ---------------------------------------------------------------------
+
+def parse_thumbnail_size( size ):
+    """Parse a thumbnail size e.g. "200" (width), "x100" (height), "200x100" (bounding box).
+
+    Returns a ( width, height ) tuple (either of which may be None), or None if the size is invalid.
+    """
+    width, _, height = size.partition( "x" )
+    try:
+        width = _round_size( width )
+        height = _round_size( height )
+    except ValueError:
+        return None
+    if not width and not height:
+        return None
+    return width, height
+
+def _round_size( val ):
+    """Round a requested size up to the next step."""
+    if not val:
+        return None
+    val = int( val )
+    if val <= 0:
+        raise ValueError( "Invalid size: {}".format( val ) )
+    return min( ( val + _SIZE_STEP - 1 ) // _SIZE_STEP * _SIZE_STEP, _MAX_SIZE )
+
+# ---------------------------------------------------------------------
+
+def get_thumbnail( fname, width, height ):
+    """Get a smaller version of an image (that fits within the specified width and/or height).
+
+    Returns the name of a file containing the thumbnail, or the original file if it's already small enough,
+    or if it can't be resized.
+    """
+
+    # check if the image can be resized
+    img_format = _IMAGE_FORMATS.get( os.path.splitext( fname )[1].lower() )
+    if not img_format:
+        return fname
+
+    # check if we've already generated the thumbnail
+    # NOTE: The key includes the image file's mtime and size, so if it changes, we will generate a new thumbnail.
+    # Old thumbnails are left behind, but this should be rare, and they're small.
+    st = os.stat( fname )
+    key = "{}|{}|{}|{}x{}".format( os.path.abspath(fname), st.st_mtime_ns, st.st_size, width, height )
+    cache_dir = _get_cache_dir()
+    thumbnail_fname = os.path.join( cache_dir,
+        hashlib.md5( key.encode( "utf-8" ) ).hexdigest() + os.path.splitext( fname )[1].lower()
+    )
+    if os.path.isfile( thumbnail_fname ):
+        return thumbnail_fname
+
+    # generate the thumbnail
+    try:
+        from PIL import Image
+    except ImportError:
+        _logger.debug( "Can't generate thumbnails (Pillow is not installed)." )
+        return fname
+    temp_fname = None
+    try:
+        with Image.open( fname ) as img:
+            # NOTE: We don't resize animated images, or images that are already small enough.
+            if getattr( img, "is_animated", False ):
+                return fname
+            if ( not width or img.width <= width ) and ( not height or img.height <= height ):
+                return fname
+            img.thumbnail( ( width or img.width, height or img.height ), Image.LANCZOS )
+            # NOTE: Other requests may be generating the same thumbnail, so we write it to a temp file,
+            # then move it into place.
+            with tempfile.NamedTemporaryFile( dir=cache_dir, suffix=".tmp", delete=False ) as fp:
+                temp_fname = fp.name
+                img.save( fp, format=img_format )
+        os.replace( temp_fname, thumbnail_fname )
+    except ( OSError, ValueError, Image.DecompressionBombError ) as ex:
+        _logger.warning( "Can't generate thumbnail for %s: %s", fname, ex )
+        if temp_fname and os.path.isfile( temp_fname ):
+            os.unlink( temp_fname )
+        return fname
+    _logger.debug( "Generated thumbnail (%dx%d): %s => %s", img.width, img.height, fname, thumbnail_fname )
+    return thumbnail_fname
+
+def _get_cache_dir():
+    """Get the directory where thumbnails are stored."""
+    global _cache_dir
+    with _cache_lock:
+        if _cache_dir is None:
+            # NOTE: If a cache directory hasn't been configured, we use a temp directory, which means
+            # that thumbnails will be re-generated each time the program is started.
+            cache_dir = app.config.get( "THUMBNAILS_CACHE" )
+            if cache_dir:
+                os.makedirs( cache_dir, exist_ok=True )
+            else:
+                cache_dir = tempfile.mkdtemp( prefix="asl-rulebook2-thumbnails-" )
+                atexit.register( shutil.rmtree, cache_dir, ignore_errors=True )
+            _cache_dir = cache_dir
+        return _cache_dir
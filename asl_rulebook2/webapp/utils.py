@@ -5,10 +5,23 @@ import shutil
 import pathlib
 import re
 import json
+import hashlib
 import traceback
+import concurrent.futures
+
+try:
+    import orjson
+except ImportError:
+    orjson = None # nb: this is optional
 
 from asl_rulebook2.webapp import app, CONFIG_DIR
 
+# these are the settings for caches that might have been configured inside the data directory
+_CACHE_CONFIG_KEYS = [
+    "CACHED_SEARCHDB", "TAG_RULEIDS_CACHE", "PACKED_DATA_CACHE", "CONTENT_MANIFEST_CACHE", "THUMBNAILS_CACHE",
+    "DATA_BUNDLE"
+]
+
 # ---------------------------------------------------------------------
 
 def make_data_path( path ):
@@ -31,8 +44,14 @@ def load_data_file( fname, caption, ftype, logger, on_error ):
             with open( fname, "r", encoding="utf-8" ) as fp:
                 data = fp.read()
         elif ftype == "json":
-            with open( fname, "r", encoding="utf-8" ) as fp:
-                data = json.load( fp )
+            if orjson and not app.config.get( "DISABLE_FAST_JSON_PARSER" ):
+                # NOTE: orjson is a lot faster than the standard library, which makes a difference
+                # when loading large data files.
+                with open( fname, mode="rb" ) as fp:
+                    data = orjson.loads( fp.read() ) #pylint: disable=no-member
+            else:
+                with open( fname, "r", encoding="utf-8" ) as fp:
+                    data = json.load( fp )
         elif ftype == "binary":
             with open( fname, mode="rb" ) as fp:
                 data = fp.read()
@@ -45,6 +64,64 @@ def load_data_file( fname, caption, ftype, logger, on_error ):
         return None
     return data
 
+def load_data_files( fnames, caption, ftype, logger, on_error ):
+    """Load multiple data files.
+
+    The data is returned in the same order as the files (with None for files that couldn't be loaded).
+    """
+    # NOTE: We load the files in parallel, so that we're not waiting for each one to be read in turn.
+    fnames = list( fnames )
+    max_workers = min( len(fnames), parse_int( app.config.get( "DATA_FILE_THREADS" ), 4 ) )
+    if max_workers <= 1:
+        return [ load_data_file( fname, caption, ftype, logger, on_error ) for fname in fnames ]
+    with concurrent.futures.ThreadPoolExecutor( max_workers=max_workers ) as executor:
+        return list( executor.map(
+            lambda fname: load_data_file( fname, caption, ftype, logger, on_error ),
+            fnames
+        ) )
+
+def walk_data_dir( data_dir, skip_paths ):
+    """Find the files in a data directory.
+
+    Hidden and temp files are ignored, as are the specified paths (see get_cache_paths()).
+    """
+    def is_skipped( path ):
+        return any(
+            path == p or path.startswith( p + os.sep ) or path.startswith( p + "-" ) # nb: SQLite journals, etc.
+            for p in skip_paths
+        )
+    for root, dnames, fnames in os.walk( data_dir, followlinks=True ):
+        real_root = os.path.realpath( root )
+        dnames[:] = [ d for d in dnames if not is_skipped( os.path.join( real_root, d ) ) ]
+        for fname in fnames:
+            if fname.startswith( "." ) or os.path.splitext( fname )[1] in (".swp", ".tmp"):
+                continue
+            if is_skipped( os.path.join( real_root, fname ) ):
+                continue
+            yield os.path.join( root, fname )
+
+def get_cache_paths():
+    """Get the paths of the configured caches."""
+    # NOTE: These might have been configured inside the data directory, but they are not data files
+    # (and get updated while the program is running), so anything that scans the data directory should skip them.
+    paths = []
+    for key in _CACHE_CONFIG_KEYS:
+        path = app.config.get( key )
+        if path:
+            paths.append( os.path.realpath( path ) )
+    return paths
+
+def hash_file( fname ):
+    """Generate the hash for a file."""
+    hashval = hashlib.md5()
+    with open( fname, "rb" ) as fp:
+        while True:
+            buf = fp.read( 1024*1024 )
+            if not buf:
+                break
+            hashval.update( buf )
+    return hashval.hexdigest()
+
 # ---------------------------------------------------------------------
 
 def change_extn( fname, extn ):
@@ -35,12 +35,16 @@ setup(
     install_requires = parse_requirements( "requirements.txt" ),
     extras_require = {
         "dev": parse_requirements( "requirements-dev.txt" ),
+        "fast-json": [ "orjson" ],
     },
     include_package_data = True,
     data_files = [
         ( "asl-rulebook2", ["LICENSE.txt"] ),
     ],
     entry_points = {
-        "console_scripts": "asl-rulebook2 = asl_rulebook2.webapp.run_server:main",
+        "console_scripts": [
+            "asl-rulebook2 = asl_rulebook2.webapp.run_server:main",
+            "asl-rulebook2-bake = asl_rulebook2.webapp.bake:main",
+        ],
     }
 )